@@ -0,0 +1,304 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from mock import patch
+import numpy as np
+import pandas
+
+# mt5_lib uses the simulated broker instead of the MetaTrader5 package, so the suite runs on any
+# platform. Must be set before mt5_lib is imported
+os.environ.setdefault("BBSTRADER_SIMULATED_BROKER", "1")
+sys.path.append("src")
+from candle_store import to_candle_records
+import ema_cross_strategy
+import helper_functions
+import indicator_lib
+from screener import Screener
+from tick_stream import DEFAULT_TICK_BATCH, TickBarBuilder
+
+# Default sizes. 10M rows needs a few GB of memory, pass --rows to stay smaller
+ROW_COUNTS = [10, 1_000, 100_000, 1_000_000, 10_000_000]
+SYMBOL_COUNTS = [1, 10, 100, 500]
+SHORT_TERM_EMA_LENGTH = 50
+LONG_TERM_EMA_LENGTH = 200
+CYCLE_SHORT_TERM_EMA_LENGTH = 1
+CYCLE_LONG_TERM_EMA_LENGTH = 2
+# Candles each symbol holds during the strategy cycle benchmark
+CYCLE_HISTORY = 1_000
+# A result this much slower than the baseline counts as a regression in --compare
+DEFAULT_THRESHOLD = 1.10
+
+def make_candles(num_candles, seed=0):
+    """
+    Builds a synthetic random walk candle table
+    :param num_candles: integer number of candles
+    :param seed: integer random seed
+    :return: dataframe with time, open, high, low and close columns
+    """
+    rng = np.random.default_rng(seed)
+    close = 400 + np.cumsum(rng.normal(0, 0.5, num_candles))
+    open_price = np.concatenate(([400.0], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.25, num_candles))
+    return pandas.DataFrame({
+        'time': np.arange(num_candles, dtype=np.int64) * 60,
+        'open': open_price,
+        'high': np.maximum(open_price, close) + spread,
+        'low': np.minimum(open_price, close) - spread,
+        'close': close
+    })
+
+def time_runs(function, repeat, setup=None):
+    """
+    Times `function` `repeat` times
+    :param function: callable taking the value returned by `setup`, or nothing
+    :param repeat: integer number of runs
+    :param setup: optional callable run untimed before every run
+    :return: list of run times in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        function(argument) if setup else function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def make_result(name, params, timings):
+    """
+    :return: dict of the timing summary of one benchmark
+    """
+    return {
+        "name": name,
+        "params": params,
+        "repeat": len(timings),
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.mean(timings)
+    }
+
+def bench_indicators(num_candles, repeat):
+    """
+    Times calc_ema, ema_cross_calc, det_trade and calc_lot_sizes on `num_candles` candles
+    :return: list of result dicts
+    """
+    candles = make_candles(num_candles)
+    params = {"rows": num_candles, "short": SHORT_TERM_EMA_LENGTH, "long": LONG_TERM_EMA_LENGTH}
+    results = []
+
+    timings = time_runs(lambda: indicator_lib.calc_ema(candles, LONG_TERM_EMA_LENGTH), repeat)
+    results.append(make_result("calc_ema", params, timings))
+
+    indicator_lib.calc_ema(candles, SHORT_TERM_EMA_LENGTH)
+    indicator_lib.calc_ema(candles, LONG_TERM_EMA_LENGTH)
+    # ema_cross_calc drops the warm-up rows in place, so every run gets a fresh copy
+    timings = time_runs(
+        lambda table: indicator_lib.ema_cross_calc(table, SHORT_TERM_EMA_LENGTH, LONG_TERM_EMA_LENGTH),
+        repeat,
+        setup=lambda: candles.copy()
+    )
+    results.append(make_result("ema_cross_calc", params, timings))
+
+    ema_cross_table = candles.copy()
+    indicator_lib.ema_cross_calc(ema_cross_table, SHORT_TERM_EMA_LENGTH, LONG_TERM_EMA_LENGTH)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        timings = time_runs(
+            lambda table: ema_cross_strategy.det_trade(table, SHORT_TERM_EMA_LENGTH, LONG_TERM_EMA_LENGTH),
+            repeat,
+            setup=lambda: ema_cross_table.copy()
+        )
+    results.append(make_result("det_trade", params, timings))
+
+    # Size a trade on every candle, as the backtester and parameter sweep do
+    spec_table = helper_functions.get_legacy_spec_table(["BCHUSD"])
+    stop_loss = candles['low'].to_numpy()
+    stop_price = candles['high'].to_numpy()
+    timings = time_runs(lambda: helper_functions.calc_lot_sizes(10000, 0.03, stop_loss, stop_price, spec_table), repeat)
+    results.append(make_result("calc_lot_sizes", {"rows": num_candles}, timings))
+
+    return results
+
+def bench_lot_size(num_symbols, repeat):
+    """
+    Times one calc_lot_size call per symbol, as done once per cycle
+    :return: result dict
+    """
+    symbols = [f"SYM{index}" for index in range(num_symbols)]
+    spec = {"volume_min": 0.01, "volume_max": 100.0, "volume_step": 0.01}
+
+    def run():
+        for symbol in symbols:
+            helper_functions.calc_lot_size(10000, 0.03, 399.5, 400.25, symbol, spec)
+
+    return make_result("calc_lot_size", {"symbols": num_symbols}, time_runs(run, repeat))
+
+class MockMarket:
+    """
+    Stands in for the mt5_lib candle feed. Every symbol holds its own synthetic candles and
+    `advance` closes one more candle on all of them
+    """
+
+    def __init__(self, num_symbols):
+        self.symbols = [f"SYM{index}" for index in range(num_symbols)]
+        self.candles = {symbol: to_candle_records(make_candles(CYCLE_HISTORY, seed=index)) for index, symbol in enumerate(self.symbols)}
+        self.position = CYCLE_HISTORY // 2
+
+    def advance(self):
+        self.position = self.position + 1 if self.position < CYCLE_HISTORY else CYCLE_HISTORY // 2
+
+    def get_candle_records(self, symbol, timeframe, num_candlesticks):
+        return self.candles[symbol][max(0, self.position - num_candlesticks):self.position]
+
+def bench_strategy_cycle(num_symbols, repeat):
+    """
+    Times one full ema_cross_strategy cycle over `num_symbols` symbols against a mocked mt5_lib:
+    cold (reseeding every symbol's EMA state from history) and warm (one new candle per symbol)
+    :return: list of result dicts
+    """
+    market = MockMarket(num_symbols)
+    params = {"symbols": num_symbols, "short": CYCLE_SHORT_TERM_EMA_LENGTH, "long": CYCLE_LONG_TERM_EMA_LENGTH}
+
+    def run(_=None):
+        for symbol in market.symbols:
+            ema_cross_strategy.ema_cross_strategy(symbol, "one_minute", CYCLE_SHORT_TERM_EMA_LENGTH, CYCLE_LONG_TERM_EMA_LENGTH, 10000, 0.03)
+
+    def cold_setup():
+        ema_cross_strategy.indicator_states.clear()
+        market.advance()
+
+    with patch('ema_cross_strategy.mt5_lib.get_candle_records', side_effect=market.get_candle_records), \
+            patch('ema_cross_strategy.mt5_lib.cancel_filtered_orders', return_value=True), \
+            patch('make_trade.trader.get_symbol_spec', return_value=None), \
+            patch('make_trade.trader.place_order', return_value=1), \
+            open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        cold = time_runs(run, repeat, cold_setup)
+        warm = time_runs(run, repeat, market.advance)
+        ema_cross_strategy.indicator_states.clear()
+        ema_cross_strategy.candle_buffers.clear()
+
+    return [make_result("strategy_cycle_cold", params, cold), make_result("strategy_cycle_warm", params, warm)]
+
+def get_metadata():
+    """
+    :return: dict describing the commit and environment the results were taken on
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pandas.__version__,
+        "platform": platform.platform()
+    }
+
+def get_key(result):
+    """
+    :return: hashable key identifying a benchmark across result files
+    """
+    return (result["name"], tuple(sorted(result["params"].items())))
+
+def compare(baseline, current, threshold):
+    """
+    Prints the median time ratio of every benchmark present in both result files
+    :param baseline: dict loaded from a baseline results file
+    :param current: dict loaded from a newer results file
+    :param threshold: float ratio above which a benchmark counts as a regression
+    :return: list of regressed benchmark keys
+    """
+    baseline_results = {get_key(result): result for result in baseline["results"]}
+    regressions = []
+    print(f"{'benchmark':<60} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for result in current["results"]:
+        key = get_key(result)
+        if key not in baseline_results:
+            continue
+        base_time = baseline_results[key]["median_s"]
+        ratio = result["median_s"] / base_time if base_time > 0 else float("inf")
+        label = result["name"] + " " + " ".join(f"{name}={value}" for name, value in key[1])
+        flag = " REGRESSION" if ratio > threshold else ""
+        print(f"{label:<60} {base_time * 1000:>10.3f}ms {result['median_s'] * 1000:>10.3f}ms {ratio:>7.2f}x{flag}")
+        if ratio > threshold:
+            regressions.append(key)
+    return regressions
+
+def bench_screener_cycle(num_symbols, repeat):
+    """
+    Times one screener pass over `num_symbols` symbols against a mocked mt5_lib, one new candle per symbol
+    :return: result dict
+    """
+    market = MockMarket(num_symbols)
+    screener = Screener(CYCLE_SHORT_TERM_EMA_LENGTH, CYCLE_LONG_TERM_EMA_LENGTH)
+    params = {"symbols": num_symbols, "short": CYCLE_SHORT_TERM_EMA_LENGTH, "long": CYCLE_LONG_TERM_EMA_LENGTH}
+
+    def run(_=None):
+        screener.screen(market.symbols, "one_minute")
+
+    with patch('screener.mt5_lib.get_candle_records', side_effect=market.get_candle_records), \
+            open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        timings = time_runs(run, repeat, market.advance)
+
+    return make_result("screener_cycle", params, timings)
+
+def bench_tick_bars(num_ticks, repeat):
+    """
+    Times folding `num_ticks` ticks, about 20 per second, into one minute bars in batches of DEFAULT_TICK_BATCH
+    :return: result dict
+    """
+    rng = np.random.default_rng(0)
+    tick_times = np.cumsum(rng.integers(0, 100, num_ticks)) // 1000
+    prices = 400 + np.cumsum(rng.normal(0, 0.01, num_ticks))
+    params = {"ticks": num_ticks, "batch": DEFAULT_TICK_BATCH}
+
+    def run(_=None):
+        builder = TickBarBuilder("one_minute")
+        for start in range(0, num_ticks, DEFAULT_TICK_BATCH):
+            builder.add_ticks(tick_times[start:start + DEFAULT_TICK_BATCH], prices[start:start + DEFAULT_TICK_BATCH])
+
+    return make_result("tick_bars", params, time_runs(run, repeat))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the indicator, signal and strategy cycle hot paths")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROW_COUNTS, help="candle counts for the indicator benchmarks")
+    parser.add_argument("--symbols", type=int, nargs="+", default=SYMBOL_COUNTS, help="symbol counts for the lot size and cycle benchmarks")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark_results.json", help="file the results are written to")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="median time ratio counted as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf8") as file:
+            baseline = json.load(file)
+        with open(args.compare[1], encoding="utf8") as file:
+            current = json.load(file)
+        regressions = compare(baseline, current, args.threshold)
+        print(f"{len(regressions)} regression(s) above {args.threshold:.2f}x")
+        sys.exit(1 if regressions else 0)
+
+    results = []
+    for num_candles in args.rows:
+        for result in bench_indicators(num_candles, args.repeat) + [bench_tick_bars(num_candles, args.repeat)]:
+            print(f"{result['name']} rows={num_candles}: {result['median_s'] * 1000:.3f} ms")
+            results.append(result)
+    for num_symbols in args.symbols:
+        for result in [bench_lot_size(num_symbols, args.repeat)] + bench_strategy_cycle(num_symbols, args.repeat) + [bench_screener_cycle(num_symbols, args.repeat)]:
+            print(f"{result['name']} symbols={num_symbols}: {result['median_s'] * 1000:.3f} ms")
+            results.append(result)
+
+    with open(args.output, "w", encoding="utf8") as file:
+        json.dump({"metadata": get_metadata(), "results": results}, file, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
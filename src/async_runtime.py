@@ -0,0 +1,248 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
+import functools
+import threading
+
+import mt5_lib
+
+# Seconds a single MetaTrader 5 call may take before it counts as hung
+DEFAULT_CALL_TIMEOUT = 10.0
+
+# Seconds every symbol of a cycle has to produce its intents
+DEFAULT_CYCLE_TIMEOUT = 30.0
+
+DEFAULT_COMPUTE_POOL_SIZE = 8
+
+class TerminalTimeoutError(Exception):
+    """
+    Raised when a MetaTrader 5 call doesn't return in time, or while an earlier call is still hung
+    """
+
+class MT5Executor:
+    """
+    Runs every MetaTrader 5 call on one dedicated thread, as the terminal connection isn't thread-safe.
+    A call that times out is left to finish on that thread. Until it does, new calls fail right away
+    instead of queueing up behind it
+    """
+
+    def __init__(self, timeout=DEFAULT_CALL_TIMEOUT):
+        """
+        :param timeout: seconds a call may take
+        """
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mt5")
+        self.lock = threading.Lock()
+        # Future of the call that timed out and hasn't returned yet
+        self.hung_call = None
+        self.thread_id = self.executor.submit(threading.get_ident).result()
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Queues `function` on the MetaTrader 5 thread
+        :return: concurrent.futures.Future of the call
+        """
+        with self.lock:
+            if self.hung_call is not None and not self.hung_call.done():
+                raise TerminalTimeoutError(f"MetaTrader 5 is still busy with a call that timed out. {function.__name__} not sent")
+            return self.executor.submit(function, *args, **kwargs)
+
+    def mark_hung(self, future, function, timeout):
+        """
+        Records `future` as hung
+        :return: TerminalTimeoutError to raise
+        """
+        with self.lock:
+            self.hung_call = future
+        return TerminalTimeoutError(f"{function.__name__} did not return within {timeout} seconds")
+
+    def call(self, function, *args, **kwargs):
+        """
+        Runs `function` on the MetaTrader 5 thread and blocks the calling thread until it returns or times out.
+        Calls made from the MetaTrader 5 thread itself run directly
+        :return: the return value of `function`
+        """
+        if threading.get_ident() == self.thread_id:
+            return function(*args, **kwargs)
+
+        future = self.submit(function, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            raise self.mark_hung(future, function, self.timeout) from None
+
+    async def call_async(self, function, *args, timeout=None, **kwargs):
+        """
+        Runs `function` on the MetaTrader 5 thread without blocking the event loop
+        :param timeout: seconds the call may take. Defaults to the executor timeout
+        :return: the return value of `function`
+        """
+        timeout = timeout or self.timeout
+        future = self.submit(function, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            raise self.mark_hung(future, function, timeout) from None
+
+    def shutdown(self):
+        """
+        Stops the MetaTrader 5 thread once its current call returns
+        """
+        self.executor.shutdown(wait=False)
+
+class TerminalProxy:
+    """
+    Stands in for the MetaTrader5 module in mt5_lib. Constants are passed through and every
+    function call, from any thread, runs on the MT5Executor thread
+    """
+
+    def __init__(self, terminal, mt5_executor):
+        """
+        :param terminal: the MetaTrader5 module
+        :param mt5_executor: MT5Executor the calls run on
+        """
+        self.terminal = terminal
+        self.mt5_executor = mt5_executor
+
+    def __getattr__(self, name):
+        value = getattr(self.terminal, name)
+        if not callable(value) or isinstance(value, type):
+            return value
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            return self.mt5_executor.call(value, *args, **kwargs)
+        return call
+
+class AsyncRuntime:
+    """
+    Runs the bot as coroutines on an asyncio event loop. Blocking MetaTrader 5 calls go through one
+    MT5Executor thread, strategy computation runs on a compute pool, so the computation of one symbol
+    overlaps with the MetaTrader 5 calls of another and a hung terminal call only fails the symbols
+    waiting on it
+    """
+
+    def __init__(self, compute_pool_size=DEFAULT_COMPUTE_POOL_SIZE, call_timeout=DEFAULT_CALL_TIMEOUT, cycle_timeout=DEFAULT_CYCLE_TIMEOUT):
+        """
+        :param compute_pool_size: integer number of symbols computed at once
+        :param call_timeout: seconds a single MetaTrader 5 call may take
+        :param cycle_timeout: seconds every symbol of a cycle has to produce its intents
+        """
+        self.mt5_executor = MT5Executor(call_timeout)
+        self.compute_pool = ThreadPoolExecutor(max_workers=compute_pool_size, thread_name_prefix="compute")
+        self.cycle_timeout = cycle_timeout
+        self.previous_terminal = None
+        # Compute task of every symbol that overran its cycle and is still running on the compute pool
+        self.overrunning = {}
+
+    def start(self):
+        """
+        Routes every mt5_lib call through the MetaTrader 5 thread
+        """
+        self.previous_terminal = mt5_lib.set_terminal(TerminalProxy(mt5_lib.mt5, self.mt5_executor))
+
+    def stop(self):
+        """
+        Restores direct mt5_lib calls and stops the worker threads
+        """
+        if self.previous_terminal is not None:
+            mt5_lib.set_terminal(self.previous_terminal)
+            self.previous_terminal = None
+        self.compute_pool.shutdown(wait=False)
+        self.mt5_executor.shutdown()
+
+    async def compute(self, function, *args):
+        """
+        Runs `function` on the compute pool
+        :return: the return value of `function`
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.compute_pool, functools.partial(function, *args))
+
+    async def run_cycle(self, get_symbol_intents, symbols, timeframe):
+        """
+        Collects the intents of every symbol concurrently and sends them as one batch. A symbol that doesn't
+        finish in time is left to finish on its compute thread, as a thread can't be stopped, and its intents
+        are dropped. It is skipped until then, so two computations never update the state of one symbol at once
+        :param get_symbol_intents: function of (symbol, timeframe) returning its mt5_lib.process_order_batch intents
+        :param symbols: list of symbols
+        :param timeframe: string of the timeframe
+        :return: dict of symbol to its order outcome, or the exception the symbol raised
+        """
+        results = {symbol: False for symbol in symbols}
+        tasks = {}
+        for symbol in symbols:
+            overrunning = self.overrunning.get(symbol)
+            if overrunning is not None and not overrunning.done():
+                results[symbol] = TerminalTimeoutError(f"{symbol} is still computing an earlier cycle")
+                continue
+            self.overrunning.pop(symbol, None)
+            tasks[symbol] = asyncio.ensure_future(self.compute(get_symbol_intents, symbol, timeframe))
+        if not tasks:
+            return results
+
+        done, pending = await asyncio.wait(list(tasks.values()), timeout=self.cycle_timeout)
+
+        intents = []
+        for symbol, task in tasks.items():
+            if task in pending:
+                # Not cancelled, so the symbol stays busy until its thread returns. Its outcome is dropped
+                task.add_done_callback(lambda finished: finished.cancelled() or finished.exception())
+                self.overrunning[symbol] = task
+                results[symbol] = TerminalTimeoutError(f"{symbol} did not finish within {self.cycle_timeout} seconds")
+            elif task.exception() is not None:
+                results[symbol] = task.exception()
+            else:
+                intents.extend(task.result())
+
+        if not intents:
+            return results
+
+        try:
+            order_results = await self.mt5_executor.call_async(mt5_lib.process_order_batch, intents, timeout=self.cycle_timeout)
+        except Exception as e:
+            for intent in intents:
+                results[intent["symbol"]] = e
+            return results
+
+        for order_result in order_results:
+            intent = order_result["intent"]
+            if intent["action"] != "place":
+                continue
+            if order_result["success"]:
+                results[intent["symbol"]] = order_result["orders"][0]
+            else:
+                results[intent["symbol"]] = Exception(f"Order Code: {order_result['retcode']}. {order_result['comment']}")
+
+        return results
+
+    async def run_forever(self, get_symbol_intents, scheduler, get_closed_bars, on_results, symbols, timeframe, on_heartbeat=None):
+        """
+        Runs one cycle on every symbol right away, then one cycle per bar close
+        :param get_symbol_intents: function of (symbol, timeframe) returning its intents
+        :param scheduler: scheduler.CandleScheduler telling when the next bar closes
+        :param get_closed_bars: function of (bar close time, timeframes) returning the (timeframe, symbols) that closed
+        :param on_results: function called with the results of every cycle, e.g. to log them
+        :param symbols: list of symbols of the first cycle
+        :param timeframe: string of the timeframe of the first cycle
+        :param on_heartbeat: function called after every bar close, whether or not a bar of a symbol closed
+        """
+        self.start()
+        try:
+            results = await self.run_cycle(get_symbol_intents, symbols, timeframe)
+            await self.compute(on_results, results)
+            if on_heartbeat:
+                await self.compute(on_heartbeat)
+
+            while True:
+                next_close, timeframes = scheduler.get_next_close()
+                await asyncio.sleep(max(0.0, next_close - scheduler.server_time()))
+
+                closed_bars = await self.compute(get_closed_bars, next_close, timeframes)
+                for closed_timeframe, closed_symbols in closed_bars:
+                    results = await self.run_cycle(get_symbol_intents, closed_symbols, closed_timeframe)
+                    await self.compute(on_results, results)
+                if on_heartbeat:
+                    await self.compute(on_heartbeat)
+        finally:
+            self.stop()
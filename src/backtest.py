@@ -0,0 +1,274 @@
+import argparse
+from collections import namedtuple
+
+import numpy as np
+import pandas
+
+import ema_cross_strategy as strats
+import helper_functions as hf
+from candle_store import CandleStore
+
+# Outcome of a backtest: equity curve dataframe, trade list dataframe and a dict of summary stats
+BacktestResult = namedtuple("BacktestResult", ["equity_curve", "trades", "stats"])
+
+# Number of bars every order is checked against at once when searching for a fill or an exit
+LOOKAHEAD_BARS = 8
+
+# Number of bars looked at first when a search runs past LOOKAHEAD_BARS. Doubles until a hit
+SEARCH_CHUNK_SIZE = 64
+
+def run_backtest(candles, symbol, short_term_ema_length, long_term_ema_length, balance, risk_pct, contract_size=1.0, spec_table=None):
+    """
+    Replays historical candles through the EMA Cross strategy
+    :param candles: structured array of candles (e.g. from CandleStore.read) or a dataframe of candles, oldest first
+    :param symbol: string of the symbol the candles belong to
+    :param short_term_ema_length: integer of the lowest timeframe length for EMA
+    :param long_term_ema_length: integer of the highest timeframe length for EMA
+    :param balance: Float. Trade balance used for lot sizing and as the starting equity
+    :param risk_pct: Float. Risk amount as a percentage
+    :param contract_size: Float. Units of the symbol per lot
+    :param spec_table: helper_functions.SPEC_TABLE_DTYPE row of `symbol` used for lot sizing. Defaults to the legacy pip model
+    :return: BacktestResult
+    """
+    ema_x_strategy_table = pandas.DataFrame(candles).reset_index(drop=True)
+
+    # Same indicator and signal logic as the live strategy
+    strats.calculate_indicators(ema_x_strategy_table, short_term_ema_length, long_term_ema_length)
+    strats.det_trade(ema_x_strategy_table, short_term_ema_length, long_term_ema_length)
+
+    return simulate_trades(ema_x_strategy_table, symbol, balance, risk_pct, contract_size, spec_table)
+
+def simulate_trades(ema_x_strategy_table, symbol, balance, risk_pct, contract_size=1.0, spec_table=None):
+    """
+    Simulates the pending orders the live strategy would place for every signal in a table
+    already run through det_trade. Every signal cancels the previous pending order. A BUY_STOP
+    fills once a bar's high reaches the stop price and a SELL_STOP once a bar's low reaches it.
+    Filled trades exit at the stop loss or take profit. When both are reached in the same bar
+    the stop loss is assumed to come first
+    :param ema_x_strategy_table: dataframe with candle, stop_loss, stop_price and take_profit columns
+    :param symbol: string of the symbol the candles belong to
+    :param balance: Float. Trade balance used for lot sizing and as the starting equity
+    :param risk_pct: Float. Risk amount as a percentage
+    :param contract_size: Float. Units of the symbol per lot
+    :param spec_table: helper_functions.SPEC_TABLE_DTYPE row of `symbol` used for lot sizing. Defaults to the legacy pip model
+    :return: BacktestResult
+    """
+    time = ema_x_strategy_table['time'].to_numpy()
+    open_price = ema_x_strategy_table['open'].to_numpy(dtype=np.float64)
+    high = ema_x_strategy_table['high'].to_numpy(dtype=np.float64)
+    low = ema_x_strategy_table['low'].to_numpy(dtype=np.float64)
+    close_price = ema_x_strategy_table['close'].to_numpy(dtype=np.float64)
+    stop_loss = ema_x_strategy_table['stop_loss'].to_numpy(dtype=np.float64)
+    stop_price = ema_x_strategy_table['stop_price'].to_numpy(dtype=np.float64)
+    take_profit = ema_x_strategy_table['take_profit'].to_numpy(dtype=np.float64)
+
+    num_bars = len(time)
+
+    # A zero stop price means no cross, a warm-up row or a cross of less than a penny
+    signal_index = np.flatnonzero(stop_price != 0.0)
+
+    # Same trade type rule as make_trade
+    is_buy = stop_price[signal_index] > stop_loss[signal_index]
+
+    # The broker rejects stops on the wrong side of the price
+    num_signals = len(signal_index)
+    valid = np.where(
+        is_buy,
+        (stop_loss[signal_index] < stop_price[signal_index]) & (take_profit[signal_index] > stop_price[signal_index]),
+        (stop_loss[signal_index] > stop_price[signal_index]) & (take_profit[signal_index] < stop_price[signal_index])
+    )
+
+    # A pending order lives from the bar after its signal until the bar of the next signal,
+    # which cancels it even when its own stops are rejected
+    expiry_index = np.append(signal_index[1:], num_bars - 1)[valid]
+
+    signal_index = signal_index[valid]
+    is_buy = is_buy[valid]
+
+    order_stop_loss = stop_loss[signal_index]
+    order_stop_price = stop_price[signal_index]
+    order_take_profit = take_profit[signal_index]
+
+    # Fill
+    fill_index = np.where(
+        is_buy,
+        find_first_indexes(high, signal_index + 1, expiry_index + 1, order_stop_price, True),
+        find_first_indexes(low, signal_index + 1, expiry_index + 1, order_stop_price, False)
+    )
+    filled = fill_index >= 0
+
+    signal_index, is_buy, fill_index = signal_index[filled], is_buy[filled], fill_index[filled]
+    order_stop_loss, order_stop_price, order_take_profit = order_stop_loss[filled], order_stop_price[filled], order_take_profit[filled]
+
+    # A bar that opens beyond the stop price fills at its open
+    entry_price = np.where(
+        is_buy,
+        np.maximum(open_price[fill_index], order_stop_price),
+        np.minimum(open_price[fill_index], order_stop_price)
+    )
+
+    # Exit
+    ends = np.full(len(fill_index), num_bars)
+    stop_index = np.where(
+        is_buy,
+        find_first_indexes(low, fill_index, ends, order_stop_loss, False),
+        find_first_indexes(high, fill_index, ends, order_stop_loss, True)
+    )
+    target_index = np.where(
+        is_buy,
+        find_first_indexes(high, fill_index, ends, order_take_profit, True),
+        find_first_indexes(low, fill_index, ends, order_take_profit, False)
+    )
+
+    stopped = (stop_index >= 0) & ((target_index < 0) | (stop_index <= target_index))
+    targeted = ~stopped & (target_index >= 0)
+    exit_index = np.where(stopped, stop_index, np.where(targeted, target_index, num_bars - 1))
+    exit_reason = np.where(stopped, "stop_loss", np.where(targeted, "take_profit", "open"))
+
+    # A bar that opens beyond the level exits at its open
+    exit_price = np.where(stopped, order_stop_loss, np.where(targeted, order_take_profit, close_price[-1] if num_bars else 0.0))
+    later_bar = exit_index > fill_index
+    exit_open = open_price[exit_index] if num_bars else exit_price
+    # BUY stop loss and SELL take profit gap down, SELL stop loss and BUY take profit gap up
+    gaps_down = (stopped & is_buy) | (targeted & ~is_buy)
+    gaps_up = (stopped & ~is_buy) | (targeted & is_buy)
+    exit_price = np.where(later_bar & gaps_down & (exit_open < exit_price), exit_open, exit_price)
+    exit_price = np.where(later_bar & gaps_up & (exit_open > exit_price), exit_open, exit_price)
+
+    if spec_table is None:
+        spec_table = hf.get_legacy_spec_table([symbol])
+    volume = hf.calc_lot_sizes(balance, risk_pct, order_stop_loss, order_stop_price, spec_table)
+    direction = np.where(is_buy, 1.0, -1.0)
+
+    trades = pandas.DataFrame({
+        "signal_time": time[signal_index],
+        "entry_time": time[fill_index],
+        "exit_time": time[exit_index],
+        "exit_index": exit_index,
+        "order_type": np.where(is_buy, "BUY_STOP", "SELL_STOP"),
+        "volume": volume,
+        "entry_price": entry_price,
+        "stop_loss": order_stop_loss,
+        "take_profit": order_take_profit,
+        "exit_price": exit_price,
+        "exit_reason": exit_reason,
+        "pnl": direction * (exit_price - entry_price) * volume * contract_size
+    })
+
+    # Realized equity after each bar
+    realized = np.bincount(trades["exit_index"].to_numpy(dtype=np.int64), weights=trades["pnl"].to_numpy(), minlength=num_bars)
+    equity = balance + np.cumsum(realized)
+    equity_curve = pandas.DataFrame({"time": time, "equity": equity})
+    trades = trades.drop(columns="exit_index")
+
+    return BacktestResult(equity_curve, trades, calc_stats(trades, equity, balance, num_signals, int((~valid).sum())))
+
+def find_first_indexes(values, starts, ends, levels, at_or_above):
+    """
+    Finds, for every search, the first position in values[start:end] at or above (or at or below) its level.
+    The first LOOKAHEAD_BARS bars of all searches are checked in one pass. Only searches that run past
+    them fall back to find_first_index
+    :param values: numpy array to search
+    :param starts: integer array of first positions to look at
+    :param ends: integer array of positions to stop before
+    :param levels: float array of levels to compare against
+    :param at_or_above: Boolean. True to find values >= level. False to find values <= level
+    :return: integer array of positions. -1 where not found
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    levels = np.asarray(levels, dtype=np.float64)
+    result = np.full(len(starts), -1, dtype=np.int64)
+    if len(starts) == 0 or len(values) == 0:
+        return result
+
+    positions = starts[:, None] + np.arange(LOOKAHEAD_BARS)
+    window = values[np.minimum(positions, len(values) - 1)]
+    hits = (window >= levels[:, None]) if at_or_above else (window <= levels[:, None])
+    hits &= positions < ends[:, None]
+
+    found = hits.any(axis=1)
+    result[found] = starts[found] + hits[found].argmax(axis=1)
+
+    # Searches that run past the look-ahead window
+    for n in np.flatnonzero(~found & (starts + LOOKAHEAD_BARS < ends)):
+        result[n] = find_first_index(values, starts[n] + LOOKAHEAD_BARS, ends[n], levels[n], at_or_above)
+
+    return result
+
+def find_first_index(values, start, end, level, at_or_above):
+    """
+    Finds the first position in values[start:end] at or above (or at or below) `level`.
+    Searches in doubling chunks, so a hit close to `start` never scans the rest of the array
+    :param values: numpy array to search
+    :param start: integer first position to look at
+    :param end: integer position to stop before
+    :param level: Float. Level to compare against
+    :param at_or_above: Boolean. True to find values >= level. False to find values <= level
+    :return: integer position. -1 if not found
+    """
+    chunk_size = SEARCH_CHUNK_SIZE
+    while start < end:
+        stop = min(start + chunk_size, end)
+        chunk = values[start:stop]
+        hits = chunk >= level if at_or_above else chunk <= level
+        if hits.any():
+            return start + int(hits.argmax())
+        start = stop
+        chunk_size *= 2
+    return -1
+
+def calc_stats(trades, equity, balance, num_signals, num_rejected):
+    """
+    Calculates the summary stats of a backtest
+    :param trades: dataframe of simulated trades
+    :param equity: numpy array of equity after each bar
+    :param balance: Float. Starting equity
+    :param num_signals: integer number of signals seen
+    :param num_rejected: integer number of signals with invalid stops
+    :return: dict of summary stats
+    """
+    pnl = trades["pnl"].to_numpy()
+    gross_profit = float(pnl[pnl > 0].sum())
+    gross_loss = float(-pnl[pnl < 0].sum())
+
+    running_peak = np.maximum.accumulate(equity) if len(equity) else equity
+    drawdown = running_peak - equity
+
+    return {
+        "signals": num_signals,
+        "rejected": num_rejected,
+        "trades": len(trades),
+        "wins": int((pnl > 0).sum()),
+        "losses": int((pnl < 0).sum()),
+        "win_rate": float((pnl > 0).mean()) if len(pnl) else 0.0,
+        "total_pnl": float(pnl.sum()),
+        "profit_factor": gross_profit / gross_loss if gross_loss else float("inf") if gross_profit else 0.0,
+        "max_drawdown": float(drawdown.max()) if len(drawdown) else 0.0,
+        "final_equity": float(equity[-1]) if len(equity) else float(balance),
+        "return_pct": float(equity[-1] / balance - 1) if len(equity) else 0.0
+    }
+
+def main():
+    """
+    Runs a backtest on candles kept in a candle store and prints the summary stats
+    """
+    parser = argparse.ArgumentParser(description="Backtest the EMA Cross strategy on stored candles")
+    parser.add_argument("symbol")
+    parser.add_argument("timeframe")
+    parser.add_argument("--store", default="./candles", help="candle store directory")
+    parser.add_argument("--short", type=int, default=1, help="short-term EMA length")
+    parser.add_argument("--long", type=int, default=2, help="long-term EMA length")
+    parser.add_argument("--balance", type=float, default=10000)
+    parser.add_argument("--risk", type=float, default=0.03, help="risk per trade as a percentage")
+    parser.add_argument("--contract-size", type=float, default=1.0)
+    args = parser.parse_args()
+
+    candles = CandleStore(args.store).read(args.symbol, args.timeframe)
+    result = run_backtest(candles, args.symbol, args.short, args.long, args.balance, args.risk, args.contract_size)
+
+    for name, value in result.stats.items():
+        print(f"{name}: {value}")
+
+if __name__ == '__main__':
+    main()
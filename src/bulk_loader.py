@@ -0,0 +1,188 @@
+import argparse
+import os
+
+import pandas
+
+from candle_store import CandleStore, to_candle_records
+import mt5_lib
+import utils
+
+# Candles requested from MetaTrader 5 or read from a file at a time. Memory use is bounded by one chunk
+DEFAULT_CHUNK_BARS = 20000
+
+# one_month bars follow the calendar, so chunk windows assume the longest month
+MONTH_SECONDS = 31 * 24 * 60 * 60
+
+# Column names of other exports mapped to CANDLE_DTYPE fields, e.g. the <TICKVOL> of a MetaTrader 5 export
+COLUMN_ALIASES = {
+    "datetime": "time",
+    "timestamp": "time",
+    "tickvol": "tick_volume",
+    "volume": "tick_volume",
+    "vol": "real_volume"
+}
+
+def download_history(store, symbol, timeframe, date_from, date_to=None, chunk_bars=DEFAULT_CHUNK_BARS):
+    """
+    Downloads the closed candles of `symbol` between `date_from` and `date_to` into `store`, one date
+    window of `chunk_bars` candles at a time. Each window is written to disk before the next one is
+    requested. Resumes after the newest stored candle, so an interrupted download can simply be rerun.
+    :param store: candle_store.CandleStore to append to
+    :param symbol: string of the symbol
+    :param timeframe: string of a mt5_lib.Timeframe name
+    :param date_from: integer seconds since epoch on the server clock of the first candle
+    :param date_to: integer seconds since epoch on the server clock of the last candle. Defaults to the last closed candle
+    :param chunk_bars: integer number of candles per request
+    :return: number of candles appended
+    """
+    forming_time = mt5_lib.get_forming_candle_time(symbol, timeframe)
+    if forming_time is None:
+        raise ValueError(f"MetaTrader 5 has no candles for {symbol} on {timeframe}.")
+
+    # The forming candle would be stored with its prices so far and never updated
+    end = forming_time - 1 if date_to is None else min(int(date_to), forming_time - 1)
+
+    last_time = store.get_last_time(symbol, timeframe)
+    start = int(date_from) if last_time is None else max(int(date_from), last_time + 1)
+
+    window = chunk_bars * utils.TIMEFRAME_SECONDS.get(timeframe, MONTH_SECONDS)
+    appended = 0
+    while start <= end:
+        window_end = min(start + window - 1, end)
+        candles = mt5_lib.get_candle_range(symbol, timeframe, start, window_end)
+        if candles is None:
+            # Stop rather than skip the window, the store can only grow forwards
+            raise ConnectionError(f"MetaTrader 5 returned no candles for {symbol} on {timeframe} from {start} to {window_end}.")
+
+        appended += store.append(symbol, timeframe, candles)
+        start = window_end + 1
+
+    return appended
+
+def download_all(store, symbols, timeframes, date_from, date_to=None, chunk_bars=DEFAULT_CHUNK_BARS):
+    """
+    Runs download_history for every symbol and timeframe. A failing symbol doesn't stop the others
+    :return: dict of (symbol, timeframe) to the number of candles appended, or the exception the download raised
+    """
+    results = {}
+    for symbol in symbols:
+        for timeframe in timeframes:
+            try:
+                results[(symbol, timeframe)] = download_history(store, symbol, timeframe, date_from, date_to, chunk_bars)
+                print(f"{symbol} {timeframe}: {results[(symbol, timeframe)]} candles appended, {store.count(symbol, timeframe)} stored.")
+            except Exception as e:
+                results[(symbol, timeframe)] = e
+                print(f"{symbol} {timeframe}: download failed. Rerun to resume. Error: {e}")
+    return results
+
+def normalize_columns(frame):
+    """
+    Renames the columns of an exported chunk to CANDLE_DTYPE fields and converts its times
+    to integer seconds since epoch. Separate <DATE> and <TIME> columns are joined
+    :param frame: dataframe read from a CSV or Parquet export
+    :return: dataframe with CANDLE_DTYPE columns, oldest candle first
+    """
+    frame = frame.rename(columns=lambda name: str(name).strip().strip("<>").lower())
+    frame = frame.rename(columns=COLUMN_ALIASES)
+
+    if "date" in frame.columns:
+        times = frame["date"].astype(str)
+        if "time" in frame.columns:
+            times = times + " " + frame["time"].astype(str)
+        frame = frame.drop(columns=["date"]).assign(time=times)
+
+    if "time" not in frame.columns:
+        raise ValueError("No time column in the imported candles.")
+
+    if not pandas.api.types.is_numeric_dtype(frame["time"]):
+        times = pandas.to_datetime(frame["time"], utc=True)
+        frame = frame.assign(time=(times - pandas.Timestamp(0, tz="UTC")) // pandas.Timedelta(seconds=1))
+
+    return frame.sort_values("time", kind="stable")
+
+def read_csv_chunks(path, chunk_bars=DEFAULT_CHUNK_BARS):
+    """
+    :return: iterator over dataframes of `chunk_bars` rows of the CSV file at `path`. Tab-separated files are detected
+    """
+    with open(path) as file:
+        header = file.readline()
+    return pandas.read_csv(path, sep="\t" if "\t" in header else ",", chunksize=chunk_bars)
+
+def read_parquet_chunks(path, chunk_bars=DEFAULT_CHUNK_BARS):
+    """
+    :return: iterator over dataframes of `chunk_bars` rows of the Parquet file at `path`. Needs pyarrow
+    """
+    try:
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Importing Parquet files needs pyarrow. Run pip install pyarrow") from e
+
+    for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_bars):
+        yield batch.to_pandas()
+
+def import_file(store, symbol, timeframe, path, chunk_bars=DEFAULT_CHUNK_BARS):
+    """
+    Imports the candles of a CSV or Parquet export into `store`, one chunk at a time. The file must
+    be sorted oldest first. Candles not newer than the newest stored one are skipped, so an interrupted
+    import can simply be rerun
+    :param store: candle_store.CandleStore to append to
+    :param symbol: string of the symbol
+    :param timeframe: string of the timeframe of the candles in the file
+    :param path: path of a .csv, .tsv, .txt or .parquet file
+    :param chunk_bars: integer number of rows read at a time
+    :return: number of candles appended
+    """
+    if os.path.splitext(path)[1].lower() == ".parquet":
+        chunks = read_parquet_chunks(path, chunk_bars)
+    else:
+        chunks = read_csv_chunks(path, chunk_bars)
+
+    appended = 0
+    for chunk in chunks:
+        records = to_candle_records(normalize_columns(chunk))
+        appended += store.append(symbol, timeframe, records)
+    return appended
+
+def main():
+    """
+    Downloads history from MetaTrader 5 or imports an export into a candle store
+    """
+    parser = argparse.ArgumentParser(description="Build candle store history from MetaTrader 5 or CSV/Parquet exports")
+    parser.add_argument("--store", default="./candles", help="candle store directory")
+    parser.add_argument("--chunk-bars", type=int, default=DEFAULT_CHUNK_BARS, help="candles requested or read at a time")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    download = commands.add_parser("download", help="download history from MetaTrader 5, resuming after the newest stored candle")
+    download.add_argument("--symbols", nargs="+", help="defaults to the symbols of settings.json")
+    download.add_argument("--timeframes", nargs="+", default=["one_minute"])
+    download.add_argument("--from", dest="date_from", type=utils.parse_date, required=True, help="YYYY-MM-DD on the server clock")
+    download.add_argument("--to", dest="date_to", type=utils.parse_date, help="YYYY-MM-DD on the server clock. Defaults to the last closed candle")
+
+    import_command = commands.add_parser("import", help="import a CSV or Parquet export")
+    import_command.add_argument("symbol")
+    import_command.add_argument("timeframe")
+    import_command.add_argument("path")
+    args = parser.parse_args()
+
+    store = CandleStore(args.store)
+
+    if args.command == "import":
+        appended = import_file(store, args.symbol, args.timeframe, args.path, args.chunk_bars)
+        print(f"{args.symbol} {args.timeframe}: {appended} candles appended, {store.count(args.symbol, args.timeframe)} stored.")
+        return
+
+    # Imported here, main needs the MetaTrader 5 settings
+    from main import get_json_from_file, ACCOUNT_SETTINGS_PATH, CREDENTIALS_FILE_PATH
+    json_settings = get_json_from_file(ACCOUNT_SETTINGS_PATH)
+    mt5_lib.connect(json_settings, get_json_from_file(CREDENTIALS_FILE_PATH))
+
+    symbols = args.symbols or json_settings["mt5"]["symbols"]
+    for symbol in symbols:
+        mt5_lib.initialize_symbol(symbol)
+
+    results = download_all(store, symbols, args.timeframes, args.date_from, args.date_to, args.chunk_bars)
+    if any(isinstance(result, Exception) for result in results.values()):
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
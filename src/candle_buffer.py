@@ -0,0 +1,146 @@
+import numpy as np
+import pandas
+
+from candle_store import CANDLE_DTYPE
+
+class CandleBuffer:
+    """
+    Fixed-capacity ring buffer of the latest candles of one symbol and timeframe, kept as
+    preallocated NumPy columns with indicator columns stored next to the candle fields.
+
+    Every column holds two copies of the ring, so the candles are always readable oldest
+    first as one contiguous view without copying or reordering. Memory is bounded by
+    `capacity` and appending a candle writes in place without allocating.
+    """
+
+    def __init__(self, capacity, indicator_columns=None):
+        """
+        :param capacity: integer maximum number of candles kept. Older candles are overwritten
+        :param indicator_columns: dict of indicator column name to numpy dtype
+        """
+        if capacity < 1:
+            raise ValueError("Capacity must be at least 1")
+
+        self.capacity = capacity
+        self.columns = {name: np.zeros(2 * capacity, dtype=CANDLE_DTYPE[name]) for name in CANDLE_DTYPE.names}
+        for name, dtype in (indicator_columns or {}).items():
+            self.columns[name] = np.zeros(2 * capacity, dtype=dtype)
+        # Physical position of the oldest candle and the number of candles held
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        """
+        Drops every candle. The columns are kept and overwritten by later appends
+        """
+        self.start = 0
+        self.size = 0
+
+    def append(self, candle):
+        """
+        Appends one candle, overwriting the oldest one when the buffer is full. Indicator columns
+        of the new candle start at zero
+        :param candle: CANDLE_DTYPE record, e.g. one row of MetaTrader5.copy_rates_from_pos
+        """
+        position = (self.start + self.size) % self.capacity
+        for name, column in self.columns.items():
+            value = candle[name] if name in CANDLE_DTYPE.fields else 0
+            column[position] = value
+            column[position + self.capacity] = value
+
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def extend(self, candles):
+        """
+        Appends candles oldest first. Only the last `capacity` candles are kept
+        :param candles: CANDLE_DTYPE structured array
+        """
+        candles = candles[-self.capacity:]
+        positions = (self.start + self.size + np.arange(len(candles))) % self.capacity
+        for name, column in self.columns.items():
+            values = candles[name] if name in CANDLE_DTYPE.fields else 0
+            column[positions] = values
+            column[positions + self.capacity] = values
+
+        overflow = max(0, self.size + len(candles) - self.capacity)
+        self.start = (self.start + overflow) % self.capacity
+        self.size = min(self.capacity, self.size + len(candles))
+
+    def column(self, name):
+        """
+        :param name: string name of a candle or indicator column
+        :return: read-only view of the column, oldest candle first
+        """
+        view = self.columns[name][self.start:self.start + self.size]
+        view.flags.writeable = False
+        return view
+
+    def set_column(self, name, values):
+        """
+        Overwrites the last len(`values`) entries of column `name`
+        :param name: string name of an indicator column
+        :param values: array-like of values, oldest first
+        """
+        values = np.asarray(values)
+        if len(values) > self.size:
+            raise ValueError(f"Cannot set {len(values)} values on a buffer of {self.size} candles")
+
+        positions = (self.start + self.size - len(values) + np.arange(len(values))) % self.capacity
+        column = self.columns[name]
+        column[positions] = values
+        column[positions + self.capacity] = values
+
+    def get(self, name, index=-1):
+        """
+        :param name: string name of a candle or indicator column
+        :param index: integer position of the candle, negative counts from the latest one
+        :return: the value of column `name` for that candle
+        """
+        if not -self.size <= index < self.size:
+            raise IndexError("Candle index out of range")
+        return self.columns[name][self.start + index % self.size]
+
+    def set(self, name, value, index=-1):
+        """
+        Sets the value of column `name` for one candle
+        :param name: string name of an indicator column
+        :param value: the new value
+        :param index: integer position of the candle, negative counts from the latest one
+        """
+        if not -self.size <= index < self.size:
+            raise IndexError("Candle index out of range")
+        position = (self.start + index % self.size) % self.capacity
+        self.columns[name][position] = value
+        self.columns[name][position + self.capacity] = value
+
+    def get_row(self, index=-1):
+        """
+        :param index: integer position of the candle, negative counts from the latest one
+        :return: dict of column name to the python value of every column for that candle
+        """
+        return {name: self.get(name, index).item() for name in self.columns}
+
+    def get_records(self, num_candles=None):
+        """
+        Copies the candle fields of the latest candles into a structured array
+        :param num_candles: integer number of latest candles. Defaults to every candle
+        :return: CANDLE_DTYPE structured array, oldest candle first
+        """
+        num_candles = self.size if num_candles is None else min(num_candles, self.size)
+        records = np.zeros(num_candles, dtype=CANDLE_DTYPE)
+        for name in CANDLE_DTYPE.names:
+            records[name] = self.column(name)[self.size - num_candles:]
+        return records
+
+    def to_dataframe(self):
+        """
+        Copies the buffer into a dataframe, for display or export
+        :return: dataframe with one column per candle and indicator column, oldest candle first
+        """
+        return pandas.DataFrame({name: self.column(name).copy() for name in self.columns})
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+import pandas
+
+# Record layout returned by MetaTrader5.copy_rates_from_pos
+CANDLE_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('tick_volume', '<u8'),
+    ('spread', '<i4'),
+    ('real_volume', '<u8')
+])
+
+# Record layout returned by MetaTrader5.copy_ticks_from
+TICK_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('bid', '<f8'),
+    ('ask', '<f8'),
+    ('last', '<f8'),
+    ('volume', '<u8'),
+    ('time_msc', '<i8'),
+    ('flags', '<u4'),
+    ('volume_real', '<f8')
+])
+
+def to_candle_records(candles):
+    """
+    Converts candles into a CANDLE_DTYPE structured array
+    :param candles: structured array from MetaTrader 5 or a dataframe with the same columns
+    :return: numpy structured array with the CANDLE_DTYPE layout
+    """
+    if isinstance(candles, np.ndarray) and candles.dtype == CANDLE_DTYPE:
+        return candles
+
+    records = np.zeros(len(candles), dtype=CANDLE_DTYPE)
+    for name in CANDLE_DTYPE.names:
+        if isinstance(candles, pandas.DataFrame):
+            if name in candles.columns:
+                records[name] = candles[name].to_numpy()
+        elif name in candles.dtype.names:
+            records[name] = candles[name]
+    return records
+
+class CandleStore:
+    """
+    On-disk candle store with one append-only file of fixed-width CANDLE_DTYPE records
+    per symbol and timeframe. Files are read through numpy.memmap, so reads don't copy
+    """
+
+    def __init__(self, root_path):
+        """
+        :param root_path: directory the candle files are kept in
+        """
+        self.root_path = root_path
+
+    def get_path(self, symbol, timeframe):
+        """
+        :return: file path of the candles of `symbol` on `timeframe`
+        """
+        return os.path.join(self.root_path, symbol, f"{timeframe}.bin")
+
+    def count(self, symbol, timeframe):
+        """
+        :return: number of complete candles stored for `symbol` on `timeframe`
+        """
+        path = self.get_path(symbol, timeframe)
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // CANDLE_DTYPE.itemsize
+
+    def read(self, symbol, timeframe, num_candles=None):
+        """
+        Memory-maps the stored candles of `symbol` on `timeframe`, oldest first
+        :param num_candles: number of most recent candles to return. Defaults to all of them
+        :return: read-only numpy structured array of CANDLE_DTYPE records
+        """
+        count = self.count(symbol, timeframe)
+        if count == 0:
+            return np.zeros(0, dtype=CANDLE_DTYPE)
+
+        candles = np.memmap(self.get_path(symbol, timeframe), dtype=CANDLE_DTYPE, mode='r', shape=(count,))
+        if num_candles is not None:
+            return candles[max(count - num_candles, 0):]
+        return candles
+
+    def get_last_time(self, symbol, timeframe):
+        """
+        :return: time of the newest stored candle. None if nothing is stored
+        """
+        last_candle = self.read(symbol, timeframe, 1)
+        if len(last_candle) == 0:
+            return None
+        return int(last_candle['time'][0])
+
+    def append(self, symbol, timeframe, candles):
+        """
+        Appends the candles newer than the newest stored candle
+        :param candles: structured array from MetaTrader 5 or a dataframe with the same columns, oldest first
+        :return: number of candles appended
+        """
+        records = to_candle_records(candles)
+
+        last_time = self.get_last_time(symbol, timeframe)
+        if last_time is not None:
+            records = records[records['time'] > last_time]
+
+        if len(records) == 0:
+            return 0
+
+        path = self.get_path(symbol, timeframe)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Drop a partially written record left behind by an interrupted append
+        if os.path.exists(path) and os.path.getsize(path) % CANDLE_DTYPE.itemsize:
+            with open(path, "r+b") as file:
+                file.truncate(self.count(symbol, timeframe) * CANDLE_DTYPE.itemsize)
+
+        with open(path, "ab") as file:
+            file.write(records.tobytes())
+
+        return len(records)
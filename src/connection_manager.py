@@ -0,0 +1,234 @@
+import functools
+import threading
+import time
+
+import mt5_lib
+
+# last_error codes of a lost terminal connection: IPC send, receive, initialize, connect and timeout failures
+CONNECTION_ERRORS = (-10001, -10002, -10003, -10004, -10005)
+
+# Calls that only read terminal state, so they are safe to repeat after a reconnect
+IDEMPOTENT_CALLS = {
+    "account_info", "copy_rates_from", "copy_rates_from_pos", "copy_rates_range", "copy_ticks_from",
+    "copy_ticks_range", "order_check", "orders_get", "orders_total", "positions_get", "positions_total",
+    "symbol_info", "symbol_info_tick", "symbol_select", "symbols_get"
+}
+
+# Calls that change orders on the trade server. They are never repeated
+SEND_CALLS = {"order_send"}
+
+DEFAULT_RECONNECT_ATTEMPTS = 5
+# Seconds before the second reconnect attempt. Doubles with every attempt up to the max delay
+DEFAULT_RECONNECT_DELAY = 0.5
+DEFAULT_RECONNECT_MAX_DELAY = 8.0
+
+# Sends in a row without an answer from the terminal that open the send circuit breaker
+DEFAULT_BREAKER_THRESHOLD = 3
+# Seconds the breaker stays open before it lets one send through again
+DEFAULT_BREAKER_COOLDOWN = 30.0
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending an order while the send circuit breaker is open
+    """
+
+class ConnectionManager:
+    """
+    Stands in for the MetaTrader5 module in mt5_lib and keeps the terminal connection alive.
+    A read that fails because the connection dropped reconnects, with bounded exponential backoff,
+    and is tried once more. Order sends are never repeated: a send without an answer may still have
+    reached the server, so further sends are refused until the order book has been reconciled with
+    the terminal, and sends that keep failing open a circuit breaker
+    """
+
+    def __init__(
+        self,
+        terminal,
+        json_settings,
+        credentials,
+        reconnect_attempts=DEFAULT_RECONNECT_ATTEMPTS,
+        reconnect_delay=DEFAULT_RECONNECT_DELAY,
+        reconnect_max_delay=DEFAULT_RECONNECT_MAX_DELAY,
+        breaker_threshold=DEFAULT_BREAKER_THRESHOLD,
+        breaker_cooldown=DEFAULT_BREAKER_COOLDOWN
+    ):
+        """
+        :param terminal: the MetaTrader5 module
+        :param json_settings: json of project settings, for the login timeout
+        :param credentials: json of the MetaTrader 5 login details used to reconnect
+        :param reconnect_attempts: integer number of reconnect attempts before a call gives up
+        :param reconnect_delay: seconds before the second reconnect attempt
+        :param reconnect_max_delay: upper bound on the seconds between reconnect attempts
+        :param breaker_threshold: integer number of sends in a row without an answer that open the breaker
+        :param breaker_cooldown: seconds the breaker stays open
+        """
+        self.terminal = terminal
+        self.json_settings = json_settings
+        self.credentials = credentials
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        # Held while reconnecting, so threads that lose the connection together reconnect once
+        self.reconnect_lock = threading.Lock()
+        # Number of successful reconnects
+        self.reconnects = 0
+
+        self.breaker_lock = threading.Lock()
+        self.send_failures = 0
+        # Monotonic time until which the breaker refuses sends. None while closed
+        self.breaker_open_until = None
+        # Monotonic time of the last send without an answer, until the order book is reconciled
+        self.unconfirmed_send_at = None
+
+    def __getattr__(self, name):
+        value = getattr(self.terminal, name)
+        if not callable(value) or isinstance(value, type):
+            return value
+
+        if name in IDEMPOTENT_CALLS:
+            @functools.wraps(value)
+            def call(*args, **kwargs):
+                return self.call_idempotent(value, *args, **kwargs)
+            return call
+
+        if name in SEND_CALLS:
+            @functools.wraps(value)
+            def send(*args, **kwargs):
+                return self.call_send(value, *args, **kwargs)
+            return send
+
+        return value
+
+    def is_disconnected(self):
+        """
+        :return: Boolean. True if the last call failed for a lost connection or the terminal reports it is offline
+        """
+        error = self.terminal.last_error()
+        if error is not None and error[0] in CONNECTION_ERRORS:
+            return True
+        terminal_info = self.terminal.terminal_info()
+        return terminal_info is None or not terminal_info.connected
+
+    def connect(self):
+        """
+        Initializes the terminal and logs in with the stored credentials
+        :return: Boolean. True if both succeed
+        """
+        pathway = self.credentials["mt5"]["terminal_pathway"]
+        login = self.credentials["mt5"]["login"]
+        password = self.credentials["mt5"]["password"]
+        server = self.credentials["mt5"]["server"]
+        timeout = self.json_settings["mt5"]["timeout"]
+
+        if not self.terminal.initialize(pathway, login=login, password=password, server=server, timeout=timeout):
+            return False
+        return bool(self.terminal.login(login=login, password=password, server=server, timeout=timeout))
+
+    def reconnect(self, seen_reconnects):
+        """
+        Reconnects to the terminal, waiting longer after every failed attempt
+        :param seen_reconnects: value of `reconnects` when the caller saw the connection fail
+        :return: Boolean. True once connected, also when another thread reconnected in the meantime
+        """
+        with self.reconnect_lock:
+            if self.reconnects != seen_reconnects:
+                return True
+
+            delay = self.reconnect_delay
+            for attempt in range(1, self.reconnect_attempts + 1):
+                print(f"MetaTrader 5 connection lost: {self.terminal.last_error()}. Reconnecting, attempt {attempt} of {self.reconnect_attempts}.")
+                try:
+                    self.terminal.shutdown()
+                    connected = self.connect()
+                except Exception as e:
+                    print(f"Reconnect failed. Error: {e}")
+                    connected = False
+
+                if connected:
+                    self.reconnects += 1
+                    # Orders may have filled, expired or been placed while we were away
+                    mt5_lib.order_book.invalidate()
+                    print("Reconnected to MetaTrader 5.")
+                    return True
+
+                if attempt < self.reconnect_attempts:
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.reconnect_max_delay)
+
+            return False
+
+    def ensure_connected(self):
+        """
+        Checks the terminal connection, e.g. before a cycle, and reconnects if it dropped
+        :return: Boolean. True if connected
+        """
+        seen_reconnects = self.reconnects
+        terminal_info = self.terminal.terminal_info()
+        if terminal_info is not None and terminal_info.connected:
+            return True
+        return self.reconnect(seen_reconnects)
+
+    def call_idempotent(self, function, *args, **kwargs):
+        """
+        Runs a read. When it returns None because the connection dropped, reconnects and runs it once more
+        :return: the return value of `function`
+        """
+        seen_reconnects = self.reconnects
+        result = function(*args, **kwargs)
+        if result is None and self.is_disconnected() and self.reconnect(seen_reconnects):
+            result = function(*args, **kwargs)
+        return result
+
+    def call_send(self, function, *args, **kwargs):
+        """
+        Runs an order send once, unless the circuit breaker is open
+        :return: the return value of `function`. None if the terminal didn't answer
+        """
+        self.check_breaker()
+
+        seen_reconnects = self.reconnects
+        result = function(*args, **kwargs)
+
+        with self.breaker_lock:
+            if result is not None:
+                self.send_failures = 0
+                self.breaker_open_until = None
+                return result
+
+            # The request may have reached the server. Don't send more until the order book shows what happened
+            self.unconfirmed_send_at = time.monotonic()
+            mt5_lib.order_book.invalidate()
+            self.send_failures += 1
+            if self.send_failures >= self.breaker_threshold:
+                self.breaker_open_until = time.monotonic() + self.breaker_cooldown
+                print(f"{self.send_failures} order sends in a row went unanswered. No orders are sent for {self.breaker_cooldown:.0f} seconds.")
+
+        if self.is_disconnected():
+            self.reconnect(seen_reconnects)
+        return None
+
+    def check_breaker(self):
+        """
+        Raises CircuitOpenError if an order send must not go out now
+        """
+        with self.breaker_lock:
+            if self.breaker_open_until is not None and time.monotonic() < self.breaker_open_until:
+                raise CircuitOpenError(f"Order sends are paused for {self.breaker_open_until - time.monotonic():.0f} more seconds after {self.send_failures} unanswered sends")
+            unconfirmed_send_at = self.unconfirmed_send_at
+
+        if unconfirmed_send_at is None:
+            return
+
+        # An order book reconciled after the unanswered send holds it if it was placed, so the
+        # strategy's cancel-before-place sees it and nothing is duplicated
+        synced_at = mt5_lib.order_book.synced_at
+        if synced_at is None or synced_at < unconfirmed_send_at:
+            if mt5_lib.order_book.reconcile() is None:
+                raise CircuitOpenError("An earlier order send went unanswered and the open orders can't be read to confirm it")
+
+        with self.breaker_lock:
+            if self.unconfirmed_send_at == unconfirmed_send_at:
+                self.unconfirmed_send_at = None
@@ -1,8 +1,25 @@
+import numpy as np
+
+from candle_buffer import CandleBuffer
 import indicator_lib
+import instrumentation
+import journal
 import mt5_lib
 import make_trade as mt
 import utils
 
+# Order comment used to find this strategy's orders
+STRATEGY_COMMENT = "EMA_Cross_strate"
+
+# Incremental EMA cross state, keyed by (symbol, timeframe, short_term_ema_length, long_term_ema_length)
+indicator_states = {}
+
+# Latest candles with their indicator columns, keyed like indicator_states
+candle_buffers = {}
+
+# Candles kept per symbol. Raised to fit the reseed history of longer EMAs
+CANDLE_BUFFER_CAPACITY = 256
+
 def ema_cross_strategy(symbol, timeframe, short_term_ema_length, long_term_ema_length, balance, risk_pct):
     """
     Function which runs the EMA Cross Strategy
@@ -13,32 +30,233 @@ def ema_cross_strategy(symbol, timeframe, short_term_ema_length, long_term_ema_l
     :return table with raw candle data and ema calculations
     """
 
-    # Get vanilla MetaTrader 5 dataframe
-    ema_x_strategy_table = mt5_lib.get_candlesticks(symbol, timeframe, long_term_ema_length + 2)
+    # Get the latest candle with its indicator and trade signal columns
+    trade_event = get_trade_event(symbol, timeframe, short_term_ema_length, long_term_ema_length)
 
-    # Append indicator columns to dataframe
-    calculate_indicators(ema_x_strategy_table, short_term_ema_length, long_term_ema_length)
+    return execute_trade_event(symbol, trade_event, balance, risk_pct)
 
-    det_trade(ema_x_strategy_table, short_term_ema_length, long_term_ema_length)
-
-    trade_event = ema_x_strategy_table.tail(1).copy()
+def execute_trade_event(symbol, trade_event, balance, risk_pct):
+    """
+    Function which cancels the open strategy orders and places a new order when `trade_event` saw an EMA cross
+    :param symbol: string of the symbol to be traded
+    :param trade_event: dict of the latest candle from get_trade_event. None if there is no new candle
+    :param balance: Float. Trade balance
+    :param risk_pct: Float. Risk amount as a percentage
+    :return: the order outcome of make_trade. False if no trade was made
+    """
 
-    # it is possible to have a cross that leads to a difference less than a penny
-    # if this is so, then the rounded stop loss and stop price will be the same and we should not trade
-    if trade_event['ema_cross'].values and (float(trade_event.iloc[0]['open']) != float(trade_event.iloc[0]['close'])):
-        comment = f"EMA_Cross_strate"
+    if is_tradeable(trade_event):
+        comment = STRATEGY_COMMENT
+        record_signal(symbol, trade_event, comment)
         # Cancel open orders
         mt5_lib.cancel_filtered_orders(symbol, comment)
-        make_trade_outcome = mt.make_trade(balance, comment, risk_pct, symbol, trade_event['take_profit'].values, trade_event['stop_loss'].values, trade_event['stop_price'].values)
+        make_trade_outcome = mt.make_trade(balance, comment, risk_pct, symbol, trade_event['take_profit'], trade_event['stop_loss'], trade_event['stop_price'])
     else:
         make_trade_outcome = False
 
     return make_trade_outcome
 
+def get_trade_intents(symbol, trade_event, balance, risk_pct, comment=STRATEGY_COMMENT):
+    """
+    Function which builds the mt5_lib.process_order_batch intents for `trade_event`: cancel the open
+    strategy orders and place a new order, when it saw an EMA cross
+    :param symbol: string of the symbol to be traded
+    :param trade_event: dict of the latest candle from get_trade_event. None if there is no new candle
+    :param balance: Float. Trade balance
+    :param risk_pct: Float. Risk amount as a percentage
+    :param comment: string of the order comment identifying the strategy's orders
+    :return: list of intents. Empty if no trade should be made
+    """
+    if not is_tradeable(trade_event):
+        return []
+
+    record_signal(symbol, trade_event, comment)
+    return [
+        {"action": "cancel", "symbol": symbol, "comment": comment},
+        mt.build_trade_intent(balance, comment, risk_pct, symbol, trade_event['take_profit'], trade_event['stop_loss'], trade_event['stop_price'])
+    ]
+
+def is_tradeable(trade_event):
+    """
+    :param trade_event: dict of the latest candle from get_trade_event. None if there is no new candle
+    :return: Boolean. True if the candle saw an EMA cross worth trading
+    """
+    # No new candle since the last run
+    if trade_event is None:
+        return False
+
+    # it is possible to have a cross that leads to a difference less than a penny
+    # if this is so, then the rounded stop loss and stop price will be the same and we should not trade
+    return bool(trade_event['ema_cross']) and (trade_event['open'] != trade_event['close'])
+
+def record_signal(symbol, trade_event, comment):
+    """
+    Journals a tradeable trade event
+    :param symbol: string of the symbol
+    :param trade_event: dict of the latest candle from get_trade_event
+    :param comment: string of the order comment identifying the strategy's orders
+    """
+    journal.record(
+        journal.SIGNAL,
+        symbol,
+        comment,
+        side=journal.BUY if trade_event['open'] < trade_event['close'] else journal.SELL,
+        price=trade_event['stop_price'],
+        stop_loss=trade_event['stop_loss'],
+        take_profit=trade_event['take_profit']
+    )
+
+def get_trade_event(symbol, timeframe, short_term_ema_length, long_term_ema_length):
+    """
+    Function to get the latest candle of `symbol` with its EMA, EMA cross and trade signal columns.
+    Advances the stored EMA state and candle buffer by one candle when exactly one new candle closed
+    since the last call and only reseeds from history on a restart or a gap
+    :param symbol: string of the symbol to be queried
+    :param timeframe: string of the timeframe to be queried
+    :param short_term_ema_length: integer of the lowest timeframe length for EMA
+    :param long_term_ema_length: integer of the highest timeframe length for EMA
+    :return: dict of the latest candle and its indicator columns. None if there is no new candle
+    """
+    # Tag the timed stages below with the symbol
+    with instrumentation.tag(symbol):
+        key = (symbol, timeframe, short_term_ema_length, long_term_ema_length)
+        state = indicator_states.get(key)
+        candle_buffer = candle_buffers.get(key)
+
+        if state is not None and state.ready and candle_buffer is not None:
+            # The candle we hold plus the newest closed candle
+            latest_candles = mt5_lib.get_candle_records(symbol, timeframe, 2)
+
+            if len(latest_candles) == 2:
+                # Nothing closed since the last call
+                if latest_candles['time'][-1] == state.last_time:
+                    return None
+
+                # Exactly one new candle, advance in O(1)
+                if latest_candles['time'][0] == state.last_time:
+                    candle = latest_candles[-1]
+                    candle_buffer.append(candle)
+                    with instrumentation.span("calc_ema"):
+                        state.short_term_ema.update(candle['close'])
+                        state.long_term_ema.update(candle['close'])
+                    with instrumentation.span("ema_cross_calc"):
+                        ema_cross = state.update_position(candle['time'].item())
+
+                    candle_buffer.set(utils.get_ema_name(short_term_ema_length), state.short_term_ema.value)
+                    candle_buffer.set(utils.get_ema_name(long_term_ema_length), state.long_term_ema.value)
+                    candle_buffer.set('ema_cross', ema_cross)
+
+                    det_buffer_trade(candle_buffer, long_term_ema_length, 1)
+
+                    return candle_buffer.get_row()
+
+        # Restart or gap: reseed from history
+        candles = mt5_lib.get_candle_records(symbol, timeframe, long_term_ema_length + 2)
+        if len(candles) == 0:
+            return None
+
+        candle_buffer = CandleBuffer(
+            max(CANDLE_BUFFER_CAPACITY, long_term_ema_length + 2),
+            get_indicator_columns(short_term_ema_length, long_term_ema_length)
+        )
+        candle_buffer.extend(candles)
+
+        calculate_buffer_indicators(candle_buffer, short_term_ema_length, long_term_ema_length)
+        det_buffer_trade(candle_buffer, long_term_ema_length)
+
+        trade_event = candle_buffer.get_row()
+
+        state = indicator_lib.IncrementalEmaCross(short_term_ema_length, long_term_ema_length)
+        state.seed_from_row(trade_event)
+        indicator_states[key] = state
+        candle_buffers[key] = candle_buffer
+
+        return trade_event
+
+def get_candle_table(symbol, timeframe, short_term_ema_length, long_term_ema_length):
+    """
+    Function to get the buffered candles of `symbol` with their indicator columns, for display or export
+    :return: dataframe of the buffered candles, oldest first. None if the strategy hasn't run on `symbol` yet
+    """
+    candle_buffer = candle_buffers.get((symbol, timeframe, short_term_ema_length, long_term_ema_length))
+    if candle_buffer is None:
+        return None
+    return candle_buffer.to_dataframe()
+
+def get_indicator_columns(short_term_ema_length, long_term_ema_length):
+    """
+    :return: dict of the indicator column names of this strategy to their numpy dtype
+    """
+    return {
+        utils.get_ema_name(short_term_ema_length): np.float64,
+        utils.get_ema_name(long_term_ema_length): np.float64,
+        'ema_cross': bool,
+        'stop_loss': np.float64,
+        'stop_price': np.float64,
+        'take_profit': np.float64
+    }
+
+def calculate_buffer_indicators(candle_buffer, short_term_ema_length, long_term_ema_length):
+    """
+    Function to calculate the indicators for the EMA Cross strategy on every candle of a candle buffer.
+    Same values as calculate_indicators, except that the oldest candle is kept, without a cross,
+    instead of being dropped
+    :param candle_buffer: candle_buffer.CandleBuffer with this strategy's indicator columns
+    :param short_term_ema_length: length of the short-term ema
+    :param long_term_ema_length: length of the long-term ema
+    """
+    close = candle_buffer.column('close')
+    with instrumentation.span("calc_ema"):
+        short_term_ema = indicator_lib.calc_ema_array(close, short_term_ema_length)
+        long_term_ema = indicator_lib.calc_ema_array(close, long_term_ema_length)
+
+    with instrumentation.span("ema_cross_calc"):
+        position = short_term_ema > long_term_ema
+        ema_cross = np.zeros(len(position), dtype=bool)
+        ema_cross[1:] = position[1:] != position[:-1]
+
+    candle_buffer.set_column(utils.get_ema_name(short_term_ema_length), short_term_ema)
+    candle_buffer.set_column(utils.get_ema_name(long_term_ema_length), long_term_ema)
+    candle_buffer.set_column('ema_cross', ema_cross)
+
+@instrumentation.timed("det_trade")
+def det_buffer_trade(candle_buffer, long_term_ema_length, num_candles=None):
+    """
+    Function to calculate the trade signals of the latest `num_candles` candles of a candle buffer.
+    Same rules as det_trade
+    :param candle_buffer: candle_buffer.CandleBuffer with this strategy's indicator columns
+    :param long_term_ema_length: integer of the highest timeframe length for EMA
+    :param num_candles: integer number of latest candles to evaluate. Defaults to every candle
+    """
+    start = -num_candles if num_candles else 0
+
+    # Stop-loss is always the ema with the longer timeframe
+    stop_loss_column = candle_buffer.column(utils.get_ema_name(long_term_ema_length))[start:]
+
+    stop_loss, stop_price, take_profit = calc_trade_levels(
+        # Only candles with a warmed up long-term EMA can trade
+        candle_buffer.column('ema_cross')[start:] & (stop_loss_column != 0.0),
+        stop_loss_column,
+        candle_buffer.column('open')[start:],
+        candle_buffer.column('close')[start:],
+        candle_buffer.column('high')[start:],
+        candle_buffer.column('low')[start:]
+    )
+
+    candle_buffer.set_column('stop_loss', stop_loss)
+    candle_buffer.set_column('stop_price', stop_price)
+    candle_buffer.set_column('take_profit', take_profit)
+
 # Function to determine on which symbols trade events should occur and calculate their trade signals
+@instrumentation.timed("det_trade")
 def det_trade(ema_x_strategy_table, short_term_ema_length, long_term_ema_length):
     """
-    Function to calculate a trade signals for symbols that saw their ema cross
+    Function to calculate a trade signals for symbols that saw their ema cross.
+
+    Rows are evaluated by position, never by index label, so the table may carry any index
+    (e.g. the shifted index left behind by dropna). Every row whose long-term EMA is warmed up,
+    i.e. not zero-filled by calc_ema, is evaluated. All other rows keep zero trade levels.
+
     :param ema_x_strategy_table: dataframe in which we are calculating the cross strategy
     :param short_term_ema_length: integer of the lowest timeframe length for EMA
     :param long_term_ema_length: intefer of the highest timeframe length for EMA
@@ -48,38 +266,59 @@ def det_trade(ema_x_strategy_table, short_term_ema_length, long_term_ema_length)
         raise ValueError("Long-term EMA length must be larger than short-term EMA length")
 
     # Stop-loss is always the ema with the longer timeframe
-    stop_loss_column_name = utils.get_ema_name(long_term_ema_length)
-
-    min_value = long_term_ema_length
-
-    ema_x_strategy_table['stop_loss'] = 0.0
-    ema_x_strategy_table['stop_price'] = 0.0
-    ema_x_strategy_table['take_profit'] = 0.0
-
-    for i in range(min_value, len(ema_x_strategy_table) + 1):
-        # the open and close values can be the same for ema cross situations if the cross is triggered by a value that is less than a penny
-        if ema_x_strategy_table.loc[i, 'ema_cross']:
-            stop_loss = ema_x_strategy_table.loc[i, stop_loss_column_name]
-
-            # Green candle (BUY)
-            if ema_x_strategy_table.loc[i, 'open'] < ema_x_strategy_table.loc[i, 'close']:
-                stop_price = ema_x_strategy_table.loc[i, 'high']
-                distance = stop_price - stop_loss
-                take_profit = stop_price + distance
-            # Red candle (SELL)
-            elif ema_x_strategy_table.loc[i, 'open'] > ema_x_strategy_table.loc[i, 'close']:
-                stop_price = ema_x_strategy_table.loc[i, 'low']
-                distance = stop_loss - stop_price
-                take_profit = stop_price - distance
-            else:
-                print("An ema cross was detected, but for a trade less than a penny. Skipping trade.")
-                stop_price = 0
-                distance = 0
-                take_profit = 0
-
-            ema_x_strategy_table.loc[i, 'stop_loss'] = (round(float(stop_loss), 2))
-            ema_x_strategy_table.loc[i, 'stop_price'] = (round(float(stop_price), 2))
-            ema_x_strategy_table.loc[i, 'take_profit'] = (round(float(take_profit), 2))
+    stop_loss_column = ema_x_strategy_table[utils.get_ema_name(long_term_ema_length)].to_numpy(dtype=np.float64)
+
+    # Only rows with a warmed up long-term EMA can trade
+    ema_cross = ema_x_strategy_table['ema_cross'].to_numpy(dtype=bool) & (stop_loss_column != 0.0)
+
+    stop_loss, stop_price, take_profit = calc_trade_levels(
+        ema_cross,
+        stop_loss_column,
+        ema_x_strategy_table['open'].to_numpy(dtype=np.float64),
+        ema_x_strategy_table['close'].to_numpy(dtype=np.float64),
+        ema_x_strategy_table['high'].to_numpy(dtype=np.float64),
+        ema_x_strategy_table['low'].to_numpy(dtype=np.float64)
+    )
+
+    ema_x_strategy_table['stop_loss'] = stop_loss
+    ema_x_strategy_table['stop_price'] = stop_price
+    ema_x_strategy_table['take_profit'] = take_profit
+
+def calc_trade_levels(ema_cross, stop_loss, open_price, close_price, high, low):
+    """
+    Function to calculate the trade levels of every candle at once
+    :param ema_cross: Boolean array. True where the EMAs crossed
+    :param stop_loss: Float array. The long-term EMA of each candle
+    :param open_price: Float array. Open price of each candle
+    :param close_price: Float array. Close price of each candle
+    :param high: Float array. High price of each candle
+    :param low: Float array. Low price of each candle
+    :return: tuple of (stop_loss, stop_price, take_profit) arrays rounded to 2 decimals. Zero where there was no cross
+    """
+    ema_cross = np.asarray(ema_cross, dtype=bool)
+    stop_loss = np.asarray(stop_loss, dtype=np.float64)
+    open_price = np.asarray(open_price, dtype=np.float64)
+    close_price = np.asarray(close_price, dtype=np.float64)
+
+    # Green candle (BUY)
+    buy = ema_cross & (open_price < close_price)
+    # Red candle (SELL)
+    sell = ema_cross & (open_price > close_price)
+    # the open and close values can be the same for ema cross situations if the cross is triggered by a value that is less than a penny
+    skipped = ema_cross & ~buy & ~sell
+
+    if skipped.any():
+        print(f"An ema cross was detected, but for a trade less than a penny on {int(skipped.sum())} candle(s). Skipping trade.")
+
+    stop_price = np.where(buy, high, np.where(sell, low, 0.0))
+    # BUY: take_profit = stop_price + (stop_price - stop_loss). SELL: take_profit = stop_price - (stop_loss - stop_price)
+    take_profit = np.where(buy | sell, 2 * stop_price - stop_loss, 0.0)
+
+    return (
+        np.round(np.where(ema_cross, stop_loss, 0.0), 2),
+        np.round(stop_price, 2),
+        np.round(take_profit, 2)
+    )
 
 # Function to calculate the indicators for this strategy
 def calculate_indicators(ema_x_strategy_table, short_term_ema_length, long_term_ema_length):
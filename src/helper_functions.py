@@ -1,51 +1,154 @@
-def calc_lot_size(balance, risk_pct, stop_loss, stop_price, symbol):
+import math
+
+import numpy as np
+
+# Account currency lot sizes are converted to when a symbol spec doesn't say otherwise
+ACCOUNT_CURRENCY = "USD"
+
+# One row per symbol of the spec table calc_lot_sizes reads. quote_rate is the value of one unit
+# of the quote currency in the account currency. 0 means the base currency is the account
+# currency, so the rate is 1 / price
+SPEC_TABLE_DTYPE = np.dtype([
+    ('pip_size', '<f8'),
+    ('contract_size', '<f8'),
+    ('volume_min', '<f8'),
+    ('volume_max', '<f8'),
+    ('volume_step', '<f8'),
+    ('quote_rate', '<f8')
+])
+
+# Volume limits of the legacy pip model, used when no symbol spec is known
+LEGACY_VOLUME_MIN = 1.0
+LEGACY_VOLUME_MAX = 9.99
+
+def calc_lot_size(balance, risk_pct, stop_loss, stop_price, symbol, symbol_spec=None, account_currency=ACCOUNT_CURRENCY):
     """
     Calculates the lot size (volume) for `symbol`
 
-    :param balance   : Float.  The investment balance
-    :param risk_pct  : Float.  The amount to risk as a percentage
-    :param stop_loss : Float.  The losing exit price
-    :param stop_price: Float.  The gaining exit price
-    :param symbol    : String. The symbol name
+    :param balance    : Float.  The investment balance
+    :param risk_pct   : Float.  The amount to risk as a percentage
+    :param stop_loss  : Float.  The losing exit price
+    :param stop_price : Float.  The gaining exit price
+    :param symbol     : String. The symbol name
+    :param symbol_spec: Dict.   Optional symbol spec from mt5_lib.get_symbol_spec. When given, the lot size
+                                risks `risk_pct` of `balance` given the symbol's contract size and currencies,
+                                and is kept within the symbol's volume limits and step. Without it, or when
+                                the quote currency can't be converted, the legacy pip model is used
+    :param account_currency: String. Currency `balance` is in
     """
+    if symbol_spec and get_quote_rate(symbol_spec, account_currency) is not None:
+        return float(calc_lot_sizes(balance, risk_pct, stop_loss, stop_price, build_spec_table([symbol_spec], account_currency)))
 
-    # Get actual risk
-    currency_risk = balance * risk_pct
+    lot_size = float(calc_lot_sizes(balance, risk_pct, stop_loss, stop_price, get_legacy_spec_table([symbol])))
+
+    if symbol_spec:
+        lot_size = min(max(lot_size, symbol_spec["volume_min"]), symbol_spec["volume_max"])
+
+        # Round down to a whole number of volume steps
+        volume_step = symbol_spec["volume_step"]
+        if volume_step:
+            lot_size = round(math.floor(round(lot_size / volume_step, 6)) * volume_step, 2)
+
+    return lot_size
+
+def calc_lot_sizes(balance, risk_pct, stop_loss, stop_price, spec_table, symbol_index=None):
+    """
+    Calculates the lot sizes (volumes) of many trades at once, each risking `risk_pct` of `balance`
+    between its stop price and stop loss
 
-    # Format `symbol`
-    symbol_name = symbol.split(".")[0]
+    :param balance     : Float or float array. The investment balance
+    :param risk_pct    : Float or float array. The amount to risk as a percentage
+    :param stop_loss   : Float array. The losing exit prices
+    :param stop_price  : Float array. The gaining exit prices
+    :param spec_table  : SPEC_TABLE_DTYPE structured array, e.g. from build_spec_table
+    :param symbol_index: Integer array. Row of `spec_table` of every trade. Defaults to the first row for all trades
+    :return: float array of volumes, stepped down to each symbol's volume step and kept within its
+             volume limits. Zero where the stop price equals the stop loss
+    """
+    stop_loss = np.asarray(stop_loss, dtype=np.float64)
+    stop_price = np.asarray(stop_price, dtype=np.float64)
+    specs = spec_table[0] if symbol_index is None else spec_table[np.asarray(symbol_index, dtype=np.int64)]
 
-    if symbol_name == "USDJPY":
+    # Get actual risk
+    currency_risk = np.asarray(balance, dtype=np.float64) * risk_pct
 
-        # Known constant. More info: https://www.investopedia.com/terms/p/pip.asp#:~:text=In%20this%20case%2C%20the%20value,The%20pip%20value%20is%20%241.
-        pip_size = 0.01
+    # Account currency value of one pip on one lot
+    quote_rate = np.where(specs["quote_rate"] > 0, specs["quote_rate"], 1 / np.where(stop_price != 0, stop_price, np.nan))
+    pip_value = specs["pip_size"] * specs["contract_size"] * quote_rate
 
-        pip_risk = abs((stop_price - stop_loss) / pip_size)
-        pip_value = currency_risk / pip_risk * stop_price
+    pip_risk = np.abs(stop_price - stop_loss) / specs["pip_size"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        raw_lot_size = currency_risk / (pip_risk * pip_value)
 
-        raw_lot_size = pip_value / 1000
-    
-    elif symbol_name == "USDCAD":
-        pip_size = 0.0001
+    # Round down to a whole number of volume steps. A zero step rounds to 2 decimals
+    volume_step = specs["volume_step"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stepped = np.floor(np.round(raw_lot_size / volume_step, 6)) * volume_step
+    lot_size = np.round(np.where(volume_step > 0, stepped, raw_lot_size), 2)
+    lot_size = np.clip(lot_size, specs["volume_min"], specs["volume_max"])
 
-        pip_risk = abs((stop_price - stop_loss) / pip_size)
-        pip_value = currency_risk / pip_risk * stop_price
+    return np.where(np.isfinite(raw_lot_size), lot_size, 0.0)
+
+def get_quote_rate(symbol_spec, account_currency=ACCOUNT_CURRENCY, quote_rates=None):
+    """
+    :param symbol_spec: Dict. Symbol spec from mt5_lib.get_symbol_spec
+    :param account_currency: String. Currency of the account
+    :param quote_rates: Dict. Optional value of one unit of other currencies in the account currency
+    :return: the quote_rate of the spec table row of `symbol_spec`. None if it can't be converted
+    """
+    quote_currency = symbol_spec.get("currency_profit")
+    if quote_currency == account_currency:
+        return 1.0
+    if symbol_spec.get("currency_base") == account_currency:
+        return 0.0
+    if quote_rates and quote_currency in quote_rates:
+        return float(quote_rates[quote_currency])
+    return None
 
-        raw_lot_size = pip_value / 1000
+def build_spec_table(symbol_specs, account_currency=ACCOUNT_CURRENCY, quote_rates=None):
+    """
+    Builds the spec table calc_lot_sizes reads
 
-    else:
-        pip_size = 0.0001
+    :param symbol_specs: List of symbol spec dicts from mt5_lib.get_symbol_spec. A spec may also set pip_size
+    :param account_currency: String. Currency of the account
+    :param quote_rates: Dict. Optional value of one unit of other currencies in the account currency
+    :return: SPEC_TABLE_DTYPE structured array, one row per spec
+    """
+    spec_table = np.zeros(len(symbol_specs), dtype=SPEC_TABLE_DTYPE)
+    for n, symbol_spec in enumerate(symbol_specs):
+        quote_rate = get_quote_rate(symbol_spec, account_currency, quote_rates)
+        if quote_rate is None:
+            raise ValueError(f"No {account_currency} rate for quote currency {symbol_spec.get('currency_profit')}")
 
-        pip_risk = abs((stop_price - stop_loss) / pip_size)
-        pip_value = currency_risk / pip_risk
+        pip_size = symbol_spec.get("pip_size")
+        if not pip_size:
+            # A pip is the second to last digit on 3 and 5 digit quotes and the last digit otherwise
+            pip_size = symbol_spec["point"] * 10 if symbol_spec["digits"] in (3, 5) else symbol_spec["point"]
 
-        raw_lot_size = pip_value / 1000
+        spec_table[n] = (
+            pip_size,
+            symbol_spec["trade_contract_size"],
+            symbol_spec["volume_min"],
+            symbol_spec["volume_max"],
+            symbol_spec["volume_step"],
+            quote_rate
+        )
+    return spec_table
 
-    lot_size = float(raw_lot_size)
-    lot_size = round(lot_size, 2)
+def get_legacy_spec_table(symbols):
+    """
+    Builds spec table rows that reproduce the original hard-coded pip model: a 0.01 pip on USDJPY and a
+    0.0001 pip on every other symbol, a 1000 pip value divisor, USDJPY and USDCAD priced in the base
+    currency, and lot sizes rounded to 2 decimals within [1.0, 9.99]
 
-    if lot_size >= 10:
-        lot_size = 9.99
-    elif lot_size < 1.0:
-        lot_size = 1.0
-    return lot_size
\ No newline at end of file
+    :param symbols: List of symbol names
+    :return: SPEC_TABLE_DTYPE structured array, one row per symbol
+    """
+    spec_table = np.zeros(len(symbols), dtype=SPEC_TABLE_DTYPE)
+    for n, symbol in enumerate(symbols):
+        # Format `symbol`
+        symbol_name = symbol.split(".")[0]
+        pip_size = 0.01 if symbol_name == "USDJPY" else 0.0001
+        quote_rate = 0.0 if symbol_name in ("USDJPY", "USDCAD") else 1.0
+        spec_table[n] = (pip_size, 1000 / pip_size, LEGACY_VOLUME_MIN, LEGACY_VOLUME_MAX, 0.0, quote_rate)
+    return spec_table
@@ -1,6 +1,10 @@
 import numpy as np
+import pandas
+
+import instrumentation
 import utils
 
+@instrumentation.timed("calc_ema")
 def calc_ema(ema_x_strategy_table, ema_size):
     """
     Calculates the Exponential Moving Average (EMA) of size `ema_size`
@@ -12,26 +16,46 @@ def calc_ema(ema_x_strategy_table, ema_size):
     # Column name to append to dataframe
     ema_name = utils.get_ema_name(ema_size)
 
+    # Hand the close column to the EMA engine as one contiguous float64 array
+    close = np.ascontiguousarray(ema_x_strategy_table['close'].to_numpy(dtype=np.float64))
+
+    ema_x_strategy_table[ema_name] = calc_ema_array(close, ema_size)
+
+def calc_ema_array(close, ema_size):
+    """
+    Calculates the Exponential Moving Average (EMA) of size `ema_size`
+    over a whole array of close prices in one pass.
+
+    Row `ema_size` is seeded with the Simple Moving Average (SMA) of the first
+    `ema_size` closes and every later row follows the EMA recursion. Rows 0 to
+    ema_size-1 are warm-up rows and are set to 0.00.
+
+    :param `close`: Array-like of close prices
+    :param `ema_size`: The EMA size
+    :return: numpy float64 array of the same length as `close`
+    """
+    close = np.asarray(close, dtype=np.float64)
+    ema_values = np.zeros(len(close), dtype=np.float64)
+
+    # Not enough rows to seed the EMA, everything is warm-up
+    if len(close) <= ema_size:
+        return ema_values
+
     # Create EMA multiplier
     multiplier = 2/(ema_size + 1)
 
-    # Calculate the Simple Moving Average (SMA)
-    initial_mean = ema_x_strategy_table['close'].head(ema_size).mean()
-
-    # Loop through each row of dataframe
-    for i in range(len(ema_x_strategy_table)):
-        # Set SMA
-        if i == ema_size:
-            ema_x_strategy_table.loc[i, ema_name] = initial_mean
-        # If i is > ema_size set EMA
-        elif i > ema_size:
-            ema_value = ema_x_strategy_table.loc[i, 'close'] * multiplier + ema_x_strategy_table.loc[i - 1, ema_name]*(1 - multiplier)
-            ema_x_strategy_table.loc[i, ema_name] = ema_value
-        # Disregard rows 0 to ema_size-1
-        else:
-            ema_x_strategy_table.loc[i, ema_name] = 0.00
+    # The recursion is run as an adjust=False exponentially weighted mean whose
+    # first input is the SMA seed, which is the same filter as
+    # ema[i] = close[i] * multiplier + ema[i - 1] * (1 - multiplier)
+    filter_input = close[ema_size:].copy()
+    filter_input[0] = close[:ema_size].mean()
+
+    ema_values[ema_size:] = pandas.Series(filter_input, copy=False).ewm(alpha=multiplier, adjust=False).mean().to_numpy()
+
+    return ema_values
 
 # Function to calculate a crossover event between two EMAs
+@instrumentation.timed("ema_cross_calc")
 def ema_cross_calc(ema_x_strategy_table, short_term_ema_length, long_term_ema_length):
     """
     Function to calculate an  event. 
@@ -56,4 +80,130 @@ def ema_cross_calc(ema_x_strategy_table, short_term_ema_length, long_term_ema_le
     ema_x_strategy_table['ema_cross'] = np.where(ema_x_strategy_table['position'] == ema_x_strategy_table['pre_position'], False, True)
     # Drop the position and pre_position columns => uses ".drop"
     ema_x_strategy_table.drop(columns="position", inplace=True)
-    ema_x_strategy_table.drop(columns="pre_position", inplace=True)
\ No newline at end of file
+    ema_x_strategy_table.drop(columns="pre_position", inplace=True)
+
+class IncrementalEma:
+    """
+    Exponential Moving Average (EMA) of size `ema_size` that is seeded once from
+    history and then advanced one close at a time
+    """
+
+    def __init__(self, ema_size):
+        """
+        :param `ema_size`: The EMA size
+        """
+        self.ema_size = ema_size
+        self.multiplier = 2/(ema_size + 1)
+        self.value = 0.00
+        self.ready = False
+
+    def seed(self, close):
+        """
+        Seeds the EMA from an array of close prices, oldest first
+        :param `close`: Array-like of close prices
+        """
+        ema_values = calc_ema_array(close, self.ema_size)
+        self.value = float(ema_values[-1]) if len(ema_values) > 0 else 0.00
+        # The last value is only a real EMA once the warm-up rows are behind us
+        self.ready = len(ema_values) > self.ema_size
+
+    def update(self, close):
+        """
+        Advances the EMA by one close price in O(1)
+        :param `close`: The close price of the new candle
+        :return: The updated EMA value
+        """
+        self.value = self.peek(close)
+        return self.value
+
+    def peek(self, close):
+        """
+        :param `close`: The close price so far of the forming candle
+        :return: The EMA value the candle would give if it closed at `close`. The EMA is left unchanged
+        """
+        return float(close) * self.multiplier + self.value * (1 - self.multiplier)
+
+class IncrementalEmaCross:
+    """
+    Short-term and long-term EMA pair for one symbol and timeframe. Keeps the last
+    EMA values, the last position (short-term EMA above long-term EMA) and the time
+    of the last candle, so a new candle can be folded in without recomputing history
+    """
+
+    def __init__(self, short_term_ema_length, long_term_ema_length):
+        """
+        :param short_term_ema_length: length of short-term ema
+        :param long_term_ema_length: length of long-term ema
+        """
+        self.short_term_ema = IncrementalEma(short_term_ema_length)
+        self.long_term_ema = IncrementalEma(long_term_ema_length)
+        self.position = None
+        self.last_time = None
+
+    @property
+    def ready(self):
+        return self.short_term_ema.ready and self.long_term_ema.ready and self.last_time is not None
+
+    def seed(self, ema_x_strategy_table):
+        """
+        Seeds the state from a table that already holds the raw data and ema calculations
+        :param `ema_x_strategy_table`: The table which holds the raw data and ema strategy calculations
+        """
+        if len(ema_x_strategy_table) == 0:
+            self.last_time = None
+            return
+
+        self.seed_from_row(ema_x_strategy_table.iloc[-1])
+
+    def seed_from_row(self, last_row):
+        """
+        Seeds the state from the last row of the raw data and ema calculations
+        :param `last_row`: Row (series or dict) holding the time and ema columns of the latest candle
+        """
+        short_term_ema_column = utils.get_ema_name(self.short_term_ema.ema_size)
+        long_term_ema_column = utils.get_ema_name(self.long_term_ema.ema_size)
+
+        self.short_term_ema.value = float(last_row[short_term_ema_column])
+        self.long_term_ema.value = float(last_row[long_term_ema_column])
+        # Warm-up rows are zero-filled by calc_ema
+        self.short_term_ema.ready = self.short_term_ema.value != 0.00
+        self.long_term_ema.ready = self.long_term_ema.value != 0.00
+
+        self.position = self.short_term_ema.value > self.long_term_ema.value
+        self.last_time = last_row['time']
+
+    def peek(self, close):
+        """
+        Evaluates the forming candle as if it closed at `close`, without folding it in
+        :param close: close price so far of the forming candle
+        :return: tuple of (short-term EMA, long-term EMA, Boolean. True if the EMAs would cross on this candle)
+        """
+        short_term_ema = self.short_term_ema.peek(close)
+        long_term_ema = self.long_term_ema.peek(close)
+        ema_cross = self.position is not None and (short_term_ema > long_term_ema) != self.position
+        return short_term_ema, long_term_ema, ema_cross
+
+    def update(self, candle_time, close):
+        """
+        Folds one new candle into both EMAs and the position
+        :param candle_time: time of the new candle
+        :param close: close price of the new candle
+        :return: Boolean. True if the EMAs crossed on this candle. Otherwise, False
+        """
+        self.short_term_ema.update(close)
+        self.long_term_ema.update(close)
+        return self.update_position(candle_time)
+
+    def update_position(self, candle_time):
+        """
+        Folds the position of the EMAs after both were updated with a new candle
+        :param candle_time: time of the new candle
+        :return: Boolean. True if the EMAs crossed on this candle. Otherwise, False
+        """
+        position = self.short_term_ema.value > self.long_term_ema.value
+        ema_cross = self.position is not None and position != self.position
+
+        self.position = position
+        self.last_time = candle_time
+
+        return ema_cross
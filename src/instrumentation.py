@@ -0,0 +1,228 @@
+"""
+Latency instrumentation for the candle-to-order pipeline.
+
+Stages are timed with the monotonic clock and counted into fixed-bucket histograms per
+(stage, symbol), kept in memory and exported in the Prometheus text format. When disabled,
+a span or timed call costs one global flag check.
+"""
+import bisect
+import functools
+import http.server
+import os
+import threading
+import time
+
+# Upper bounds in seconds of the histogram buckets. A final +Inf bucket catches the rest
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_NAME = "bbstrader_stage_latency_seconds"
+
+enabled = False
+
+# (stage, symbol) -> [bucket counts, sum of seconds, count]
+histograms = {}
+histograms_lock = threading.Lock()
+
+# Symbol tag of the current thread, used by stages that don't know their symbol
+thread_context = threading.local()
+
+def enable(on=True):
+    """
+    Turns instrumentation on or off
+    """
+    global enabled
+    enabled = on
+
+def reset():
+    """
+    Clears every histogram
+    """
+    with histograms_lock:
+        histograms.clear()
+
+def record(stage, symbol, seconds):
+    """
+    Counts one `seconds` long run of `stage` for `symbol`
+    """
+    with histograms_lock:
+        histogram = histograms.get((stage, symbol))
+        if histogram is None:
+            histogram = histograms[(stage, symbol)] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        histogram[0][bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+def drain():
+    """
+    Takes every histogram, leaving them cleared, e.g. to hand them to another process
+    :return: dict of (stage, symbol) to [bucket counts, sum of seconds, count]
+    """
+    global histograms
+    with histograms_lock:
+        taken = histograms
+        histograms = {}
+    return taken
+
+def merge(other_histograms):
+    """
+    Adds the counts of histograms taken with drain, e.g. in another process
+    :param other_histograms: dict of (stage, symbol) to [bucket counts, sum of seconds, count]
+    """
+    with histograms_lock:
+        for key, (counts, total, count) in other_histograms.items():
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+            histogram[1] += total
+            histogram[2] += count
+
+def get_symbol():
+    """
+    :return: symbol tag of the current thread. Empty string if none
+    """
+    return getattr(thread_context, "symbol", "")
+
+class SymbolTag:
+    """
+    Tags every stage timed in the current thread with `symbol` while active
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = get_symbol()
+        thread_context.symbol = self.symbol
+        return self
+
+    def __exit__(self, *exc_info):
+        thread_context.symbol = self.previous
+        return False
+
+class Span:
+    """
+    Times a block of code as one run of `stage`
+    """
+
+    def __init__(self, stage, symbol=None):
+        self.stage = stage
+        self.symbol = symbol
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.stage, self.symbol if self.symbol is not None else get_symbol(), time.perf_counter() - self.start)
+        return False
+
+class NullSpan:
+    """
+    Span that does nothing, handed out while instrumentation is disabled
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = NullSpan()
+
+def span(stage, symbol=None):
+    """
+    :param stage: string name of the pipeline stage
+    :param symbol: string of the symbol. Defaults to the current thread's symbol tag
+    :return: context manager timing the block as one run of `stage`
+    """
+    if not enabled:
+        return NULL_SPAN
+    return Span(stage, symbol)
+
+def tag(symbol):
+    """
+    :return: context manager tagging the stages timed in the current thread with `symbol`
+    """
+    if not enabled:
+        return NULL_SPAN
+    return SymbolTag(symbol)
+
+def timed(stage, symbol_arg=None):
+    """
+    Decorator timing every call of a function as one run of `stage`
+    :param stage: string name of the pipeline stage
+    :param symbol_arg: position of the symbol argument. Defaults to the current thread's symbol tag
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            symbol = args[symbol_arg] if symbol_arg is not None and len(args) > symbol_arg else None
+            with Span(stage, symbol):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def export_prometheus():
+    """
+    :return: every histogram in the Prometheus text exposition format
+    """
+    with histograms_lock:
+        snapshot = [(key, list(histogram[0]), histogram[1], histogram[2]) for key, histogram in sorted(histograms.items())]
+
+    lines = [
+        f"# HELP {METRIC_NAME} Latency of each candle-to-order pipeline stage.",
+        f"# TYPE {METRIC_NAME} histogram"
+    ]
+    for (stage, symbol), counts, total, count in snapshot:
+        labels = f'stage="{stage}",symbol="{symbol}"'
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{METRIC_NAME}_sum{{{labels}}} {total}")
+        lines.append(f"{METRIC_NAME}_count{{{labels}}} {count}")
+    return "\n".join(lines) + "\n"
+
+def write_metrics(file_path):
+    """
+    Writes the Prometheus text export to `file_path`, replacing it atomically
+    """
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w", encoding="utf8") as file:
+        file.write(export_prometheus())
+    os.replace(temp_path, file_path)
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the Prometheus text export on /metrics
+    """
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = export_prometheus().encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep scrapes out of the console
+        pass
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """
+    Serves the Prometheus text export on http://host:port/metrics from a daemon thread
+    :return: the running http.server.ThreadingHTTPServer
+    """
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
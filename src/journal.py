@@ -0,0 +1,336 @@
+"""
+Append-only journal of the trading decisions: signals, order intents, order_check and order_send
+results, cancels and modifies.
+
+Events are fixed-width EVENT_DTYPE records, queued by the trading threads and appended to one file
+per UTC day by a background writer thread, so the trading path never waits on disk. Events get
+their time under a lock as they are queued, so every day file is sorted by time and a time range
+is found by binary search. When the journal isn't started, recording an event costs one global check.
+"""
+import argparse
+import atexit
+import datetime
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas
+
+import utils
+
+# Directory of the journal files
+JOURNAL_PATH = "./journal"
+
+# Event kinds
+SIGNAL = 1
+INTENT = 2
+CHECK = 3
+SEND = 4
+CANCEL = 5
+MODIFY = 6
+
+KIND_NAMES = {SIGNAL: "signal", INTENT: "intent", CHECK: "check", SEND: "send", CANCEL: "cancel", MODIFY: "modify"}
+
+# Side of a signal or order
+BUY = 1
+SELL = -1
+
+# Retcode of a check or send the terminal didn't answer
+NO_ANSWER = -1
+
+EVENT_DTYPE = np.dtype([
+    ('time', '<i8'),         # nanoseconds since epoch, UTC
+    ('kind', 'u1'),
+    ('side', 'i1'),
+    ('symbol', 'S16'),
+    ('comment', 'S16'),      # MetaTrader 5 keeps 16 characters of an order comment
+    ('ticket', '<u8'),
+    ('volume', '<f8'),
+    ('price', '<f8'),
+    ('stop_loss', '<f8'),
+    ('take_profit', '<f8'),
+    ('retcode', '<i4')
+])
+
+NANOSECONDS_PER_DAY = 24 * 60 * 60 * 10**9
+
+# Most events the writer appends at once
+BATCH_SIZE = 4096
+
+writer = None
+
+def get_day_path(root_path, day):
+    """
+    :param day: integer days since epoch
+    :return: file path of the events of `day`
+    """
+    date = datetime.date(1970, 1, 1) + datetime.timedelta(days=int(day))
+    return os.path.join(root_path, f"{date.isoformat()}.bin")
+
+def get_side(order_type):
+    """
+    :param order_type: string order type of an intent, e.g. BUY_STOP, or MetaTrader 5 order type constant
+    :return: BUY, SELL or 0 if unknown
+    """
+    if isinstance(order_type, str):
+        return BUY if order_type.startswith("BUY") else SELL if order_type.startswith("SELL") else 0
+    # MetaTrader 5 numbers buy types even and sell types odd
+    return BUY if order_type % 2 == 0 else SELL
+
+class JournalWriter:
+    """
+    Queues events from any thread and appends them in batches from one background thread
+    """
+
+    def __init__(self, root_path, batch_size=BATCH_SIZE):
+        """
+        :param root_path: directory the day files are kept in
+        :param batch_size: most events appended at once
+        """
+        self.root_path = root_path
+        self.batch_size = batch_size
+        self.events = queue.SimpleQueue()
+        # Stamps and queues an event in one step, so events reach the files in time order
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name="journal", daemon=True)
+        self.written = 0
+
+    def start(self):
+        os.makedirs(self.root_path, exist_ok=True)
+        self.thread.start()
+
+    def record(self, fields):
+        """
+        Queues one event
+        :param fields: tuple of the EVENT_DTYPE fields after time
+        """
+        with self.lock:
+            self.events.put((time.time_ns(),) + fields)
+
+    def stop(self):
+        """
+        Writes the queued events and stops the writer thread
+        """
+        self.events.put(None)
+        self.thread.join()
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.events.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.events.get_nowait())
+                except queue.Empty:
+                    break
+
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+            if batch:
+                try:
+                    self.write(batch)
+                except Exception as e:
+                    print(f"Unable to write {len(batch)} journal event(s). Error: {e}")
+
+    def write(self, batch):
+        """
+        Appends events to the files of their days
+        :param batch: list of event tuples, oldest first
+        """
+        records = np.array(batch, dtype=EVENT_DTYPE)
+        days = records['time'] // NANOSECONDS_PER_DAY
+        for day in np.unique(days):
+            path = get_day_path(self.root_path, day)
+            # Drop a partially written record left behind by an interrupted append
+            if os.path.exists(path) and os.path.getsize(path) % EVENT_DTYPE.itemsize:
+                with open(path, "r+b") as file:
+                    file.truncate(os.path.getsize(path) // EVENT_DTYPE.itemsize * EVENT_DTYPE.itemsize)
+            with open(path, "ab") as file:
+                file.write(records[days == day].tobytes())
+        self.written += len(records)
+
+def start(root_path=JOURNAL_PATH):
+    """
+    Starts journaling to `root_path`. Queued events are written on exit
+    """
+    global writer
+    if writer is not None:
+        stop()
+    writer = JournalWriter(root_path)
+    writer.start()
+    atexit.register(stop)
+
+def stop():
+    """
+    Writes the queued events and stops journaling
+    """
+    global writer
+    if writer is None:
+        return
+    stopped_writer, writer = writer, None
+    stopped_writer.stop()
+
+def record(kind, symbol, comment="", ticket=0, side=0, volume=0.0, price=0.0, stop_loss=0.0, take_profit=0.0, retcode=0):
+    """
+    Queues one event. Does nothing unless the journal is started
+    :param kind: SIGNAL, INTENT, CHECK, SEND, CANCEL or MODIFY
+    :param symbol: string of the symbol
+    :param comment: string of the strategy's order comment
+    :param ticket: integer order ticket. 0 if there is none yet
+    :param side: BUY, SELL or 0
+    :param retcode: integer retcode of the terminal's answer. NO_ANSWER if it didn't answer
+    """
+    if writer is None:
+        return
+    writer.record((
+        kind, side, symbol or "", comment or "", ticket or 0,
+        float(volume or 0.0), float(price or 0.0), float(stop_loss or 0.0), float(take_profit or 0.0), retcode
+    ))
+
+def record_request(kind, request, result, ticket=0):
+    """
+    Queues the outcome of an order_check or order_send. Does nothing unless the journal is started
+    :param kind: CHECK, SEND, CANCEL or MODIFY
+    :param request: dict of the MetaTrader 5 trade request
+    :param result: the terminal's answer. None if it didn't answer
+    :param ticket: integer order ticket. Defaults to the ticket of the answer of a SEND or MODIFY. A CHECK has none
+    """
+    if writer is None:
+        return
+    # Only an OrderSendResult holds a ticket, at index 2. That index of an OrderCheckResult is the equity
+    if not ticket and kind in (SEND, MODIFY) and result is not None:
+        ticket = result[2]
+    record(
+        kind,
+        request.get("symbol"),
+        request.get("comment", ""),
+        ticket,
+        get_side(request["type"]) if "type" in request else 0,
+        request.get("volume"),
+        request.get("price") if isinstance(request.get("price"), float) else 0.0,
+        request.get("sl"),
+        request.get("tp"),
+        NO_ANSWER if result is None else result[0]
+    )
+
+class JournalReader:
+    """
+    Queries the journal files. Day files are picked by file name and searched by time with a binary
+    search, then filtered with vectorized comparisons over the memory-mapped records
+    """
+
+    def __init__(self, root_path=JOURNAL_PATH):
+        """
+        :param root_path: directory the day files are kept in
+        """
+        self.root_path = root_path
+
+    def get_paths(self, start=None, end=None):
+        """
+        :param start: nanoseconds since epoch of the first event wanted. None for the oldest
+        :param end: nanoseconds since epoch after the last event wanted. None for the newest
+        :return: list of the paths of the day files in the range, oldest first
+        """
+        if not os.path.isdir(self.root_path):
+            return []
+        names = sorted(name for name in os.listdir(self.root_path) if name.endswith(".bin"))
+        paths = []
+        for name in names:
+            day = (datetime.date.fromisoformat(name[:-4]) - datetime.date(1970, 1, 1)).days
+            if start is not None and (day + 1) * NANOSECONDS_PER_DAY <= start:
+                continue
+            if end is not None and day * NANOSECONDS_PER_DAY >= end:
+                continue
+            paths.append(os.path.join(self.root_path, name))
+        return paths
+
+    def read(self, path):
+        """
+        Memory-maps the complete events of one day file
+        :return: read-only numpy structured array of EVENT_DTYPE records
+        """
+        count = os.path.getsize(path) // EVENT_DTYPE.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=EVENT_DTYPE)
+        return np.memmap(path, dtype=EVENT_DTYPE, mode='r', shape=(count,))
+
+    def query(self, symbol=None, start=None, end=None, ticket=None, kinds=None, comment=None):
+        """
+        :param symbol: string of the symbol. None for every symbol
+        :param start: seconds since epoch of the first event wanted. None for the oldest
+        :param end: seconds since epoch after the last event wanted. None for the newest
+        :param ticket: integer order ticket. None for every event
+        :param kinds: list of event kinds. None for every kind
+        :param comment: string of the strategy's order comment. None for every strategy
+        :return: numpy structured array of the matching EVENT_DTYPE records, oldest first
+        """
+        start = None if start is None else int(start * 10**9)
+        end = None if end is None else int(end * 10**9)
+
+        matches = []
+        for path in self.get_paths(start, end):
+            events = self.read(path)
+            times = events['time']
+            first = 0 if start is None else np.searchsorted(times, start, side='left')
+            last = len(events) if end is None else np.searchsorted(times, end, side='left')
+            events = events[first:last]
+
+            mask = np.ones(len(events), dtype=bool)
+            if symbol is not None:
+                mask &= events['symbol'] == symbol.encode()
+            if comment is not None:
+                mask &= events['comment'] == comment.encode()
+            if ticket is not None:
+                mask &= events['ticket'] == ticket
+            if kinds is not None:
+                mask &= np.isin(events['kind'], list(kinds))
+            matches.append(np.array(events[mask]))
+
+        if not matches:
+            return np.zeros(0, dtype=EVENT_DTYPE)
+        return np.concatenate(matches)
+
+def to_frame(events):
+    """
+    :param events: numpy structured array of EVENT_DTYPE records
+    :return: dataframe of the events with readable times, kinds and strings
+    """
+    frame = pandas.DataFrame(events)
+    frame['time'] = pandas.to_datetime(frame['time'], unit='ns', utc=True)
+    frame['kind'] = frame['kind'].map(KIND_NAMES)
+    frame['symbol'] = frame['symbol'].str.decode('ascii')
+    frame['comment'] = frame['comment'].str.decode('ascii')
+    return frame
+
+def main():
+    """
+    Prints the journal events matching the given filters
+    """
+    parser = argparse.ArgumentParser(description="Query the trade and signal journal")
+    parser.add_argument("--path", default=JOURNAL_PATH, help="journal directory")
+    parser.add_argument("--symbol")
+    parser.add_argument("--comment", help="order comment of the strategy")
+    parser.add_argument("--ticket", type=int)
+    parser.add_argument("--kind", nargs="+", choices=list(KIND_NAMES.values()))
+    parser.add_argument("--from", dest="date_from", type=utils.parse_date, help="YYYY-MM-DD or YYYY-MM-DD HH:MM, UTC")
+    parser.add_argument("--to", dest="date_to", type=utils.parse_date, help="YYYY-MM-DD or YYYY-MM-DD HH:MM, UTC")
+    parser.add_argument("--csv", help="write the events to this CSV file instead of printing them")
+    args = parser.parse_args()
+
+    kinds = None if args.kind is None else [kind for kind, name in KIND_NAMES.items() if name in args.kind]
+    events = JournalReader(args.path).query(args.symbol, args.date_from, args.date_to, args.ticket, kinds, args.comment)
+    frame = to_frame(events)
+
+    if args.csv:
+        frame.to_csv(args.csv, index=False)
+        print(f"{len(frame)} event(s) written to {args.csv}.")
+    else:
+        pandas.set_option('display.max_columns', None)
+        pandas.set_option('display.width', None)
+        print(frame.to_string(index=False))
+
+if __name__ == '__main__':
+    main()
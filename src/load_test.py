@@ -0,0 +1,75 @@
+import argparse
+import contextlib
+import io
+import os
+import time
+
+import numpy as np
+
+def main():
+    """
+    Load-tests the strategy loop against the simulated broker and prints cycle and order-placement latency
+    """
+    parser = argparse.ArgumentParser(description="Load-test run_strategy against the simulated MetaTrader 5 broker")
+    parser.add_argument("--symbols", type=int, default=200, help="number of simulated symbols")
+    parser.add_argument("--cycles", type=int, default=20, help="number of candle closes to simulate")
+    parser.add_argument("--latency", type=float, default=0.001, help="seconds every MetaTrader 5 call takes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds added to every call")
+    parser.add_argument("--sequential", action="store_true", help="run symbols one after another instead of in parallel")
+    parser.add_argument("--pool-size", type=int, default=16)
+    args = parser.parse_args()
+
+    # Must be set before mt5_lib is imported
+    os.environ["BBSTRADER_SIMULATED_BROKER"] = "1"
+    import sim_mt5
+    import main as bot
+
+    broker = sim_mt5.configure(latency=args.latency, latency_jitter=args.jitter)
+    symbols = [f"SIM{number:04d}" for number in range(args.symbols)]
+    for symbol in symbols:
+        broker.add_symbol(symbol)
+
+    json_settings = {
+        "mt5": {
+            "symbols": symbols,
+            "timeframe": "one_minute",
+            "parallel": not args.sequential,
+            "pool_size": args.pool_size
+        }
+    }
+
+    cycle_times = []
+    order_latencies = []
+    failed_cycles = 0
+    for _ in range(args.cycles):
+        # A candle closes
+        broker.advance(60)
+        sends_before = len(broker.send_log)
+        start = time.monotonic()
+
+        # Sequential mode stops a cycle at the first rejected order, like the live bot
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                bot.run_strategy(json_settings)
+        except Exception:
+            failed_cycles += 1
+
+        cycle_times.append(time.monotonic() - start)
+        order_latencies.extend(sent_at - start for sent_at, _, _ in broker.send_log[sends_before:])
+
+    print(f"symbols: {args.symbols}, cycles: {args.cycles}, latency: {args.latency * 1000:.1f} ms, mode: {'sequential' if args.sequential else 'parallel'}, failed cycles: {failed_cycles}")
+    print_percentiles("cycle time", cycle_times)
+    print_percentiles("candle close to order_send return", order_latencies)
+
+def print_percentiles(name, values):
+    """
+    Prints the p50, p95 and max of `values` in milliseconds
+    """
+    if not values:
+        print(f"{name}: no samples")
+        return
+    values = np.asarray(values) * 1000
+    print(f"{name} ({len(values)} samples): p50 {np.percentile(values, 50):.1f} ms, p95 {np.percentile(values, 95):.1f} ms, max {values.max():.1f} ms")
+
+if __name__ == '__main__':
+    main()
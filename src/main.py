@@ -1,15 +1,43 @@
+import asyncio
+import functools
 import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas
 
+from async_runtime import AsyncRuntime, DEFAULT_CALL_TIMEOUT
 import mt5_lib as trader
 import ema_cross_strategy as strats
+import instrumentation
+import journal
+from candle_store import CandleStore
+from connection_manager import ConnectionManager, DEFAULT_RECONNECT_ATTEMPTS, DEFAULT_RECONNECT_MAX_DELAY
+from resampler import M1BarFeed
+import strategy
+from scheduler import CandleScheduler
+from screener import Screener
+from tick_stream import TickStream, DEFAULT_ADJUST_INTERVAL, DEFAULT_POLL_INTERVAL
 
 # Path to MetaTrader5 login details.
 ACCOUNT_SETTINGS_PATH = "./settings.json"
 CREDENTIALS_FILE_PATH = "./credentials.json"
 
+# EMA Cross strategy parameters
+SHORT_TERM_EMA_LENGTH = 1
+LONG_TERM_EMA_LENGTH = 2
+BALANCE = 10000
+RISK_PCT = 0.03
+
+# Number of symbols processed at once in parallel mode when settings.json doesn't set one
+DEFAULT_POOL_SIZE = 8
+
+# Candles and indicators shared by the strategies configured in settings.json
+indicator_cache = strategy.IndicatorCache()
+
+# EMA Cross strategy evaluated for every symbol in one pass, in screener mode
+ema_screener = Screener(SHORT_TERM_EMA_LENGTH, LONG_TERM_EMA_LENGTH)
+
 
 def get_json_from_file(file_path: str) -> dict:
     """
@@ -28,18 +56,22 @@ def get_json_from_file(file_path: str) -> dict:
 
     raise FileExistsError(f"Could not locate resource: {file_path}")
 
-def run_strategy(json_settings):
+def run_strategy(json_settings, symbols_arr=None, timeframe=None, on_results=None):
     """
     Function to execute the stategy in main
     :param json_settings: json of project settings
-    :param credentials: json of user credentials
+    :param symbols_arr: list of symbols to run. Defaults to the settings.json symbols
+    :param timeframe: string of the timeframe to run. Defaults to the settings.json timeframe
+    :param on_results: function called with the dict of symbol to order outcome. Defaults to report_results
     :return: Boolean. True if strategy ran successfully with no errors. Else False.
     """
     # Get symbols array from settings.json
-    symbols_arr = json_settings["mt5"]["symbols"]
+    if symbols_arr is None:
+        symbols_arr = json_settings["mt5"]["symbols"]
 
     # Get timeframe from settings.json
-    timeframe=json_settings["mt5"]["timeframe"]
+    if timeframe is None:
+        timeframe=json_settings["mt5"]["timeframe"]
 
     # Initialize all symbols
     for symbol in symbols_arr:
@@ -48,18 +80,178 @@ def run_strategy(json_settings):
         except Exception as e:
             print(e)
     
-    # Get a table of ema calculations for every initialized symbol
+    # Run the configured strategies on shared candles and indicators
+    strategy_settings = json_settings["mt5"].get("strategies")
+    if strategy_settings:
+        strategies = [strategy.create_strategy(settings, BALANCE, RISK_PCT) for settings in strategy_settings]
+        pool_size = json_settings["mt5"].get("pool_size", DEFAULT_POOL_SIZE) if json_settings["mt5"].get("parallel", False) else 1
+        results = strategy.run_strategies(strategies, symbols_arr, timeframe, indicator_cache, pool_size)
+        (on_results or report_results)({f"{symbol} ({comment})": order_number for (symbol, comment), order_number in results.items()})
+        return True
+
+    # Run the strategy for every initialized symbol
+    if json_settings["mt5"].get("screener", False):
+        results = run_screener(symbols_arr, timeframe)
+    elif json_settings["mt5"].get("parallel", False):
+        pool_size = json_settings["mt5"].get("pool_size", DEFAULT_POOL_SIZE)
+        results = run_symbols_in_parallel(symbols_arr, timeframe, pool_size)
+    else:
+        results = {}
+        for symbol in symbols_arr:
+            # Trade type from the strategy
+            results[symbol] = strats.ema_cross_strategy(symbol, timeframe, SHORT_TERM_EMA_LENGTH, LONG_TERM_EMA_LENGTH, BALANCE, RISK_PCT)
+
+    # Console output
+    (on_results or report_results)({symbol: results.get(symbol) for symbol in symbols_arr})
+
+    return True
+
+def run_symbols_in_parallel(symbols_arr, timeframe, pool_size):
+    """
+    Function to run the strategy for many symbols at once. Candle fetching and indicator
+    computation fan out over a pool of `pool_size` threads. The orders of every symbol are then
+    sent as one batch by a single broker worker, so those MT5 calls stay serialized and go out
+    in one burst
+    :param symbols_arr: list of symbols to run the strategy on
+    :param timeframe: string of the timeframe to be queried
+    :param pool_size: integer number of symbols computed at once
+    :return: dict of symbol to its order outcome, or the exception the symbol raised
+    """
+    results = {}
+    intents = []
+
+    with ThreadPoolExecutor(max_workers=pool_size) as compute_pool, ThreadPoolExecutor(max_workers=1) as broker_worker:
+        signal_futures = {
+            compute_pool.submit(strats.get_trade_event, symbol, timeframe, SHORT_TERM_EMA_LENGTH, LONG_TERM_EMA_LENGTH): symbol
+            for symbol in symbols_arr
+        }
+
+        for signal_future in as_completed(signal_futures):
+            symbol = signal_futures[signal_future]
+            try:
+                symbol_intents = strats.get_trade_intents(symbol, signal_future.result(), BALANCE, RISK_PCT)
+            except Exception as e:
+                results[symbol] = e
+                continue
+            results[symbol] = False
+            intents.extend(symbol_intents)
+
+        if intents:
+            collect_order_results(broker_worker.submit(trader.process_order_batch, intents).result(), results)
+
+    return results
+
+def run_screener(symbols_arr, timeframe):
+    """
+    Function to run the strategy for many symbols in one vectorized pass. The candles of every symbol
+    are stacked into one array, the EMAs, crosses and trade levels are calculated for all of them at
+    once and the orders of the symbols with a new signal are sent as one batch
+    :param symbols_arr: list of symbols to run the strategy on
+    :param timeframe: string of the timeframe to be queried
+    :return: dict of symbol to its order outcome
+    """
+    results = {symbol: False for symbol in symbols_arr}
+
+    intents = []
+    for symbol, trade_event in ema_screener.screen(symbols_arr, timeframe).items():
+        intents.extend(strats.get_trade_intents(symbol, trade_event, BALANCE, RISK_PCT))
+
+    if intents:
+        collect_order_results(trader.process_order_batch(intents), results)
+
+    return results
+
+def run_tick_stream(json_settings, on_results, on_heartbeat=None):
+    """
+    Function to run the strategy on the forming bar of every symbol from its ticks until stopped.
+    Orders are placed as soon as a cross shows and moved while the bar forms
+    :param json_settings: json of project settings
+    :param on_results: function called with the dict of symbol to order outcome of every poll that closed a bar or sent an order
+    :param on_heartbeat: function called after every poll, also when the market is closed and no tick came in
+    """
+    symbols_arr = json_settings["mt5"]["symbols"]
     for symbol in symbols_arr:
-        # Trade type from the strategy
-        order_number = strats.ema_cross_strategy(symbol, timeframe, 1, 2, 10000, 0.03)
+        try:
+            trader.initialize_symbol(symbol)
+        except Exception as e:
+            print(e)
 
-        # Console output
-        if order_number:
-            print(f"Trade made on {symbol}. Order number: {order_number}")
+    stream = TickStream(
+        symbols_arr,
+        json_settings["mt5"]["timeframe"],
+        SHORT_TERM_EMA_LENGTH,
+        LONG_TERM_EMA_LENGTH,
+        BALANCE,
+        RISK_PCT,
+        adjust_interval=json_settings["mt5"].get("order_adjust_interval", DEFAULT_ADJUST_INTERVAL)
+    )
+    stream.seed()
+
+    poll_interval = json_settings["mt5"].get("tick_poll_interval", DEFAULT_POLL_INTERVAL)
+    while True:
+        results = stream.poll()
+        if results:
+            on_results(results)
+        if on_heartbeat:
+            on_heartbeat()
+        time.sleep(poll_interval)
+
+def collect_order_results(order_results, results):
+    """
+    Function to record the outcome of every place intent of a batch in `results`
+    :param order_results: list of result dicts from mt5_lib.process_order_batch
+    :param results: dict of symbol to its order outcome, updated in place
+    """
+    for order_result in order_results:
+        intent = order_result["intent"]
+        if intent["action"] != "place":
+            continue
+        if order_result["success"]:
+            results[intent["symbol"]] = order_result["orders"][0]
         else:
-            print(f"No trade for {symbol}.")
+            results[intent["symbol"]] = Exception(f"Order Code: {order_result['retcode']}. {order_result['comment']}")
 
-    return True
+def get_symbol_intents(json_settings, symbol, timeframe):
+    """
+    Function to run the configured strategies on one symbol, without sending any order
+    :param json_settings: json of project settings
+    :param symbol: string of the symbol
+    :param timeframe: string of the timeframe
+    :return: list of mt5_lib.process_order_batch intents
+    """
+    trader.initialize_symbol(symbol)
+
+    strategy_settings = json_settings["mt5"].get("strategies")
+    if strategy_settings:
+        strategies = [strategy.create_strategy(settings, BALANCE, RISK_PCT) for settings in strategy_settings]
+        return strategy.get_symbol_intents(strategies, symbol, timeframe, indicator_cache)
+
+    trade_event = strats.get_trade_event(symbol, timeframe, SHORT_TERM_EMA_LENGTH, LONG_TERM_EMA_LENGTH)
+    return strats.get_trade_intents(symbol, trade_event, BALANCE, RISK_PCT)
+
+def report_results(results, metrics_file=None):
+    """
+    Function to print the strategy outcome of every symbol of a cycle and export the latency metrics
+    :param results: dict of symbol to its order outcome
+    :param metrics_file: optional file the latency histograms are written to
+    """
+    for symbol, order_number in results.items():
+        report_result(symbol, order_number)
+    if metrics_file:
+        instrumentation.write_metrics(metrics_file)
+
+def report_result(symbol, order_number):
+    """
+    Function to print the strategy outcome of one symbol
+    :param symbol: string of the symbol
+    :param order_number: order outcome of the strategy, or the exception it raised
+    """
+    if isinstance(order_number, Exception):
+        print(f"Strategy failed for {symbol}. Error: {order_number}")
+    elif order_number:
+        print(f"Trade made on {symbol}. Order number: {order_number}")
+    else:
+        print(f"No trade for {symbol}.")
 
 def main():
     """
@@ -72,38 +264,120 @@ def main():
     # Get user credentials
     credentials = get_json_from_file(CREDENTIALS_FILE_PATH)
 
+    run_bot(json_settings, credentials)
+
+def run_bot(json_settings, credentials, on_results=None, on_heartbeat=None):
+    """
+    Connects to MetaTrader 5 and runs the strategy on every candle close until stopped
+    :param json_settings: json of project settings
+    :param credentials: json of the MetaTrader 5 login details
+    :param on_results: function called with the dict of symbol to order outcome of every cycle. Defaults to report_results
+    :param on_heartbeat: function called every time the bot wakes up, whether or not a bar closed, e.g. to
+    report that it is alive while the market is closed
+    """
+    on_results = on_results or report_results
+
     # Establish connection to MetaTrader. trader.connect() throws a
     # ConnectionError if a connection cannot be established
     connected = trader.connect(json_settings, credentials)
 
+    # Reconnect and retry reads when the terminal connection drops. Order sends are never retried
+    trader.set_terminal(ConnectionManager(
+        trader.mt5,
+        json_settings,
+        credentials,
+        json_settings["mt5"].get("reconnect_attempts", DEFAULT_RECONNECT_ATTEMPTS),
+        reconnect_max_delay=json_settings["mt5"].get("reconnect_max_delay", DEFAULT_RECONNECT_MAX_DELAY)
+    ))
+
     # Shows all columns
     pandas.set_option('display.max_columns', None)
 
-    if connected:
-        current_time = 0
-        previous_time = 0
+    # Keep candles on disk and only fetch new ones from MetaTrader 5
+    candle_store_path = json_settings["mt5"].get("candle_store_path")
+    if candle_store_path:
+        trader.set_candle_store(CandleStore(candle_store_path))
+
+    # Seconds between reconciles of the local order book with the orders on the terminal
+    trader.order_book.ttl = json_settings["mt5"].get("order_reconcile_interval", trader.ORDER_BOOK_TTL)
 
+    # Keep every signal, order intent, check, send and cancel for post-trade analysis
+    journal_path = json_settings["mt5"].get("journal_path")
+    if journal_path:
+        journal.start(journal_path)
+
+    # Time each pipeline stage per symbol and export the histograms to a file and/or /metrics
+    metrics_file = json_settings["mt5"].get("metrics_file")
+    metrics_port = json_settings["mt5"].get("metrics_port")
+    if json_settings["mt5"].get("metrics_enabled", False) or metrics_file or metrics_port:
+        instrumentation.enable()
+        if metrics_port:
+            instrumentation.start_metrics_server(metrics_port)
+
+    def on_cycle(results):
+        on_results(results)
+        if metrics_file:
+            instrumentation.write_metrics(metrics_file)
+
+    if connected:
         # Get timeframe from settings.json
         timeframe=json_settings["mt5"]["timeframe"]
-        while True:
-            # Get new candle
-            new_candle = trader.get_candlesticks("BCHUSD",timeframe,1)
 
-            current_time = new_candle['time'][0]
+        if json_settings["mt5"].get("tick_stream", False):
+            # Evaluate the forming bar on every batch of ticks instead of waiting for it to close
+            run_tick_stream(json_settings, on_cycle, on_heartbeat)
+            return
+
+        # Build the timeframe from one M1 stream per symbol instead of requesting its candles
+        bar_feed = None
+        if json_settings["mt5"].get("resample_from_m1", False) and timeframe != "one_minute":
+            bar_feed = M1BarFeed(json_settings["mt5"]["symbols"], [timeframe])
+            bar_feed.seed(LONG_TERM_EMA_LENGTH + 2)
+            trader.set_bar_feed(bar_feed)
 
-            if(current_time != previous_time):
-                # Discovered a new candle
-                # print("New candlestick. Time to trade!")
+        # Wake up on bar closes instead of polling MetaTrader 5
+        scheduler = CandleScheduler(
+            {"one_minute" if bar_feed else timeframe: json_settings["mt5"]["symbols"]},
+            json_settings["mt5"].get("server_utc_offset", 0)
+        )
 
-                # Update previous time
-                previous_time = current_time
+        if json_settings["mt5"].get("async_runtime", False):
+            # Sleep and compute as coroutines, with every MetaTrader 5 call on one thread
+            runtime = AsyncRuntime(
+                json_settings["mt5"].get("pool_size", DEFAULT_POOL_SIZE),
+                json_settings["mt5"].get("call_timeout", DEFAULT_CALL_TIMEOUT)
+            )
+            get_closed_bars = (lambda next_close, _: bar_feed.poll(next_close - 60)) if bar_feed else scheduler.get_closed_bars
+            asyncio.run(runtime.run_forever(
+                functools.partial(get_symbol_intents, json_settings),
+                scheduler,
+                get_closed_bars,
+                on_cycle,
+                json_settings["mt5"]["symbols"],
+                timeframe,
+                on_heartbeat
+            ))
+            return
 
-                run_strategy(json_settings)
+        # Trade on the latest closed candle right away
+        run_strategy(json_settings, on_results=on_cycle)
+        if on_heartbeat:
+            on_heartbeat()
 
+        while True:
+            if bar_feed:
+                # Fetch every symbol's new M1 bar once a minute. Only symbols whose resampled bar closed are traded
+                next_close, _ = scheduler.wait_for_next_close()
+                closed_bars = bar_feed.poll(next_close - 60)
             else:
-                # No new candles
-                # print("No new candles. Sleeping.")
-                time.sleep(1)
+                # Sleep until the next candle closes. Only symbols whose candle actually closed are traded
+                closed_bars = scheduler.wait_for_closed_bars()
+            # Keepalive. Reconnect before the cycle rather than on its first failed call
+            trader.mt5.ensure_connected()
+            for closed_timeframe, closed_symbols in closed_bars:
+                run_strategy(json_settings, closed_symbols, closed_timeframe, on_cycle)
+            if on_heartbeat:
+                on_heartbeat()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,5 +1,6 @@
 import mt5_lib as trader
 import helper_functions as hf
+import journal
 
 def make_trade(balance, comment, risk_pct, symbol, take_profit, stop_loss, stop_price):
     """
@@ -15,6 +16,33 @@ def make_trade(balance, comment, risk_pct, symbol, take_profit, stop_loss, stop_
     :return           : Boolean. True if trade made successfully. Otherwise, false
     """
 
+    intent = build_trade_intent(balance, comment, risk_pct, symbol, take_profit, stop_loss, stop_price)
+
+    print(f"Trying to make {intent['order_type']} trade on {symbol} with the following conditions:")
+    print(f"balance: {round(float(balance), 2)}")
+    print(f"take profit: {intent['take_profit']}")
+    print(f"stop loss: {intent['stop_loss']}")
+    print(f"stop price: {intent['stop_price']}")
+
+    # Send trade
+    trade_outcome = trader.place_order(intent['order_type'], symbol, intent['volume'], intent['stop_loss'], intent['take_profit'], comment, intent['stop_price'], False)
+
+    return trade_outcome
+
+def build_trade_intent(balance, comment, risk_pct, symbol, take_profit, stop_loss, stop_price):
+    """
+    Builds the place intent for a MT5 trade, as used by mt5_lib.process_order_batch.
+
+    :param balance    : Float. Trade balance
+    :param comment    : String. Used for managing multi-algorithmic trading
+    :param risk_pct   : Float. Risk amount as a percentage
+    :param symbol     : String. Symbol name
+    :param take_profit: Float. Take profit value
+    :param stop_loss  : Float. Stop loss value
+    :param stop_price : Float. Stop price value
+    :return           : Dict. The place intent
+    """
+
     # Get proper types and format
     balance = (round(float(balance), 2))
     take_profit = (round(float(take_profit), 2))
@@ -22,20 +50,20 @@ def make_trade(balance, comment, risk_pct, symbol, take_profit, stop_loss, stop_
     stop_price = (round(float(stop_price), 2))
 
     # Get lot size
-    lot_size = hf.calc_lot_size(balance, risk_pct, stop_loss, stop_price, symbol)
+    lot_size = hf.calc_lot_size(balance, risk_pct, stop_loss, stop_price, symbol, trader.get_symbol_spec(symbol))
 
     # Determine trade type
     (trade_type := "BUY_STOP") if stop_price > stop_loss else (trade_type := "SELL_STOP")
 
-    print(f"Trying to make {trade_type} trade on {symbol} with the following conditions:")
-    print(f"balance: {balance}")
-    print(f"take profit: {take_profit}")
-    print(f"stop loss: {stop_loss}")
-    print(f"stop price: {stop_price}")
-
-    # Send trade
-    trade_outcome = trader.place_order(trade_type, symbol, lot_size, stop_loss, take_profit, comment, stop_price, False)
-
-    return trade_outcome
+    journal.record(journal.INTENT, symbol, comment, side=journal.get_side(trade_type), volume=lot_size, price=stop_price, stop_loss=stop_loss, take_profit=take_profit)
 
-    
\ No newline at end of file
+    return {
+        "action": "place",
+        "order_type": trade_type,
+        "symbol": symbol,
+        "volume": lot_size,
+        "stop_loss": stop_loss,
+        "take_profit": take_profit,
+        "comment": comment,
+        "stop_price": stop_price
+    }
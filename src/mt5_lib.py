@@ -1,7 +1,35 @@
 from enum import Enum
+import os
+import threading
+import time
 
+import numpy as np
 import pandas
-import MetaTrader5 as mt5
+
+from candle_store import CANDLE_DTYPE, to_candle_records
+import instrumentation
+import journal
+
+# The simulated broker stands in for the MetaTrader 5 terminal when BBSTRADER_SIMULATED_BROKER is set
+if os.environ.get("BBSTRADER_SIMULATED_BROKER"):
+    import sim_mt5 as mt5
+else:
+    import MetaTrader5 as mt5
+
+# Optional candle_store.CandleStore used by get_candlesticks. Set with set_candle_store
+candle_store = None
+
+# Optional resampler.M1BarFeed get_candle_records serves the timeframes it builds from. Set with set_bar_feed
+bar_feed = None
+
+# Upper bound on the number of candles a single sync request asks for
+MAX_SYNC_CANDLESTICKS = 100000
+
+# Seconds before the symbol registry reloads the symbol universe
+SYMBOL_REGISTRY_TTL = 60 * 60
+
+# Seconds before the order book is reconciled with the open orders and positions on the terminal
+ORDER_BOOK_TTL = 30
 
 def connect(json_settings: dict, credentials: dict) -> bool:
     """
@@ -56,18 +84,8 @@ def initialize_symbol(symbol) -> bool:
     :return Boolean: True if initialized. Otherwise, false
     """
 
-    #Get all MT5 symbols
-    symbols = mt5.symbols_get()
-
-    #Store the symbol names in a list
-    symbol_names = []
-
-    #Populate list
-    for current_symbol in symbols:
-        symbol_names.append(current_symbol.name)
-
-    #Check if the given symbol name is in our list
-    if symbol in symbol_names:
+    #Check if the given symbol name is known to the server
+    if symbol in symbol_registry:
         try:
             mt5.symbol_select(symbol, True)
             return True
@@ -80,20 +98,151 @@ def initialize_symbol(symbol) -> bool:
 
 def get_candlesticks(symbol, timeframe, num_candlesticks: int):
     """
-    Retrieves `num_candlesticks` candlesticks for symbol `symbol` from MetaTrader 5.
+    Retrieves `num_candlesticks` candlesticks for symbol `symbol` from MetaTrader 5 as a dataframe.
+    :param `symbol`: The symbol to retrieve candlesticks for.
+    :param `timeframe`: The timeframe to retrieve from.
+    :param `num_candlesticks`: The number of candlesticks to retrieve.
+    """
+    return pandas.DataFrame(get_candle_records(symbol, timeframe, num_candlesticks))
+
+@instrumentation.timed("candle_fetch", symbol_arg=0)
+def get_candle_records(symbol, timeframe, num_candlesticks: int):
+    """
+    Retrieves `num_candlesticks` candlesticks for symbol `symbol` from MetaTrader 5, without
+    building a dataframe.
+    When a candle store is set, only candles newer than the last stored one are requested
+    from MetaTrader 5 and the rest are read from the store.
     :param `symbol`: The symbol to retrieve candlesticks for.
     :param `timeframe`: The timeframe to retrieve from.
     :param `num_candlesticks`: The number of candlesticks to retrieve.
+    :return: CANDLE_DTYPE structured array, oldest candle first
     """
 
+    # Bars resampled from the M1 stream cost no request
+    if bar_feed is not None and timeframe != "one_minute":
+        candles = bar_feed.get_candle_records(symbol, timeframe, num_candlesticks)
+        if candles is not None:
+            return candles
+
+    if candle_store is not None:
+        sync_candlesticks(candle_store, symbol, timeframe, num_candlesticks)
+
+        # The store can only grow forwards, so fall back to MetaTrader 5 when it holds too little history
+        if candle_store.count(symbol, timeframe) >= num_candlesticks:
+            return candle_store.read(symbol, timeframe, num_candlesticks)
+
     #Get MT5-Readable timeframe
     mt5_timeframe = get_mt5_timeframe(timeframe=timeframe)
 
     #Get candles
     candles = mt5.copy_rates_from_pos(symbol, mt5_timeframe, 1, num_candlesticks)
+    if candles is None:
+        return np.zeros(0, dtype=CANDLE_DTYPE)
+
+    return to_candle_records(candles)
 
-    #return a pandas dataframe
-    return pandas.DataFrame(candles)
+def get_candle_range(symbol, timeframe, date_from: int, date_to: int):
+    """
+    Retrieves the candlesticks of `symbol` that opened between `date_from` and `date_to` from MetaTrader 5.
+    The last one may still be forming.
+    :param `symbol`: The symbol to retrieve candlesticks for.
+    :param `timeframe`: The timeframe to retrieve from.
+    :param `date_from`: integer seconds since epoch on the server clock, inclusive.
+    :param `date_to`: integer seconds since epoch on the server clock, inclusive.
+    :return: CANDLE_DTYPE structured array, oldest candle first. None if MetaTrader 5 returned an error
+    """
+    mt5_timeframe = get_mt5_timeframe(timeframe=timeframe)
+    candles = mt5.copy_rates_range(symbol, mt5_timeframe, int(date_from), int(date_to))
+    if candles is None:
+        return None
+    return to_candle_records(candles)
+
+def get_forming_candle(symbol, timeframe):
+    """
+    :return: CANDLE_DTYPE record of the candle of `symbol` on `timeframe` that is still forming. None if unknown
+    """
+    candles = mt5.copy_rates_from_pos(symbol, get_mt5_timeframe(timeframe=timeframe), 0, 1)
+    if candles is None or len(candles) == 0:
+        return None
+    return to_candle_records(candles)[-1]
+
+def get_forming_candle_time(symbol, timeframe):
+    """
+    :return: open time of the candle of `symbol` on `timeframe` that is still forming. None if unknown
+    """
+    candle = get_forming_candle(symbol, timeframe)
+    if candle is None:
+        return None
+    return int(candle['time'])
+
+def get_ticks(symbol, date_from: int, count: int):
+    """
+    Retrieves up to `count` ticks of `symbol` from MetaTrader 5, starting at `date_from`.
+    :param `symbol`: The symbol to retrieve ticks for.
+    :param `date_from`: integer seconds since epoch on the server clock, inclusive.
+    :param `count`: The number of ticks to retrieve.
+    :return: TICK_DTYPE structured array, oldest tick first. None if MetaTrader 5 returned an error
+    """
+    ticks = mt5.copy_ticks_from(symbol, int(date_from), count, mt5.COPY_TICKS_ALL)
+    if ticks is None:
+        return None
+    return ticks
+
+def set_terminal(terminal):
+    """
+    Sets the module every MetaTrader 5 call goes through, e.g. a proxy that runs them on one thread.
+    :param terminal: the MetaTrader5 module or an object with the same functions and constants
+    :return: the module used until now
+    """
+    global mt5
+    previous_terminal = mt5
+    mt5 = terminal
+    return previous_terminal
+
+def set_candle_store(store):
+    """
+    Sets the candle store get_candlesticks reads from. None turns the store off.
+    :param store: candle_store.CandleStore or None
+    """
+    global candle_store
+    candle_store = store
+
+def set_bar_feed(feed):
+    """
+    Sets the M1 bar feed get_candle_records serves resampled timeframes from. None turns the feed off.
+    :param feed: resampler.M1BarFeed or None
+    """
+    global bar_feed
+    bar_feed = feed
+
+def sync_candlesticks(store, symbol, timeframe, num_candlesticks: int):
+    """
+    Appends the closed candles newer than the last stored candle of `symbol` to `store`.
+    An empty store is seeded with the last `num_candlesticks` candles.
+    :param store: candle_store.CandleStore to append to
+    :param `symbol`: The symbol to retrieve candlesticks for.
+    :param `timeframe`: The timeframe to retrieve from.
+    :param `num_candlesticks`: The number of candlesticks to seed an empty store with.
+    :return: number of candles appended
+    """
+    mt5_timeframe = get_mt5_timeframe(timeframe=timeframe)
+    last_time = store.get_last_time(symbol, timeframe)
+
+    if last_time is None:
+        candles = mt5.copy_rates_from_pos(symbol, mt5_timeframe, 1, num_candlesticks)
+    else:
+        # Ask for a couple of candles and widen the request until it reaches back to the stored ones
+        count = 2
+        while True:
+            candles = mt5.copy_rates_from_pos(symbol, mt5_timeframe, 1, count)
+            if candles is None or len(candles) < count or candles['time'][0] <= last_time or count >= MAX_SYNC_CANDLESTICKS:
+                break
+            count *= 2
+
+    if candles is None or len(candles) == 0:
+        return 0
+
+    return store.append(symbol, timeframe, candles)
 
 def get_mt5_timeframe(timeframe):
     """
@@ -108,8 +257,9 @@ def get_mt5_timeframe(timeframe):
     except KeyError as e:
         print(f"{timeframe} is not a legal timeframe. {e}")
         
-def place_order(order_type, symbol, volume, stop_loss, take_profit, comment, stop_price, direct=False):
+def build_order_request(order_type, symbol, volume, stop_loss, take_profit, comment, stop_price):
     """
+    Builds a MetaTrader 5 pending order request
     :param order_type : String. Options: SELL_STOP, BUY_STOP
     :param symbol     : String. Symbol to trade
     :param volume     : Float. Trade volume
@@ -117,8 +267,7 @@ def place_order(order_type, symbol, volume, stop_loss, take_profit, comment, sto
     :param take_profit: Float. Take profit value
     :param comment    : String. Comment used to handle multi-algorithmic trading
     :param stop_price : Float. Stop price value
-    :param direct     : Boolean. Default is false. When true, bypasses order checking
-    :return           : Boolean. True if order placed successfully. Otherwise, false.
+    :return           : Dict. The order request
     """
 
     # Ensure proper types and formatting
@@ -156,17 +305,67 @@ def place_order(order_type, symbol, volume, stop_loss, take_profit, comment, sto
     request['action'] = mt5.TRADE_ACTION_PENDING
     request['type_filling'] = mt5.ORDER_FILLING_RETURN
 
+    return request
+
+def build_modify_request(ticket, order_type, symbol, stop_loss, take_profit, stop_price):
+    """
+    Builds the request that moves the price and stops of a pending order, with the same prices
+    build_order_request gives a new order
+    :param ticket     : Integer. Ticket of the pending order
+    :param order_type : String. Options: SELL_STOP, BUY_STOP
+    :param symbol     : String. Symbol of the order
+    :param stop_loss  : Float. Stop loss value
+    :param take_profit: Float. Take profit value
+    :param stop_price : Float. Stop price value
+    :return           : Dict. The modify request
+    """
+    request = build_order_request(order_type, symbol, 0.0, stop_loss, take_profit, "", stop_price)
+    return {
+        "action": mt5.TRADE_ACTION_MODIFY,
+        "order": ticket,
+        "symbol": symbol,
+        "price": request["price"],
+        "sl": request["sl"],
+        "tp": request["tp"],
+        "type_time": request["type_time"]
+    }
+
+def place_order(order_type, symbol, volume, stop_loss, take_profit, comment, stop_price, direct=False):
+    """
+    :param order_type : String. Options: SELL_STOP, BUY_STOP
+    :param symbol     : String. Symbol to trade
+    :param volume     : Float. Trade volume
+    :param stop_loss  : Float. Stop loss value
+    :param take_profit: Float. Take profit value
+    :param comment    : String. Comment used to handle multi-algorithmic trading
+    :param stop_price : Float. Stop price value
+    :param direct     : Boolean. Default is false. When true, bypasses order checking
+    :return           : Boolean. True if order placed successfully. Otherwise, false.
+    """
+
+    request = build_order_request(order_type, symbol, volume, stop_loss, take_profit, comment, stop_price)
+
     # No order checking
     if direct:
-        order_result = mt5.order_send(request)
+        with instrumentation.span("order_send", symbol):
+            order_result = mt5.order_send(request)
+        journal.record_request(journal.SEND, request, order_result)
+        # No answer from the terminal. The order may or may not have been placed
+        if order_result is None:
+            raise Exception(f"Error. order_send failed: {mt5.last_error()}")
         # Order send status: OK
         if order_result[0] == 10009:
+            order_book.add_order(request, order_result[2])
             return order_result[2]
         else:
             raise Exception(f"Error. Order code: {order_result.comment}. Code descriptions: https://www.mql5.com/en/docs/constants/errorswarnings/enum_trade_return_codes")
     else:
-        result = mt5.order_check(request)
+        with instrumentation.span("order_check", symbol):
+            result = mt5.order_check(request)
+        journal.record_request(journal.CHECK, request, result)
 
+        if result is None:
+            raise Exception(f"Error. order_check failed: {mt5.last_error()}")
         # Order check status: OK
         if result[0] == 0:
             return place_order(order_type, symbol, volume, stop_loss, take_profit, comment, stop_price, True)
@@ -188,7 +387,12 @@ def cancel_order(order_number):
     # Attempt to send the order to MT5
     try: 
         order_result = mt5.order_send(request)
+        journal.record_request(journal.CANCEL, order_book.orders.get(order_number, request), order_result, order_number)
+        if order_result is None:
+            print(f"Order {order_number} unable to be cancelled. {mt5.last_error()}")
+            return False
         if order_result[0] == 10009:
+            order_book.remove_order(order_number)
             print(f"Order {order_number} successfully cancelled")
             return True
         else:
@@ -206,32 +410,14 @@ def get_all_open_orders():
 
 def get_filtered_list_of_orders(symbol, comment):
     """
-    Function to retreive a filtered list of open orders from Mt5. Filtering is based on symbol and comment
+    Function to retreive a filtered list of open orders from the order book. Filtering is based on symbol and comment
     :param symbol: string of the symbol being traded
     :param comment: string of the comment
     :return: (filtered) list of orders
     """
-    # Retrieve a list of open orders, filtered by symbol
-    open_orders_by_symbol = mt5.orders_get(symbol=symbol)
-    # Check if any order were retreived
-    if open_orders_by_symbol is None or len(open_orders_by_symbol) == 0:
-        return []
-    
-    # Convert the retrieved orders into a dataframe
-    open_orders_dataframe = pandas.DataFrame(
-        list(open_orders_by_symbol),
-        columns=open_orders_by_symbol[0]._asdict().keys()
-    )
-
-    # From the open orders dataframe, fitler orders by comment
-    open_orders_dataframe = open_orders_dataframe[open_orders_dataframe['comment'] == comment]
-    # Create a list to store the open order numbers
-    open_orders = []
-    # Iterate through the dataframe and add order numbers to the list
-    for order in open_orders_dataframe['ticket']:
-        open_orders.append(order)
-    return open_orders
+    return order_book.get_tickets(symbol, comment)
 
+@instrumentation.timed("cancel_filtered_orders", symbol_arg=0)
 def cancel_filtered_orders(symbol, comment):
     """
     Function to cancel a list of filtered orders. Based upon two filters: symbol & comment
@@ -251,6 +437,398 @@ def cancel_filtered_orders(symbol, comment):
     else:
         return True
 
+# MetaTrader 5 return codes
+TRADE_RETCODE_DONE = 10009
+ORDER_CHECK_OK = 0
+
+def get_symbol_spec(symbol):
+    """
+    Function to get the trading spec of a symbol from the symbol registry
+    :param symbol: string of the symbol
+    :return: dict of the symbol spec, see SymbolRegistry. None if unknown
+    """
+    return symbol_registry.get(symbol)
+
+def is_multiple_of(value, step):
+    """
+    :return: Boolean. True if `value` is a whole multiple of `step`, allowing for float error
+    """
+    if not step:
+        return True
+    steps = value / step
+    return abs(steps - round(steps)) < 1e-6
+
+def validate_order_request(request, spec):
+    """
+    Function to validate a pending order request against a symbol spec without asking MetaTrader 5
+    :param request: dict order request from build_order_request
+    :param spec: dict symbol spec from get_symbol_spec
+    :return: tuple of (error, safe_to_skip_check). error is None when no problem was found.
+    safe_to_skip_check is True when the local checks cover everything order_check would look at
+    """
+    if not isinstance(request['price'], float):
+        return "Stop price must be a non-zero positive value", False
+
+    volume = request['volume']
+    if volume < spec["volume_min"] or volume > spec["volume_max"]:
+        return f"Volume {volume} outside of [{spec['volume_min']}, {spec['volume_max']}]", False
+    if not is_multiple_of(volume, spec["volume_step"]):
+        return f"Volume {volume} is not a multiple of the volume step {spec['volume_step']}", False
+
+    for field in ('price', 'sl', 'tp'):
+        if request[field] and not is_multiple_of(request[field], spec["trade_tick_size"]):
+            return f"{field} {request[field]} is not a multiple of the tick size {spec['trade_tick_size']}", False
+
+    # Stops on the correct side of the price
+    if request['type'] == mt5.ORDER_TYPE_BUY_STOP:
+        stops_in_order = request['sl'] < request['price'] < request['tp']
+    else:
+        stops_in_order = request['tp'] < request['price'] < request['sl']
+    if not stops_in_order:
+        return "Stop loss and take profit are on the wrong side of the stop price", False
+
+    min_distance = spec["trade_stops_level"] * spec["point"]
+    if abs(request['price'] - request['sl']) < min_distance or abs(request['tp'] - request['price']) < min_distance:
+        return f"Stops closer than the stops level of {spec['trade_stops_level']} points", False
+
+    # A stops level also applies to the distance from the market price, which only order_check knows
+    return None, spec["trade_stops_level"] == 0
+
+def process_order_batch(intents):
+    """
+    Function to run many cancel and place intents across symbols in one burst. Open orders are read
+    once for all symbols, place requests are validated locally so order_check is only sent when the
+    local checks can't cover it, and then all cancels and all sends go out back to back.
+    A failing intent never stops the others
+    :param intents: list of dicts. Cancel intents are {"action": "cancel", "symbol": ..., "comment": ...}
+    or {"action": "cancel", "ticket": ...}. Place intents are {"action": "place", "order_type": ...,
+    "symbol": ..., "volume": ..., "stop_loss": ..., "take_profit": ..., "comment": ..., "stop_price": ...}.
+    Modify intents are place intents with "action": "modify" and the "ticket" of the pending order to move
+    :return: list of result dicts {"intent", "success", "orders", "retcode", "comment"}, one per intent in the same order
+    """
+    results = [{"intent": intent, "success": False, "orders": [], "retcode": None, "comment": ""} for intent in intents]
+
+    # Resolve cancel intents into tickets from the order book
+    cancels = []
+    for result, intent in zip(results, intents):
+        if intent.get("action") != "cancel":
+            continue
+        if "ticket" in intent:
+            result["orders"] = [intent["ticket"]]
+        else:
+            result["orders"] = order_book.get_tickets(intent["symbol"], intent["comment"])
+        cancels.append(result)
+
+    # Build and pre-validate place requests
+    sends = []
+    for result, intent in zip(results, intents):
+        if intent.get("action") == "cancel":
+            continue
+        if intent.get("action") == "modify":
+            try:
+                sends.append((result, build_modify_request(intent["ticket"], intent["order_type"], intent["symbol"], intent["stop_loss"], intent["take_profit"], intent["stop_price"])))
+            except Exception as e:
+                result["comment"] = str(e)
+            continue
+        if intent.get("action") != "place":
+            result["comment"] = f"Unsupported intent action: {intent.get('action')}"
+            continue
+        try:
+            request = build_order_request(intent["order_type"], intent["symbol"], intent["volume"], intent["stop_loss"], intent["take_profit"], intent["comment"], intent["stop_price"])
+            spec = get_symbol_spec(intent["symbol"])
+            if spec:
+                error, skip_check = validate_order_request(request, spec)
+            else:
+                # Without a spec only order_check can tell
+                error = None if isinstance(request['price'], float) else "Stop price must be a non-zero positive value"
+                skip_check = False
+            if error:
+                result["comment"] = error
+                continue
+            if not skip_check:
+                with instrumentation.span("order_check", intent["symbol"]):
+                    check_result = mt5.order_check(request)
+                journal.record_request(journal.CHECK, request, check_result)
+                if check_result is None or check_result[0] != ORDER_CHECK_OK:
+                    result["retcode"] = None if check_result is None else check_result[0]
+                    result["comment"] = "order_check failed" if check_result is None else check_result.comment
+                    continue
+            sends.append((result, request))
+        except Exception as e:
+            result["comment"] = str(e)
+
+    # Cancels go first so a replacement order never sits next to the order it replaces
+    for result in cancels:
+        cancelled = []
+        for ticket in result["orders"]:
+            try:
+                with instrumentation.span("order_send", result["intent"].get("symbol")):
+                    order_result = mt5.order_send({"action": mt5.TRADE_ACTION_REMOVE, "order": ticket, "comment": "order removed"})
+                journal.record_request(journal.CANCEL, order_book.orders.get(ticket, result["intent"]), order_result, ticket)
+                result["retcode"] = None if order_result is None else order_result[0]
+                if order_result is not None and order_result[0] == TRADE_RETCODE_DONE:
+                    cancelled.append(ticket)
+                    order_book.remove_order(ticket)
+                else:
+                    result["comment"] = "order_send failed" if order_result is None else order_result.comment
+            except Exception as e:
+                result["comment"] = str(e)
+
+        failed = [ticket for ticket in result["orders"] if ticket not in cancelled]
+        if failed:
+            # The book may be behind the terminal, e.g. the order filled or expired since the last reconcile
+            order_book.reconcile()
+            failed = [ticket for ticket in failed if ticket in order_book.orders]
+        result["success"] = not failed
+        result["orders"] = cancelled
+
+    for result, request in sends:
+        try:
+            with instrumentation.span("order_send", request["symbol"]):
+                order_result = mt5.order_send(request)
+            modify = request["action"] == mt5.TRADE_ACTION_MODIFY
+            if modify:
+                journal.record_request(journal.MODIFY, {**order_book.orders.get(request["order"], {}), **request}, order_result, request["order"])
+            else:
+                journal.record_request(journal.SEND, request, order_result)
+            if order_result is None:
+                result["comment"] = "order_send failed"
+                continue
+            result["retcode"] = order_result[0]
+            result["comment"] = order_result.comment
+            if order_result[0] == TRADE_RETCODE_DONE:
+                result["success"] = True
+                if modify:
+                    result["orders"] = [request["order"]]
+                    order_book.modify_order(request)
+                else:
+                    result["orders"] = [order_result[2]]
+                    order_book.add_order(request, order_result[2])
+        except Exception as e:
+            result["comment"] = str(e)
+
+    return results
+
+class SymbolRegistry:
+    """
+    Index of every symbol on the server and its trading spec. The symbol universe is loaded
+    with a single symbols_get call and reloaded once it is older than `ttl` seconds or on demand
+    """
+
+    def __init__(self, ttl=SYMBOL_REGISTRY_TTL):
+        """
+        :param ttl: seconds before the symbol universe is reloaded
+        """
+        self.ttl = ttl
+        self.specs = {}
+        self.loaded_at = None
+
+    def refresh(self):
+        """
+        Reloads the symbol universe from MetaTrader 5
+        """
+        symbols = mt5.symbols_get()
+        if symbols is None:
+            print(f"Could not load symbols from MetaTrader 5: {mt5.last_error()}")
+            return
+
+        self.specs = {symbol_info.name: get_spec_from_symbol_info(symbol_info) for symbol_info in symbols}
+        self.loaded_at = time.monotonic()
+
+    def is_stale(self):
+        """
+        :return: Boolean. True if the symbol universe was never loaded or is older than the ttl
+        """
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    def get(self, symbol):
+        """
+        :param symbol: string of the symbol
+        :return: dict of the symbol spec. None if the server doesn't know the symbol
+        """
+        if self.is_stale():
+            self.refresh()
+        return self.specs.get(symbol)
+
+    def __contains__(self, symbol):
+        return self.get(symbol) is not None
+
+class OrderBook:
+    """
+    In-process mirror of the open orders and positions on the terminal, indexed by ticket and by
+    (symbol, comment). Orders we send or cancel update it directly and it is reconciled with a
+    single orders_get and positions_get for all symbols once it is older than `ttl` seconds, so
+    looking up the orders of a strategy doesn't cost a terminal round trip
+    """
+
+    def __init__(self, ttl=ORDER_BOOK_TTL):
+        """
+        :param ttl: seconds before the book is reconciled with the terminal
+        """
+        self.ttl = ttl
+        # Dicts of ticket, symbol, comment, type, volume, price, sl and tp keyed by ticket
+        self.orders = {}
+        self.positions = {}
+        # Sets of tickets keyed by (symbol, comment)
+        self.order_tickets = {}
+        self.position_tickets = {}
+        self.synced_at = None
+        self.lock = threading.RLock()
+
+    def is_stale(self):
+        """
+        :return: Boolean. True if the book was never reconciled or is older than the ttl
+        """
+        return self.synced_at is None or time.monotonic() - self.synced_at > self.ttl
+
+    def invalidate(self):
+        """
+        Reconciles the book on its next lookup
+        """
+        self.synced_at = None
+
+    def reconcile(self):
+        """
+        Replaces the book with the open orders and positions of every symbol on the terminal
+        :return: dict of "added" and "removed" lists of the tickets the book had missed or still held.
+        None if MetaTrader 5 couldn't be read, in which case the book is left as it was
+        """
+        terminal_orders = mt5.orders_get()
+        terminal_positions = mt5.positions_get()
+        if terminal_orders is None or terminal_positions is None:
+            print(f"Could not load orders from MetaTrader 5: {mt5.last_error()}")
+            return None
+
+        with self.lock:
+            previous_tickets = set(self.orders) | set(self.positions)
+            self.orders, self.order_tickets = {}, {}
+            self.positions, self.position_tickets = {}, {}
+            for order in terminal_orders:
+                self.add(self.orders, self.order_tickets, get_order_record(order))
+            for position in terminal_positions:
+                self.add(self.positions, self.position_tickets, get_order_record(position))
+            self.synced_at = time.monotonic()
+            tickets = set(self.orders) | set(self.positions)
+
+        return {"added": sorted(tickets - previous_tickets), "removed": sorted(previous_tickets - tickets)}
+
+    def refresh(self):
+        """
+        Reconciles the book if it is stale
+        """
+        if self.is_stale():
+            self.reconcile()
+
+    def add(self, records, tickets_by_key, record):
+        """
+        Indexes `record` by its ticket in `records` and by its symbol and comment in `tickets_by_key`
+        """
+        tickets_by_key.setdefault((record["symbol"], record["comment"]), set()).add(record["ticket"])
+        records[record["ticket"]] = record
+
+    def add_order(self, request, ticket):
+        """
+        Records an order our order_send just placed
+        :param request: dict order request from build_order_request
+        :param ticket: integer order ticket from the order_send result
+        """
+        with self.lock:
+            self.add(self.orders, self.order_tickets, {
+                "ticket": ticket,
+                "symbol": request["symbol"],
+                "comment": request["comment"],
+                "type": request["type"],
+                "volume": request["volume"],
+                "price": request["price"],
+                "sl": request["sl"],
+                "tp": request["tp"]
+            })
+
+    def modify_order(self, request):
+        """
+        Moves an order our order_send just modified
+        :param request: dict modify request from build_modify_request
+        """
+        with self.lock:
+            record = self.orders.get(request["order"])
+            if record is not None:
+                record.update(price=request["price"], sl=request["sl"], tp=request["tp"])
+
+    def remove_order(self, ticket):
+        """
+        Drops an order our order_send just cancelled
+        :param ticket: integer order ticket
+        """
+        with self.lock:
+            record = self.orders.pop(ticket, None)
+            if record is not None:
+                self.order_tickets[(record["symbol"], record["comment"])].discard(ticket)
+
+    def get_tickets(self, symbol, comment):
+        """
+        :param symbol: string of the symbol
+        :param comment: string of the comment of the strategy's orders
+        :return: list of the tickets of the open orders of `symbol` with `comment`
+        """
+        self.refresh()
+        with self.lock:
+            return sorted(self.order_tickets.get((symbol, comment), ()))
+
+    def get_exposure(self, symbol, comment=None):
+        """
+        :param symbol: string of the symbol
+        :param comment: string of the comment of a strategy's orders. Defaults to every strategy
+        :return: tuple of the signed volume of the open positions and of the pending orders of `symbol`,
+        positive for buys and negative for sells
+        """
+        self.refresh()
+        with self.lock:
+            return tuple(
+                sum(
+                    # Buy order and position types are even in MetaTrader 5
+                    record["volume"] if record["type"] % 2 == 0 else -record["volume"]
+                    for (key_symbol, key_comment), tickets in tickets_by_key.items()
+                    if key_symbol == symbol and comment in (None, key_comment)
+                    for record in (records[ticket] for ticket in tickets)
+                )
+                for records, tickets_by_key in ((self.positions, self.position_tickets), (self.orders, self.order_tickets))
+            )
+
+def get_order_record(order):
+    """
+    :param order: TradeOrder or TradePosition named tuple from MetaTrader 5
+    :return: dict of the order book fields of `order`
+    """
+    return {
+        "ticket": order.ticket,
+        "symbol": order.symbol,
+        "comment": order.comment,
+        "type": getattr(order, "type", 0),
+        "volume": getattr(order, "volume_current", getattr(order, "volume", 0.0)),
+        "price": getattr(order, "price_open", 0.0),
+        "sl": getattr(order, "sl", 0.0),
+        "tp": getattr(order, "tp", 0.0)
+    }
+
+def get_spec_from_symbol_info(symbol_info):
+    """
+    :param symbol_info: SymbolInfo named tuple from MetaTrader 5
+    :return: dict of digits, point, volume_min, volume_max, volume_step, trade_contract_size,
+    trade_tick_size, trade_stops_level, currency_base and currency_profit
+    """
+    return {
+        "digits": symbol_info.digits,
+        "point": symbol_info.point,
+        "volume_min": symbol_info.volume_min,
+        "volume_max": symbol_info.volume_max,
+        "volume_step": symbol_info.volume_step,
+        "trade_contract_size": symbol_info.trade_contract_size,
+        "trade_tick_size": symbol_info.trade_tick_size,
+        "trade_stops_level": symbol_info.trade_stops_level,
+        "currency_base": symbol_info.currency_base,
+        "currency_profit": symbol_info.currency_profit
+    }
+
 class Timeframe(Enum):
     one_minute  = mt5.TIMEFRAME_M1
     two_minutes  = mt5.TIMEFRAME_M2
@@ -271,3 +849,9 @@ class Timeframe(Enum):
     six_hours  = mt5.TIMEFRAME_H6
     eight_hours  = mt5.TIMEFRAME_H8
     one_day  = mt5.TIMEFRAME_D1
+
+# Shared symbol registry used by initialize_symbol, lot sizing and order validation
+symbol_registry = SymbolRegistry()
+
+# Shared order book used by cancel_filtered_orders and process_order_batch
+order_book = OrderBook()
@@ -0,0 +1,179 @@
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas
+
+import backtest
+import ema_cross_strategy as strats
+import indicator_lib
+import utils
+from candle_store import CandleStore, CANDLE_DTYPE
+
+# Candle and EMA arrays of every dataset, attached to shared memory once per worker process.
+# Keyed by (symbol, timeframe)
+shared_datasets = {}
+
+def get_parameter_grid(short_term_ema_lengths, long_term_ema_lengths, risk_pcts):
+    """
+    Builds the (short_term_ema_length, long_term_ema_length, risk_pct) grid. Pairs where the
+    long-term EMA isn't longer than the short-term EMA are left out
+    :return: list of (short_term_ema_length, long_term_ema_length, risk_pct) tuples
+    """
+    return [
+        (short_term_ema_length, long_term_ema_length, risk_pct)
+        for short_term_ema_length, long_term_ema_length, risk_pct in itertools.product(short_term_ema_lengths, long_term_ema_lengths, risk_pcts)
+        if long_term_ema_length > short_term_ema_length
+    ]
+
+def share_dataset(candles, ema_lengths):
+    """
+    Copies a dataset's candles into shared memory and computes each EMA length once into a second shared block
+    :param candles: numpy structured array of CANDLE_DTYPE candles, oldest first
+    :param ema_lengths: sorted list of every EMA length used by the grid
+    :return: tuple of (descriptor dict passed to the workers, list of SharedMemory blocks owned by the caller)
+    """
+    num_candles = len(candles)
+
+    candles_block = shared_memory.SharedMemory(create=True, size=max(num_candles * CANDLE_DTYPE.itemsize, 1))
+    shared_candles = np.ndarray((num_candles,), dtype=CANDLE_DTYPE, buffer=candles_block.buf)
+    shared_candles[:] = candles
+
+    emas_block = shared_memory.SharedMemory(create=True, size=max(len(ema_lengths) * num_candles * 8, 1))
+    shared_emas = np.ndarray((len(ema_lengths), num_candles), dtype=np.float64, buffer=emas_block.buf)
+    close = np.ascontiguousarray(shared_candles['close'], dtype=np.float64)
+    for row, ema_length in enumerate(ema_lengths):
+        shared_emas[row] = indicator_lib.calc_ema_array(close, ema_length)
+
+    descriptor = {
+        "candles": candles_block.name,
+        "emas": emas_block.name,
+        "num_candles": num_candles,
+        "ema_lengths": list(ema_lengths)
+    }
+    return descriptor, [candles_block, emas_block]
+
+def attach_datasets(descriptors):
+    """
+    Worker process initializer. Attaches to the shared blocks of every dataset without copying them
+    :param descriptors: dict of (symbol, timeframe) to the descriptor from share_dataset
+    """
+    for key, descriptor in descriptors.items():
+        candles_block = shared_memory.SharedMemory(name=descriptor["candles"])
+        emas_block = shared_memory.SharedMemory(name=descriptor["emas"])
+        num_candles = descriptor["num_candles"]
+
+        shared_datasets[key] = {
+            # Keep the blocks referenced so the buffers stay mapped
+            "blocks": [candles_block, emas_block],
+            "candles": np.ndarray((num_candles,), dtype=CANDLE_DTYPE, buffer=candles_block.buf),
+            "emas": np.ndarray((len(descriptor["ema_lengths"]), num_candles), dtype=np.float64, buffer=emas_block.buf),
+            "ema_rows": {ema_length: row for row, ema_length in enumerate(descriptor["ema_lengths"])}
+        }
+
+def evaluate(symbol, timeframe, short_term_ema_length, long_term_ema_length, risk_pcts, balance, contract_size):
+    """
+    Backtests one EMA length pair on a shared dataset for every risk percentage
+    :return: list of result dicts, one per risk percentage
+    """
+    dataset = shared_datasets[(symbol, timeframe)]
+    candles = dataset["candles"]
+
+    ema_x_strategy_table = pandas.DataFrame({name: candles[name] for name in ('time', 'open', 'high', 'low', 'close')})
+
+    # Reuse the EMA columns computed once per length
+    for ema_length in (short_term_ema_length, long_term_ema_length):
+        ema_x_strategy_table[utils.get_ema_name(ema_length)] = dataset["emas"][dataset["ema_rows"][ema_length]]
+
+    indicator_lib.ema_cross_calc(ema_x_strategy_table, short_term_ema_length, long_term_ema_length)
+    strats.det_trade(ema_x_strategy_table, short_term_ema_length, long_term_ema_length)
+
+    results = []
+    for risk_pct in risk_pcts:
+        result = backtest.simulate_trades(ema_x_strategy_table, symbol, balance, risk_pct, contract_size)
+        results.append({
+            "symbol": symbol,
+            "timeframe": timeframe,
+            "short_term_ema_length": short_term_ema_length,
+            "long_term_ema_length": long_term_ema_length,
+            "risk_pct": risk_pct,
+            **result.stats
+        })
+    return results
+
+def run_sweep(datasets, short_term_ema_lengths, long_term_ema_lengths, risk_pcts, balance=10000, contract_size=1.0, max_workers=None):
+    """
+    Evaluates the EMA Cross strategy for every (short_term_ema_length, long_term_ema_length, risk_pct)
+    on every dataset over a process pool. Candles and EMA columns live in shared memory, so they are
+    neither pickled per task nor computed more than once per length
+    :param datasets: dict of (symbol, timeframe) to a structured array of candles, oldest first
+    :param short_term_ema_lengths: list of short-term EMA lengths
+    :param long_term_ema_lengths: list of long-term EMA lengths
+    :param risk_pcts: list of risk percentages
+    :param balance: Float. Trade balance used for lot sizing and as the starting equity
+    :param contract_size: Float. Units of the symbol per lot
+    :param max_workers: number of worker processes. Defaults to the number of CPUs
+    :return: dataframe of summary stats per symbol, timeframe and parameter set, best total_pnl first
+    """
+    grid = get_parameter_grid(short_term_ema_lengths, long_term_ema_lengths, risk_pcts)
+    ema_lengths = sorted(set(short_term_ema_lengths) | set(long_term_ema_lengths))
+    pairs = sorted({(short_term_ema_length, long_term_ema_length) for short_term_ema_length, long_term_ema_length, _ in grid})
+    grid_risk_pcts = sorted({risk_pct for _, _, risk_pct in grid})
+
+    descriptors = {}
+    blocks = []
+    try:
+        for key, candles in datasets.items():
+            descriptors[key], dataset_blocks = share_dataset(candles, ema_lengths)
+            blocks.extend(dataset_blocks)
+
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=attach_datasets, initargs=(descriptors,)) as pool:
+            futures = [
+                pool.submit(evaluate, symbol, timeframe, short_term_ema_length, long_term_ema_length, grid_risk_pcts, balance, contract_size)
+                for (symbol, timeframe) in datasets
+                for short_term_ema_length, long_term_ema_length in pairs
+            ]
+            rows = [row for future in futures for row in future.result()]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    results = pandas.DataFrame(rows)
+    if len(results):
+        results = results.sort_values("total_pnl", ascending=False).reset_index(drop=True)
+    return results
+
+def main():
+    """
+    Runs a parameter sweep on candles kept in a candle store and writes the results to a csv file
+    """
+    parser = argparse.ArgumentParser(description="Sweep EMA lengths and risk for the EMA Cross strategy on stored candles")
+    parser.add_argument("--symbols", nargs="+", required=True)
+    parser.add_argument("--timeframes", nargs="+", default=["one_minute"])
+    parser.add_argument("--short", nargs="+", type=int, default=[1, 2, 5, 10, 20])
+    parser.add_argument("--long", nargs="+", type=int, default=[2, 10, 20, 50, 100, 200])
+    parser.add_argument("--risk", nargs="+", type=float, default=[0.01, 0.02, 0.03])
+    parser.add_argument("--store", default="./candles", help="candle store directory")
+    parser.add_argument("--balance", type=float, default=10000)
+    parser.add_argument("--contract-size", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    store = CandleStore(args.store)
+    datasets = {
+        (symbol, timeframe): np.array(store.read(symbol, timeframe))
+        for symbol in args.symbols
+        for timeframe in args.timeframes
+    }
+
+    results = run_sweep(datasets, args.short, args.long, args.risk, args.balance, args.contract_size, args.workers)
+    results.to_csv(args.output, index=False)
+    print(results.head(10))
+
+if __name__ == '__main__':
+    main()
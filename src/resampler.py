@@ -0,0 +1,236 @@
+import numpy as np
+
+from candle_buffer import CandleBuffer
+from candle_store import CANDLE_DTYPE
+import mt5_lib
+import utils
+
+# Closed higher-timeframe bars kept per symbol and timeframe
+DEFAULT_CAPACITY = 512
+
+# Upper bound on the number of M1 candles a single request asks for
+MAX_MINUTE_CANDLESTICKS = 100000
+
+MINUTE_SECONDS = 60
+
+class BarResampler:
+    """
+    Builds the higher-timeframe bars of one symbol incrementally from its M1 bars. A bar closes
+    as soon as the M1 bar of its last minute arrives, or when an M1 bar of a later bar arrives
+    if the last minutes had no ticks
+    """
+
+    def __init__(self, symbol, timeframes, capacity=DEFAULT_CAPACITY):
+        """
+        :param symbol: string of the symbol
+        :param timeframes: list of mt5_lib.Timeframe names to build
+        :param capacity: integer number of closed bars kept per timeframe
+        """
+        for timeframe in timeframes:
+            if timeframe not in mt5_lib.Timeframe.__members__:
+                raise ValueError(f"{timeframe} is not a legal timeframe.")
+
+        self.symbol = symbol
+        self.timeframes = list(timeframes)
+        # Bar being built per timeframe. None until its first M1 bar arrives
+        self.forming = {timeframe: None for timeframe in self.timeframes}
+        self.closed = {timeframe: CandleBuffer(capacity) for timeframe in self.timeframes}
+        # Timeframes whose forming bar is missing its first minutes, because the stream started mid-bar
+        self.partial = set()
+        self.last_time = None
+
+    def add(self, candle):
+        """
+        Folds one M1 bar into every timeframe. M1 bars that are not newer than the last one are ignored
+        :param candle: CANDLE_DTYPE record of a closed M1 bar
+        :return: list of (timeframe, CANDLE_DTYPE record) of the bars closed by this M1 bar
+        """
+        candle_time = int(candle['time'])
+        if self.last_time is not None and candle_time <= self.last_time:
+            return []
+        first_candle = self.last_time is None
+        self.last_time = candle_time
+
+        closed_bars = []
+        for timeframe in self.timeframes:
+            bar_open_time = utils.get_bar_open_time(timeframe, candle_time)
+            bar = self.forming[timeframe]
+
+            # A later bar started while this one was missing its last minutes
+            if bar is not None and bar['time'] != bar_open_time:
+                self.close_bar(timeframe, closed_bars)
+                bar = None
+
+            if bar is None:
+                bar = np.zeros((), dtype=CANDLE_DTYPE)
+                bar['time'] = bar_open_time
+                bar['open'] = candle['open']
+                bar['high'] = candle['high']
+                bar['low'] = candle['low']
+                self.forming[timeframe] = bar
+                if first_candle and candle_time != bar_open_time:
+                    self.partial.add(timeframe)
+            else:
+                bar['high'] = max(bar['high'], candle['high'])
+                bar['low'] = min(bar['low'], candle['low'])
+            bar['close'] = candle['close']
+            bar['tick_volume'] += candle['tick_volume']
+            bar['real_volume'] += candle['real_volume']
+            # Spread of the bar is the spread of its last minute
+            bar['spread'] = candle['spread']
+
+            # The last minute of the bar is in
+            if candle_time + MINUTE_SECONDS >= utils.get_next_bar_open_time(timeframe, bar_open_time):
+                self.close_bar(timeframe, closed_bars)
+
+        return closed_bars
+
+    def close_until(self, timestamp):
+        """
+        Closes the forming bars that ended at or before `timestamp`, e.g. when their last minutes had no ticks
+        :param timestamp: integer seconds since epoch on the server clock
+        :return: list of (timeframe, CANDLE_DTYPE record) of the closed bars
+        """
+        closed_bars = []
+        for timeframe in self.timeframes:
+            bar = self.forming[timeframe]
+            if bar is not None and utils.get_next_bar_open_time(timeframe, int(bar['time'])) <= timestamp:
+                self.close_bar(timeframe, closed_bars)
+        return closed_bars
+
+    def close_bar(self, timeframe, closed_bars):
+        """
+        Moves the forming bar of `timeframe` to its closed bars and appends (timeframe, bar) to
+        `closed_bars`. A bar missing its first minutes is dropped instead
+        """
+        bar = self.forming[timeframe]
+        self.forming[timeframe] = None
+        if timeframe in self.partial:
+            self.partial.discard(timeframe)
+            return
+        self.closed[timeframe].append(bar)
+        closed_bars.append((timeframe, bar))
+
+    def get_bars(self, timeframe, num_bars):
+        """
+        :return: CANDLE_DTYPE structured array of the last `num_bars` closed bars of `timeframe`, oldest first
+        """
+        return self.closed[timeframe].get_records(num_bars)
+
+class M1BarFeed:
+    """
+    Keeps one M1 stream per symbol and resamples it into every subscribed timeframe, so MetaTrader 5
+    is asked for candles once per symbol per minute whatever the number of timeframes traded.
+    Hand it to mt5_lib.set_bar_feed to serve get_candle_records of the resampled timeframes
+    """
+
+    def __init__(
+        self,
+        symbols,
+        timeframes,
+        capacity=DEFAULT_CAPACITY,
+        confirm_interval=utils.CONFIRM_INTERVAL,
+        confirm_timeout=utils.CONFIRM_TIMEOUT,
+        confirm_max_interval=utils.CONFIRM_MAX_INTERVAL
+    ):
+        """
+        :param symbols: list of symbols
+        :param timeframes: list of mt5_lib.Timeframe names built from M1, e.g. five_minutes and one_hour
+        :param capacity: integer number of closed bars kept per symbol and timeframe
+        :param confirm_interval: seconds before the second request for symbols whose M1 bar hasn't shown up yet
+        :param confirm_timeout: seconds to stop waiting for a symbol's M1 bar, e.g. when it had no ticks
+        :param confirm_max_interval: upper bound on the seconds between requests, which double every time
+        """
+        self.timeframes = [timeframe for timeframe in timeframes if timeframe != "one_minute"]
+        self.resamplers = {symbol: BarResampler(symbol, self.timeframes, capacity) for symbol in symbols}
+        self.confirm_interval = confirm_interval
+        self.confirm_timeout = confirm_timeout
+        self.confirm_max_interval = confirm_max_interval
+        # Callbacks called with (symbol, timeframe, bar) on every bar close, keyed by timeframe
+        self.subscribers = {timeframe: [] for timeframe in self.timeframes}
+
+    def subscribe(self, timeframe, callback):
+        """
+        Calls `callback(symbol, timeframe, bar)` whenever a bar of `timeframe` closes
+        :param timeframe: string of a timeframe the feed builds
+        :param callback: callable taking the symbol, the timeframe and the CANDLE_DTYPE record of the bar
+        """
+        if timeframe not in self.subscribers:
+            raise ValueError(f"{timeframe} is not built by this feed.")
+        self.subscribers[timeframe].append(callback)
+
+    def seed(self, num_bars):
+        """
+        Builds the last `num_bars` bars of every timeframe from M1 history, without calling subscribers
+        :param num_bars: integer number of bars of the longest timeframe to build
+        """
+        longest = max((utils.TIMEFRAME_SECONDS.get(timeframe, 31 * 24 * 60 * 60) for timeframe in self.timeframes), default=MINUTE_SECONDS)
+        # One extra bar, as the oldest one is usually missing its first minutes
+        num_minutes = min(MAX_MINUTE_CANDLESTICKS, (num_bars + 2) * longest // MINUTE_SECONDS)
+        for symbol, resampler in self.resamplers.items():
+            for candle in mt5_lib.get_candle_records(symbol, "one_minute", num_minutes):
+                resampler.add(candle)
+
+    def fetch_new_minutes(self, symbol):
+        """
+        Requests the M1 bars of `symbol` newer than the last one resampled, widening the
+        request until it reaches back to it
+        :return: CANDLE_DTYPE structured array of the new M1 bars, oldest first
+        """
+        last_time = self.resamplers[symbol].last_time
+        count = 2
+        while True:
+            candles = mt5_lib.get_candle_records(symbol, "one_minute", count)
+            if last_time is None or len(candles) < count or candles['time'][0] <= last_time or count >= MAX_MINUTE_CANDLESTICKS:
+                break
+            count = min(count * 2, MAX_MINUTE_CANDLESTICKS)
+
+        if last_time is None:
+            return candles
+        return candles[candles['time'] > last_time]
+
+    def poll(self, expected_open=None):
+        """
+        Fetches the new M1 bars of every symbol, resamples them and calls the subscribers of every closed bar.
+        With `expected_open`, symbols whose M1 bar that opened then isn't visible yet are asked again, backing
+        off from `confirm_interval` until `confirm_timeout`, after which the bars ending by its close are closed anyway
+        :param expected_open: server time the just closed M1 bar opened at
+        :return: list of (timeframe, list of symbols) with a newly closed bar
+        """
+        closed_symbols = {timeframe: [] for timeframe in self.timeframes}
+
+        def fetch(symbol):
+            resampler = self.resamplers[symbol]
+            closed_bars = []
+            for candle in self.fetch_new_minutes(symbol):
+                closed_bars.extend(resampler.add(candle))
+            self.dispatch(symbol, closed_bars, closed_symbols)
+            return expected_open is None or (resampler.last_time is not None and resampler.last_time >= expected_open)
+
+        _, pending = utils.confirm_pending(list(self.resamplers), fetch, self.confirm_interval, self.confirm_max_interval, self.confirm_timeout)
+
+        # No ticks in the last minute. Close what ended by now
+        for symbol in pending:
+            self.dispatch(symbol, self.resamplers[symbol].close_until(expected_open + MINUTE_SECONDS), closed_symbols)
+
+        return [(timeframe, symbols) for timeframe, symbols in closed_symbols.items() if symbols]
+
+    def dispatch(self, symbol, closed_bars, closed_symbols):
+        """
+        Calls the subscribers of every closed bar and records its symbol in `closed_symbols`
+        """
+        for timeframe, bar in closed_bars:
+            if symbol not in closed_symbols[timeframe]:
+                closed_symbols[timeframe].append(symbol)
+            for callback in self.subscribers[timeframe]:
+                callback(symbol, timeframe, bar)
+
+    def get_candle_records(self, symbol, timeframe, num_candlesticks):
+        """
+        :return: CANDLE_DTYPE structured array of the last `num_candlesticks` closed bars of `symbol` on
+        `timeframe`. None if the feed doesn't build them or holds fewer bars
+        """
+        resampler = self.resamplers.get(symbol)
+        if resampler is None or timeframe not in resampler.closed or len(resampler.closed[timeframe]) < num_candlesticks:
+            return None
+        return resampler.get_bars(timeframe, num_candlesticks)
@@ -0,0 +1,126 @@
+import time
+
+import mt5_lib
+import utils
+
+class CandleScheduler:
+    """
+    Sleeps until the next bar of any configured timeframe closes and then confirms the
+    closed bar with one candle request per symbol, instead of polling MetaTrader 5 every second
+    """
+
+    def __init__(
+        self,
+        symbols_by_timeframe,
+        server_utc_offset=0,
+        confirm_interval=utils.CONFIRM_INTERVAL,
+        confirm_timeout=utils.CONFIRM_TIMEOUT,
+        confirm_max_interval=utils.CONFIRM_MAX_INTERVAL
+    ):
+        """
+        :param symbols_by_timeframe: dict of timeframe name to the list of symbols traded on it
+        :param server_utc_offset: hours the MetaTrader 5 server clock is ahead of UTC
+        :param confirm_interval: seconds before the second confirmation request for symbols whose bar hasn't shown up yet
+        :param confirm_timeout: seconds after the boundary to stop waiting for a symbol's bar, e.g. when it had no ticks
+        :param confirm_max_interval: upper bound on the seconds between confirmation requests, which double every time
+        """
+        for timeframe in symbols_by_timeframe:
+            if timeframe not in mt5_lib.Timeframe.__members__:
+                raise ValueError(f"{timeframe} is not a legal timeframe.")
+
+        self.symbols_by_timeframe = symbols_by_timeframe
+        self.server_utc_offset = int(server_utc_offset * 60 * 60)
+        self.confirm_interval = confirm_interval
+        self.confirm_timeout = confirm_timeout
+        self.confirm_max_interval = confirm_max_interval
+        # Time of the last confirmed closed bar, keyed by (symbol, timeframe)
+        self.last_bar_times = {}
+
+    def server_time(self):
+        """
+        :return: the current time on the MetaTrader 5 server clock in seconds since epoch
+        """
+        return time.time() + self.server_utc_offset
+
+    def get_next_close(self):
+        """
+        :return: tuple of (server time of the next bar close, list of timeframes closing then)
+        """
+        now = self.server_time()
+        closes = {timeframe: utils.get_next_bar_open_time(timeframe, now) for timeframe in self.symbols_by_timeframe}
+        next_close = min(closes.values())
+        return next_close, [timeframe for timeframe, close in closes.items() if close == next_close]
+
+    def wait_for_next_close(self):
+        """
+        Blocks until the next bar close, without asking MetaTrader 5 which bars closed
+        :return: tuple of (server time of the bar close, list of timeframes closing then)
+        """
+        next_close, timeframes = self.get_next_close()
+
+        delay = next_close - self.server_time()
+        if delay > 0:
+            time.sleep(delay)
+
+        return next_close, timeframes
+
+    def wait_for_closed_bars(self):
+        """
+        Blocks until the next bar close and returns the symbols whose bar actually closed
+        :return: list of (timeframe, list of symbols) with a newly closed bar
+        """
+        next_close, timeframes = self.wait_for_next_close()
+
+        return self.get_closed_bars(next_close, timeframes)
+
+    def get_closed_bars(self, next_close, timeframes):
+        """
+        Confirms the symbols whose bar of one of `timeframes` closed at `next_close`
+        :param next_close: server time of the bar close
+        :param timeframes: list of timeframes closing then
+        :return: list of (timeframe, list of symbols) with a newly closed bar
+        """
+        closed_bars = []
+        for timeframe in timeframes:
+            expected_open = utils.get_bar_open_time(timeframe, next_close - 1)
+            symbols = self.confirm_closed_bars(timeframe, expected_open)
+            if symbols:
+                closed_bars.append((timeframe, symbols))
+
+        return closed_bars
+
+    def confirm_closed_bars(self, timeframe, expected_open):
+        """
+        Confirms which symbols have a closed bar that opened at `expected_open`. Symbols whose
+        bar isn't visible yet are asked again, backing off from `confirm_interval` until `confirm_timeout`
+        :param timeframe: string of the timeframe
+        :param expected_open: server time the just closed bar opened at
+        :return: list of symbols with a newly closed bar
+        """
+        confirmed, _ = utils.confirm_pending(
+            list(self.symbols_by_timeframe[timeframe]),
+            lambda symbol: self.has_new_bar(symbol, timeframe, expected_open),
+            self.confirm_interval,
+            self.confirm_max_interval,
+            self.confirm_timeout
+        )
+        return confirmed
+
+    def has_new_bar(self, symbol, timeframe, expected_open):
+        """
+        :return: Boolean. True if the last closed bar of `symbol` is the expected one or newer than the last one seen
+        """
+        last_candle = mt5_lib.get_candle_records(symbol, timeframe, 1)
+        if len(last_candle) == 0:
+            return False
+
+        bar_time = int(last_candle['time'][-1])
+        last_bar_time = self.last_bar_times.get((symbol, timeframe))
+
+        if bar_time >= expected_open or (last_bar_time is not None and bar_time > last_bar_time):
+            self.last_bar_times[(symbol, timeframe)] = bar_time
+            return True
+
+        if last_bar_time is None:
+            self.last_bar_times[(symbol, timeframe)] = bar_time
+        return False
@@ -0,0 +1,248 @@
+import numpy as np
+import pandas
+
+from candle_store import CANDLE_DTYPE
+import ema_cross_strategy as strats
+import instrumentation
+import mt5_lib
+import utils
+
+def stack_candles(candles_by_symbol, num_bars):
+    """
+    Stacks the latest `num_bars` candles of every symbol into one symbols x bars array. Each row holds
+    its own symbol's latest candles, so rows line up by position from the newest candle back
+    :param candles_by_symbol: dict of symbol to CANDLE_DTYPE structured array, oldest first
+    :param num_bars: integer number of candles per symbol
+    :return: tuple of (list of the stacked symbols, CANDLE_DTYPE array of shape (symbols, num_bars)).
+    Symbols with fewer than `num_bars` candles are left out
+    """
+    symbols = [symbol for symbol, candles in candles_by_symbol.items() if len(candles) >= num_bars]
+    stacked = np.zeros((len(symbols), num_bars), dtype=CANDLE_DTYPE)
+    for row, symbol in enumerate(symbols):
+        stacked[row] = candles_by_symbol[symbol][-num_bars:]
+    return symbols, stacked
+
+def calc_ema_matrix(close, ema_size):
+    """
+    Calculates the Exponential Moving Average (EMA) of size `ema_size` along every row of a
+    symbols x bars array of close prices at once. Each row gets the same values as
+    indicator_lib.calc_ema_array, warm-up columns included
+
+    :param `close`: 2D array-like of close prices, one row per symbol, oldest first
+    :param `ema_size`: The EMA size
+    :return: numpy float64 array of the same shape as `close`
+    """
+    close = np.asarray(close, dtype=np.float64)
+    ema_values = np.zeros(close.shape, dtype=np.float64)
+
+    # Not enough bars to seed the EMA, everything is warm-up
+    if close.shape[1] <= ema_size:
+        return ema_values
+
+    multiplier = 2/(ema_size + 1)
+
+    # SMA seed followed by the EMA recursion, as in calc_ema_array. The frame holds one symbol per
+    # column, so pandas runs the recursion down every column in one call
+    filter_input = close[:, ema_size:].copy()
+    filter_input[:, 0] = close[:, :ema_size].mean(axis=1)
+
+    ema_values[:, ema_size:] = pandas.DataFrame(filter_input.T, copy=False).ewm(alpha=multiplier, adjust=False).mean().to_numpy().T
+
+    return ema_values
+
+@instrumentation.timed("screen")
+def screen_candles(candles, short_term_ema_length, long_term_ema_length):
+    """
+    Evaluates the EMA Cross strategy on the latest candle of every row of a stacked candle array
+    :param candles: CANDLE_DTYPE array of shape (symbols, bars) from stack_candles
+    :param short_term_ema_length: integer of the lowest timeframe length for EMA
+    :param long_term_ema_length: integer of the highest timeframe length for EMA
+    :return: dict of column name to an array with one value per row: the EMAs, ema_cross, stop_loss,
+    stop_price and take_profit, plus the time, open and close of the latest candle
+    """
+    if long_term_ema_length <= short_term_ema_length:
+        raise ValueError("Long-term EMA length must be larger than short-term EMA length")
+
+    close = np.ascontiguousarray(candles['close'])
+    short_term_ema = calc_ema_matrix(close, short_term_ema_length)[:, -2:]
+    long_term_ema = calc_ema_matrix(close, long_term_ema_length)[:, -2:]
+
+    # A cross on the latest candle. Only a warmed up long-term EMA can trade
+    position = short_term_ema > long_term_ema
+    ema_cross = (position[:, 0] != position[:, 1]) & (long_term_ema[:, 1] != 0.0)
+
+    return get_trade_columns(candles[:, -1], short_term_ema[:, 1], long_term_ema[:, 1], ema_cross, short_term_ema_length, long_term_ema_length)
+
+def get_trade_columns(latest, short_term_ema, long_term_ema, ema_cross, short_term_ema_length, long_term_ema_length):
+    """
+    :param latest: CANDLE_DTYPE array of the latest candle of every row
+    :param short_term_ema: float array of the short-term EMA of every row on its latest candle
+    :param long_term_ema: float array of the long-term EMA of every row on its latest candle
+    :param ema_cross: Boolean array. True for the rows whose EMAs crossed on their latest candle
+    :return: dict of column name to an array with one value per row, see screen_candles
+    """
+    stop_loss, stop_price, take_profit = strats.calc_trade_levels(
+        ema_cross, long_term_ema, latest['open'], latest['close'], latest['high'], latest['low']
+    )
+
+    return {
+        'time': latest['time'],
+        'open': latest['open'],
+        'close': latest['close'],
+        utils.get_ema_name(short_term_ema_length): short_term_ema,
+        utils.get_ema_name(long_term_ema_length): long_term_ema,
+        'ema_cross': ema_cross,
+        'stop_loss': stop_loss,
+        'stop_price': stop_price,
+        'take_profit': take_profit
+    }
+
+class EmaCrossMatrix:
+    """
+    EMA cross state of many symbols on one timeframe, one row per symbol: the short-term and long-term
+    EMA of the latest candle, the position of the EMAs and the time of the latest candle. A new candle
+    of every row is folded in with one vectorized step, as IncrementalEmaCross.update does per symbol
+    """
+
+    def __init__(self, short_term_ema_length, long_term_ema_length):
+        """
+        :param short_term_ema_length: integer of the lowest timeframe length for EMA
+        :param long_term_ema_length: integer of the highest timeframe length for EMA
+        """
+        self.short_term_ema_length = short_term_ema_length
+        self.long_term_ema_length = long_term_ema_length
+        self.multipliers = np.array([2/(short_term_ema_length + 1), 2/(long_term_ema_length + 1)])
+        # Row of every symbol
+        self.rows = {}
+        # Short-term and long-term EMA per row
+        self.emas = np.zeros((0, 2), dtype=np.float64)
+        self.positions = np.zeros(0, dtype=bool)
+        self.last_times = np.zeros(0, dtype=np.int64)
+        # True for the rows whose EMAs are warmed up, as IncrementalEmaCross.ready
+        self.ready = np.zeros(0, dtype=bool)
+
+    def get_row(self, symbol):
+        """
+        :return: integer row of `symbol`, added if it is new
+        """
+        row = self.rows.get(symbol)
+        if row is None:
+            row = self.rows[symbol] = len(self.rows)
+            self.emas = np.vstack((self.emas, np.zeros((1, 2))))
+            self.positions = np.append(self.positions, False)
+            self.last_times = np.append(self.last_times, -1)
+            self.ready = np.append(self.ready, False)
+        return row
+
+    def seed(self, rows, candles):
+        """
+        Seeds `rows` from history and evaluates their latest candle
+        :param rows: integer array of the rows
+        :param candles: CANDLE_DTYPE array of shape (rows, bars) from stack_candles
+        :return: dict of column name to an array with one value per row, see screen_candles
+        """
+        columns = screen_candles(candles, self.short_term_ema_length, self.long_term_ema_length)
+        short_term_ema = columns[utils.get_ema_name(self.short_term_ema_length)]
+        long_term_ema = columns[utils.get_ema_name(self.long_term_ema_length)]
+
+        self.emas[rows, 0] = short_term_ema
+        self.emas[rows, 1] = long_term_ema
+        self.positions[rows] = short_term_ema > long_term_ema
+        self.last_times[rows] = columns['time']
+        # Warm-up values are zero-filled by calc_ema_matrix
+        self.ready[rows] = (short_term_ema != 0.0) & (long_term_ema != 0.0)
+        return columns
+
+    def advance(self, rows, latest):
+        """
+        Folds one new candle into every row of `rows`
+        :param rows: integer array of the rows
+        :param latest: CANDLE_DTYPE array of the new candle of every row
+        :return: dict of column name to an array with one value per row, see screen_candles
+        """
+        close = latest['close'][:, np.newaxis]
+        emas = close * self.multipliers + self.emas[rows] * (1 - self.multipliers)
+        positions = emas[:, 0] > emas[:, 1]
+        ema_cross = (positions != self.positions[rows]) & (emas[:, 1] != 0.0)
+
+        self.emas[rows] = emas
+        self.positions[rows] = positions
+        self.last_times[rows] = latest['time']
+        return get_trade_columns(latest, emas[:, 0], emas[:, 1], ema_cross, self.short_term_ema_length, self.long_term_ema_length)
+
+class Screener:
+    """
+    Watches many symbols with the EMA Cross strategy in one vectorized pass per candle instead of one
+    pass per symbol. The EMAs of every symbol are seeded from history once and then advanced by one
+    candle per screen, as ema_cross_strategy.get_trade_event does, and only reseeded after a gap. Only
+    symbols whose latest candle is new since the last screen and saw a tradeable cross are reported
+    """
+
+    def __init__(self, short_term_ema_length, long_term_ema_length, num_bars=None):
+        """
+        :param short_term_ema_length: integer of the lowest timeframe length for EMA
+        :param long_term_ema_length: integer of the highest timeframe length for EMA
+        :param num_bars: integer number of candles the EMAs are seeded from. Defaults to the
+        long-term EMA length + 2, the history ema_cross_strategy.get_trade_event reseeds from
+        """
+        if long_term_ema_length <= short_term_ema_length:
+            raise ValueError("Long-term EMA length must be larger than short-term EMA length")
+
+        self.short_term_ema_length = short_term_ema_length
+        self.long_term_ema_length = long_term_ema_length
+        self.num_bars = num_bars or long_term_ema_length + 2
+        # EmaCrossMatrix per timeframe
+        self.states = {}
+
+    def screen(self, symbols, timeframe):
+        """
+        Fetches the new candles of every symbol and evaluates them in one pass
+        :param symbols: list of symbols
+        :param timeframe: string of the timeframe
+        :return: dict of symbol to the trade event of its latest candle, see screen_candles, for the
+        symbols with a new candle that saw a tradeable EMA cross
+        """
+        state = self.states.get(timeframe)
+        if state is None:
+            state = self.states[timeframe] = EmaCrossMatrix(self.short_term_ema_length, self.long_term_ema_length)
+
+        advance_symbols, advance_candles = [], []
+        history = {}
+        for symbol in symbols:
+            row = state.get_row(symbol)
+            last_time = state.last_times[row]
+
+            if state.ready[row]:
+                # The candle we hold plus the newest closed candle
+                latest_candles = mt5_lib.get_candle_records(symbol, timeframe, 2)
+                if len(latest_candles) == 2:
+                    # Nothing closed since the last screen
+                    if latest_candles['time'][-1] == last_time:
+                        continue
+                    # Exactly one new candle, advance in O(1)
+                    if latest_candles['time'][0] == last_time:
+                        advance_symbols.append(symbol)
+                        advance_candles.append(latest_candles[-1])
+                        continue
+
+            # First screen, still warming up or a gap: reseed from history
+            candles = mt5_lib.get_candle_records(symbol, timeframe, self.num_bars)
+            if len(candles) and candles['time'][-1] != last_time:
+                history[symbol] = candles
+
+        evaluated = []
+        if advance_symbols:
+            rows = np.array([state.rows[symbol] for symbol in advance_symbols])
+            evaluated.append((advance_symbols, state.advance(rows, np.array(advance_candles, dtype=CANDLE_DTYPE))))
+
+        stacked_symbols, candles = stack_candles(history, self.num_bars)
+        if stacked_symbols:
+            rows = np.array([state.rows[symbol] for symbol in stacked_symbols])
+            evaluated.append((stacked_symbols, state.seed(rows, candles)))
+
+        trade_events = {}
+        for evaluated_symbols, columns in evaluated:
+            for row, symbol in enumerate(evaluated_symbols):
+                if columns['ema_cross'][row] and columns['open'][row] != columns['close'][row]:
+                    trade_events[symbol] = {name: values[row].item() for name, values in columns.items()}
+        return trade_events
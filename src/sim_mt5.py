@@ -0,0 +1,523 @@
+"""
+Simulated MetaTrader 5 broker.
+
+Stands in for the MetaTrader5 package with the functions and constants mt5_lib uses, so the bot
+can run without a terminal. Candles are replayed from stored or synthetic data against a simulated
+clock, pending orders are kept in an in-memory order book and every call can be given a latency.
+Set the BBSTRADER_SIMULATED_BROKER environment variable before mt5_lib is imported to use it.
+"""
+import random
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import utils
+from candle_store import CANDLE_DTYPE, TICK_DTYPE
+
+# Timeframes, same values as MetaTrader5
+TIMEFRAME_M1 = 1
+TIMEFRAME_M2 = 2
+TIMEFRAME_M3 = 3
+TIMEFRAME_M4 = 4
+TIMEFRAME_M5 = 5
+TIMEFRAME_M6 = 6
+TIMEFRAME_M10 = 10
+TIMEFRAME_M12 = 12
+TIMEFRAME_M15 = 15
+TIMEFRAME_M20 = 20
+TIMEFRAME_M30 = 30
+TIMEFRAME_H1 = 16385
+TIMEFRAME_H2 = 16386
+TIMEFRAME_H3 = 16387
+TIMEFRAME_H4 = 16388
+TIMEFRAME_H6 = 16390
+TIMEFRAME_H8 = 16392
+TIMEFRAME_D1 = 16408
+TIMEFRAME_MN1 = 49153
+
+# Order types, actions, filling and expiration
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+ORDER_TYPE_BUY_LIMIT = 2
+ORDER_TYPE_SELL_LIMIT = 3
+ORDER_TYPE_BUY_STOP = 4
+ORDER_TYPE_SELL_STOP = 5
+TRADE_ACTION_DEAL = 1
+TRADE_ACTION_PENDING = 5
+TRADE_ACTION_SLTP = 6
+TRADE_ACTION_MODIFY = 7
+TRADE_ACTION_REMOVE = 8
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+ORDER_FILLING_RETURN = 2
+ORDER_TIME_GTC = 0
+COPY_TICKS_ALL = -1
+
+# Trade return codes
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_INVALID_PRICE = 10015
+TRADE_RETCODE_INVALID_STOPS = 10016
+TRADE_RETCODE_INVALID_ORDER = 10035
+
+# last_error codes
+RES_S_OK = 1
+RES_E_INVALID_PARAMS = -2
+RES_E_NOT_FOUND = -1
+RES_E_INTERNAL_FAIL_CONNECT = -10004
+
+# Timeframe value to mt5_lib.Timeframe name
+TIMEFRAME_NAMES = {
+    TIMEFRAME_M1: "one_minute", TIMEFRAME_M2: "two_minutes", TIMEFRAME_M3: "three_minutes",
+    TIMEFRAME_M4: "four_minutes", TIMEFRAME_M5: "five_minutes", TIMEFRAME_M6: "six_minutes",
+    TIMEFRAME_M10: "ten_minutes", TIMEFRAME_M12: "twelve_minutes", TIMEFRAME_M15: "fifteen_minutes",
+    TIMEFRAME_M20: "twenty_minutes", TIMEFRAME_M30: "thirty_minutes", TIMEFRAME_H1: "one_hour",
+    TIMEFRAME_H2: "two_hours", TIMEFRAME_H3: "three_hours", TIMEFRAME_H4: "four_hours",
+    TIMEFRAME_H6: "six_hours", TIMEFRAME_H8: "eight_hours", TIMEFRAME_D1: "one_day",
+    TIMEFRAME_MN1: "one_month"
+}
+
+SymbolInfo = namedtuple("SymbolInfo", [
+    "name", "visible", "select", "digits", "spread", "point", "volume_min", "volume_max", "volume_step",
+    "trade_contract_size", "trade_tick_size", "trade_stops_level", "currency_base", "currency_profit"
+])
+Tick = namedtuple("Tick", ["time", "bid", "ask", "last", "volume", "time_msc", "flags", "volume_real"])
+TradeOrder = namedtuple("TradeOrder", [
+    "ticket", "time_setup", "type", "volume_initial", "volume_current", "price_open",
+    "sl", "tp", "price_current", "symbol", "comment"
+])
+TradePosition = namedtuple("TradePosition", [
+    "ticket", "time", "type", "volume", "price_open", "sl", "tp", "price_current", "symbol", "comment"
+])
+TerminalInfo = namedtuple("TerminalInfo", ["connected", "trade_allowed", "path"])
+OrderCheckResult = namedtuple("OrderCheckResult", [
+    "retcode", "balance", "equity", "profit", "margin", "margin_free", "margin_level", "comment", "request"
+])
+OrderSendResult = namedtuple("OrderSendResult", [
+    "retcode", "deal", "order", "volume", "price", "bid", "ask", "comment", "request_id", "retcode_external", "request"
+])
+
+# Milliseconds into its M1 bar of every simulated tick: the open, the low and high and the close of the bar
+TICK_OFFSETS_MSC = (0, 15000, 30000, 45000)
+
+# Default spec of symbols added without one
+DEFAULT_SYMBOL_SPEC = {
+    "digits": 2,
+    "spread": 2,
+    "point": 0.01,
+    "volume_min": 0.01,
+    "volume_max": 100.0,
+    "volume_step": 0.01,
+    "trade_contract_size": 1.0,
+    "trade_tick_size": 0.01,
+    "trade_stops_level": 0,
+    "currency_base": "BCH",
+    "currency_profit": "USD"
+}
+
+def get_bar_seconds(timeframe):
+    """
+    :param timeframe: MetaTrader 5 timeframe value
+    :return: integer seconds per bar. Months are treated as 30 days
+    """
+    name = TIMEFRAME_NAMES[timeframe]
+    return utils.TIMEFRAME_SECONDS.get(name, 30 * 24 * 60 * 60)
+
+class SimulatedBroker:
+    """
+    In-memory broker: symbol specs, replayed candles, a simulated clock and a pending-order book
+    """
+
+    def __init__(self, start_time=1_700_000_000, history_bars=1000, latency=0.0, latency_jitter=0.0, balance=10000.0, seed=0):
+        """
+        :param start_time: server time in seconds of the first synthetic bar
+        :param history_bars: number of closed M1 bars available before the clock is advanced
+        :param latency: seconds every call takes
+        :param latency_jitter: extra random seconds, up to this much, added to every call
+        :param balance: account balance reported by order_check
+        :param seed: random seed of the synthetic candles
+        """
+        self.start_time = start_time
+        self.now = start_time + history_bars * 60
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.balance = balance
+        self.seed = seed
+
+        self.connected = False
+        # Set by disconnect. Every call but initialize, login and shutdown then fails until initialize
+        self.dropped = False
+        self.error = (RES_S_OK, "Success")
+        self.symbols = {}
+        self.candles = {}
+        # (symbol, timeframe) keys replayed from load_candles instead of synthetic candles
+        self.loaded = set()
+        self.orders = {}
+        self.positions = {}
+        self.next_ticket = 1
+        # (monotonic time, symbol, retcode) of every order_send
+        self.send_log = []
+        self.lock = threading.RLock()
+
+    def wait(self):
+        """
+        Sleeps for the configured latency
+        """
+        delay = self.latency + (random.random() * self.latency_jitter if self.latency_jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def disconnect(self):
+        """
+        Drops the terminal connection, as when the terminal restarts or loses its network
+        """
+        self.connected = False
+        self.dropped = True
+
+    def add_symbol(self, name, **spec):
+        """
+        Adds a tradeable symbol
+        :param name: string of the symbol
+        :param spec: overrides of DEFAULT_SYMBOL_SPEC
+        """
+        self.symbols[name] = SymbolInfo(name=name, visible=False, select=False, **{**DEFAULT_SYMBOL_SPEC, **spec})
+
+    def load_candles(self, symbol, timeframe, candles):
+        """
+        Replays stored candles, e.g. from CandleStore.read, for `symbol` on `timeframe`
+        :param timeframe: MetaTrader 5 timeframe value
+        :param candles: structured array of CANDLE_DTYPE candles, oldest first
+        """
+        if symbol not in self.symbols:
+            self.add_symbol(symbol)
+        self.candles[(symbol, timeframe)] = np.asarray(candles)
+        self.loaded.add((symbol, timeframe))
+
+    def get_candles(self, symbol, timeframe):
+        """
+        :return: every candle of `symbol` on `timeframe` up to the current simulated time,
+        generating a synthetic random walk the first time a symbol and timeframe is asked for
+        """
+        key = (symbol, timeframe)
+        bar_seconds = get_bar_seconds(timeframe)
+
+        candles = self.candles.get(key)
+        needed = (self.now - self.start_time) // bar_seconds + 1
+        if candles is None or (key not in self.loaded and len(candles) < needed):
+            candles = self.generate_candles(symbol, bar_seconds, max(needed * 2, 64))
+            self.candles[key] = candles
+
+        # Bars that have opened by now. The last one is still forming
+        return candles[:np.searchsorted(candles['time'], self.now, side='right')]
+
+    def generate_candles(self, symbol, bar_seconds, num_candles):
+        """
+        :return: structured array of synthetic CANDLE_DTYPE candles starting at start_time
+        """
+        spec = self.symbols[symbol]
+        # One generator per field, so regenerating a longer history keeps the earlier candles
+        seed = [self.seed, bar_seconds] + list(symbol.encode())
+        close = np.round(100 + np.cumsum(np.random.default_rng(seed + [0]).normal(0, 0.2, num_candles)).clip(-90, None), spec.digits)
+        open_price = np.concatenate(([close[0]], close[:-1]))
+
+        candles = np.zeros(num_candles, dtype=CANDLE_DTYPE)
+        candles['time'] = self.start_time + np.arange(num_candles) * bar_seconds
+        candles['open'] = open_price
+        candles['close'] = close
+        candles['high'] = np.round(np.maximum(open_price, close) + np.random.default_rng(seed + [1]).random(num_candles) * 0.1, spec.digits)
+        candles['low'] = np.round(np.minimum(open_price, close) - np.random.default_rng(seed + [2]).random(num_candles) * 0.1, spec.digits)
+        candles['tick_volume'] = np.random.default_rng(seed + [3]).integers(1, 100, num_candles)
+        candles['spread'] = spec.spread
+        return candles
+
+    def get_bar_ticks(self, symbol, candles):
+        """
+        :param candles: CANDLE_DTYPE structured array of M1 bars
+        :return: TICK_DTYPE structured array of the ticks the bars were traded with, up to the current
+        simulated time. Each bar trades at its open, then its low and high, high first on a red bar, then its close
+        """
+        spec = self.symbols[symbol]
+        green = candles['close'] >= candles['open']
+        prices = np.stack([
+            candles['open'],
+            np.where(green, candles['low'], candles['high']),
+            np.where(green, candles['high'], candles['low']),
+            candles['close']
+        ], axis=1).ravel()
+
+        ticks = np.zeros(len(prices), dtype=TICK_DTYPE)
+        ticks['time_msc'] = (candles['time'][:, None] * 1000 + np.array(TICK_OFFSETS_MSC)).ravel()
+        ticks['time'] = ticks['time_msc'] // 1000
+        ticks['bid'] = prices
+        ticks['ask'] = np.round(prices + spec.spread * spec.point, spec.digits)
+        ticks['last'] = prices
+        ticks['volume'] = 1
+        return ticks[:np.searchsorted(ticks['time_msc'], self.now * 1000, side='right')]
+
+    def get_ticks(self, symbol):
+        """
+        :return: TICK_DTYPE structured array of every tick of `symbol` up to the current simulated time
+        """
+        return self.get_bar_ticks(symbol, self.get_candles(symbol, TIMEFRAME_M1))
+
+    def get_tick(self, symbol):
+        """
+        :return: Tick of the latest tick of the forming M1 bar at the current simulated time
+        """
+        ticks = self.get_bar_ticks(symbol, self.get_candles(symbol, TIMEFRAME_M1)[-1:])
+        if len(ticks) == 0:
+            return Tick(self.now, 0.0, 0.0, 0.0, 0, self.now * 1000, 0, 0.0)
+        tick = ticks[-1]
+        return Tick(self.now, float(tick['bid']), float(tick['ask']), float(tick['last']), 0, self.now * 1000, 0, 0.0)
+
+    def advance(self, seconds=60):
+        """
+        Moves the simulated clock forward and fills the pending stop orders the new M1 bars reached
+        :param seconds: integer seconds to move forward
+        """
+        with self.lock:
+            previous_time = self.now
+            self.now += seconds
+
+            for ticket, order in list(self.orders.items()):
+                candles = self.get_candles(order.symbol, TIMEFRAME_M1)
+                new_bars = candles[candles['time'] >= previous_time]
+                if order.type == ORDER_TYPE_BUY_STOP:
+                    reached = (new_bars['high'] >= order.price_open).any()
+                else:
+                    reached = (new_bars['low'] <= order.price_open).any()
+                if reached:
+                    del self.orders[ticket]
+                    self.positions[ticket] = TradePosition(
+                        ticket, self.now, ORDER_TYPE_BUY if order.type == ORDER_TYPE_BUY_STOP else ORDER_TYPE_SELL,
+                        order.volume_current, order.price_open, order.sl, order.tp, order.price_open, order.symbol, order.comment
+                    )
+
+    def check_request(self, request):
+        """
+        Validates a pending order request the way the trade server does
+        :return: tuple of (retcode, comment). retcode is 0 when the request is valid
+        """
+        symbol = request.get("symbol")
+        if symbol not in self.symbols:
+            return TRADE_RETCODE_INVALID, "Invalid request"
+        spec = self.symbols[symbol]
+
+        volume = request.get("volume", 0)
+        steps = volume / spec.volume_step
+        if volume < spec.volume_min or volume > spec.volume_max or abs(steps - round(steps)) > 1e-6:
+            return TRADE_RETCODE_INVALID_VOLUME, "Invalid volume"
+
+        price = request.get("price")
+        if not isinstance(price, (int, float)) or price <= 0:
+            return TRADE_RETCODE_INVALID_PRICE, "Invalid price"
+
+        tick = self.get_tick(symbol)
+        min_distance = spec.trade_stops_level * spec.point
+        sl = request.get("sl", 0.0)
+        tp = request.get("tp", 0.0)
+
+        if request.get("type") == ORDER_TYPE_BUY_STOP:
+            if price <= tick.ask + min_distance:
+                return TRADE_RETCODE_INVALID_PRICE, "Invalid price"
+            if (sl and sl > price - min_distance) or (tp and tp < price + min_distance):
+                return TRADE_RETCODE_INVALID_STOPS, "Invalid stops"
+        elif request.get("type") == ORDER_TYPE_SELL_STOP:
+            if price >= tick.bid - min_distance:
+                return TRADE_RETCODE_INVALID_PRICE, "Invalid price"
+            if (sl and sl < price + min_distance) or (tp and tp > price - min_distance):
+                return TRADE_RETCODE_INVALID_STOPS, "Invalid stops"
+        else:
+            return TRADE_RETCODE_INVALID, "Unsupported order type"
+
+        return 0, "Done"
+
+    def order_check(self, request):
+        with self.lock:
+            retcode, comment = self.check_request(request)
+            return OrderCheckResult(retcode, self.balance, self.balance, 0.0, 0.0, self.balance, 0.0, comment, request)
+
+    def order_send(self, request):
+        with self.lock:
+            action = request.get("action")
+            order_ticket = 0
+            # Modify and remove requests name the order, not its symbol
+            symbol = request.get("symbol") or getattr(self.orders.get(request.get("order")), "symbol", None)
+
+            if action == TRADE_ACTION_PENDING:
+                retcode, comment = self.check_request(request)
+                if retcode == 0:
+                    order_ticket = self.next_ticket
+                    self.next_ticket += 1
+                    self.orders[order_ticket] = TradeOrder(
+                        order_ticket, self.now, request["type"], request["volume"], request["volume"], request["price"],
+                        request.get("sl", 0.0), request.get("tp", 0.0), request["price"], request["symbol"], request.get("comment", "")
+                    )
+                    retcode = TRADE_RETCODE_DONE
+            elif action == TRADE_ACTION_MODIFY:
+                order_ticket = request.get("order")
+                order = self.orders.get(order_ticket)
+                if order is None:
+                    retcode, comment = TRADE_RETCODE_INVALID_ORDER, "Invalid order"
+                else:
+                    price = request.get("price", order.price_open)
+                    sl = request.get("sl", order.sl)
+                    tp = request.get("tp", order.tp)
+                    retcode, comment = self.check_request({
+                        "symbol": order.symbol, "volume": order.volume_current, "type": order.type, "price": price, "sl": sl, "tp": tp
+                    })
+                    if retcode == 0:
+                        self.orders[order_ticket] = order._replace(price_open=price, sl=sl, tp=tp, price_current=price)
+                        retcode, comment = TRADE_RETCODE_DONE, "Request executed"
+            elif action == TRADE_ACTION_REMOVE:
+                order_ticket = request.get("order")
+                if order_ticket in self.orders:
+                    del self.orders[order_ticket]
+                    retcode, comment = TRADE_RETCODE_DONE, "Request executed"
+                else:
+                    retcode, comment = TRADE_RETCODE_INVALID_ORDER, "Invalid order"
+            else:
+                retcode, comment = TRADE_RETCODE_INVALID, "Unsupported trade action"
+
+            self.send_log.append((time.monotonic(), symbol, retcode))
+            return OrderSendResult(retcode, 0, order_ticket, request.get("volume", 0.0), request.get("price", 0.0), 0.0, 0.0, comment, 0, 0, request)
+
+# The broker every module-level function talks to
+broker = SimulatedBroker()
+
+def configure(**kwargs):
+    """
+    Replaces the simulated broker, e.g. configure(latency=0.002, history_bars=5000)
+    :param kwargs: SimulatedBroker arguments
+    :return: the new SimulatedBroker
+    """
+    global broker
+    broker = SimulatedBroker(**kwargs)
+    return broker
+
+def simulated(function):
+    """
+    Decorator that applies the configured latency to a MetaTrader 5 function
+    """
+    def wrapper(*args, **kwargs):
+        broker.wait()
+        if broker.dropped and function.__name__ not in ("initialize", "login", "shutdown", "terminal_info"):
+            broker.error = (RES_E_INTERNAL_FAIL_CONNECT, "IPC initialize failed, MetaTrader 5 x64 not found")
+            return None
+        return function(*args, **kwargs)
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+@simulated
+def initialize(path=None, login=None, password=None, server=None, timeout=None, portable=False):
+    broker.connected = True
+    broker.dropped = False
+    broker.error = (RES_S_OK, "Success")
+    return True
+
+@simulated
+def login(login=None, password=None, server=None, timeout=None):
+    return broker.connected
+
+@simulated
+def shutdown():
+    broker.connected = False
+    return True
+
+@simulated
+def terminal_info():
+    if not broker.connected:
+        return None
+    return TerminalInfo(True, True, "simulated")
+
+def last_error():
+    return broker.error
+
+@simulated
+def symbols_get(group=None):
+    return tuple(broker.symbols.values())
+
+@simulated
+def symbol_info(symbol):
+    return broker.symbols.get(symbol)
+
+@simulated
+def symbol_select(symbol, enable=True):
+    if symbol not in broker.symbols:
+        broker.error = (RES_E_NOT_FOUND, "Terminal: Not found")
+        return False
+    broker.symbols[symbol] = broker.symbols[symbol]._replace(visible=enable, select=enable)
+    return True
+
+@simulated
+def symbol_info_tick(symbol):
+    if symbol not in broker.symbols:
+        return None
+    return broker.get_tick(symbol)
+
+@simulated
+def copy_rates_from_pos(symbol, timeframe, start_pos, count):
+    if symbol not in broker.symbols:
+        broker.error = (RES_E_INVALID_PARAMS, "Terminal: Invalid params")
+        return None
+    with broker.lock:
+        candles = broker.get_candles(symbol, timeframe)
+    end = len(candles) - start_pos
+    if end <= 0:
+        return np.zeros(0, dtype=CANDLE_DTYPE)
+    return candles[max(end - count, 0):end].copy()
+
+@simulated
+def copy_rates_range(symbol, timeframe, date_from, date_to):
+    if symbol not in broker.symbols:
+        broker.error = (RES_E_INVALID_PARAMS, "Terminal: Invalid params")
+        return None
+    with broker.lock:
+        candles = broker.get_candles(symbol, timeframe)
+    times = candles['time']
+    return candles[np.searchsorted(times, int(date_from)):np.searchsorted(times, int(date_to), side='right')].copy()
+
+@simulated
+def copy_ticks_from(symbol, date_from, count, flags=COPY_TICKS_ALL):
+    if symbol not in broker.symbols:
+        broker.error = (RES_E_INVALID_PARAMS, "Terminal: Invalid params")
+        return None
+    date_from = int(date_from.timestamp()) if hasattr(date_from, "timestamp") else int(date_from)
+    with broker.lock:
+        ticks = broker.get_ticks(symbol)
+    start = np.searchsorted(ticks['time'], date_from)
+    return ticks[start:start + count].copy()
+
+@simulated
+def orders_get(symbol=None, group=None, ticket=None):
+    with broker.lock:
+        orders = tuple(broker.orders.values())
+    if symbol is not None:
+        orders = tuple(order for order in orders if order.symbol == symbol)
+    if ticket is not None:
+        orders = tuple(order for order in orders if order.ticket == ticket)
+    return orders
+
+@simulated
+def orders_total():
+    return len(broker.orders)
+
+@simulated
+def positions_get(symbol=None, group=None, ticket=None):
+    with broker.lock:
+        positions = tuple(broker.positions.values())
+    if symbol is not None:
+        positions = tuple(position for position in positions if position.symbol == symbol)
+    return positions
+
+@simulated
+def order_check(request):
+    return broker.order_check(request)
+
+@simulated
+def order_send(request):
+    return broker.order_send(request)
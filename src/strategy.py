@@ -0,0 +1,344 @@
+import abc
+from concurrent.futures import ThreadPoolExecutor
+import inspect
+
+import numpy as np
+
+from candle_buffer import CandleBuffer
+import ema_cross_strategy as strats
+import indicator_lib
+import instrumentation
+import mt5_lib
+import utils
+
+# Candles kept per symbol and timeframe by the indicator cache. Raised to fit longer histories
+CACHE_CAPACITY = 256
+
+# Strategy classes by the name settings.json refers to them with. Filled by register_strategy
+strategy_types = {}
+
+# Indicator classes by the prefix of their column name, e.g. "ema" for "ema_50"
+indicator_types = {}
+
+def register_strategy(name):
+    """
+    Class decorator registering a Strategy subclass under `name`. Raises TypeError if the class leaves
+    an abstract method such as on_bar unimplemented
+    """
+    def decorator(strategy_class):
+        if inspect.isabstract(strategy_class):
+            missing = ", ".join(sorted(strategy_class.__abstractmethods__))
+            raise TypeError(f"Strategy {name} does not implement {missing}.")
+        strategy_class.name = name
+        strategy_types[name] = strategy_class
+        return strategy_class
+    return decorator
+
+def register_indicator(prefix):
+    """
+    Class decorator registering an indicator class for the columns named `prefix`_<length>
+    """
+    def decorator(indicator_class):
+        indicator_types[prefix] = indicator_class
+        return indicator_class
+    return decorator
+
+def create_indicator(name):
+    """
+    :param name: string of an indicator column name, e.g. "ema_50" from utils.get_ema_name
+    :return: a new indicator of the registered class
+    """
+    prefix, _, length = name.rpartition("_")
+    if prefix not in indicator_types or not length.isdigit():
+        raise ValueError(f"{name} is not a known indicator.")
+    return indicator_types[prefix](int(length))
+
+@register_indicator("ema")
+class EmaIndicator:
+    """
+    EMA of the close prices. Calculated over the buffered candles once, then advanced one candle at a time
+    """
+
+    def __init__(self, length):
+        """
+        :param length: integer EMA size
+        """
+        self.name = utils.get_ema_name(length)
+        # Candles needed for the first EMA value
+        self.history = length + 1
+        self.ema = indicator_lib.IncrementalEma(length)
+
+    @property
+    def ready(self):
+        return self.ema.ready
+
+    def calculate(self, candle_buffer):
+        """
+        :param candle_buffer: candle_buffer.CandleBuffer of the symbol
+        :return: float array of the EMA of every buffered candle. The EMA then follows the latest one
+        """
+        values = indicator_lib.calc_ema_array(candle_buffer.column('close'), self.ema.ema_size)
+        self.ema.value = float(values[-1]) if len(values) > 0 else 0.00
+        # Warm-up rows are zero-filled by calc_ema_array
+        self.ema.ready = self.ema.value != 0.00
+        return values
+
+    def update(self, candle):
+        """
+        :param candle: CANDLE_DTYPE record of the new candle
+        :return: the EMA of the new candle
+        """
+        return self.ema.update(candle['close'])
+
+class CacheEntry:
+    """
+    Buffered candles and indicators of one symbol and timeframe, as of the candle at `last_time`
+    """
+
+    def __init__(self, candle_buffer, indicators):
+        self.candle_buffer = candle_buffer
+        self.indicators = indicators
+        self.last_time = candle_buffer.get('time').item()
+
+class IndicatorCache:
+    """
+    Shares candles and indicators between every strategy running on a symbol and timeframe. Each new
+    candle is fetched once and every distinct indicator is advanced once, whatever the number of
+    strategies reading it
+    """
+
+    def __init__(self, capacity=CACHE_CAPACITY):
+        """
+        :param capacity: integer number of candles kept per symbol and timeframe
+        """
+        self.capacity = capacity
+        # CacheEntry keyed by (symbol, timeframe)
+        self.entries = {}
+
+    def update(self, symbol, timeframe, indicator_names, history):
+        """
+        Brings the candles and indicators of `symbol` up to date. Advances them by one candle when
+        exactly one new candle closed since the last update and only reseeds from history on a start,
+        a gap or a newly requested indicator
+        :param symbol: string of the symbol
+        :param timeframe: string of the timeframe
+        :param indicator_names: list of indicator column names, e.g. ["ema_1", "ema_2"]
+        :param history: integer number of candles the strategies need
+        :return: candle_buffer.CandleBuffer holding the indicator columns. None if there is no new candle
+        """
+        key = (symbol, timeframe)
+        entry = self.entries.get(key)
+
+        if entry is not None and set(indicator_names) <= set(entry.indicators) and len(entry.candle_buffer) >= history:
+            # The candle we hold plus the newest closed candle
+            latest_candles = mt5_lib.get_candle_records(symbol, timeframe, 2)
+
+            if len(latest_candles) == 2:
+                # Nothing closed since the last update
+                if latest_candles['time'][-1] == entry.last_time:
+                    return None
+
+                # Exactly one new candle, advance in O(1)
+                if latest_candles['time'][0] == entry.last_time:
+                    candle = latest_candles[-1]
+                    entry.candle_buffer.append(candle)
+                    entry.last_time = candle['time'].item()
+                    self.advance(entry, candle)
+                    return entry.candle_buffer
+
+        # Start, gap or new indicator: reseed from history
+        names = set(indicator_names) | (set(entry.indicators) if entry is not None else set())
+        indicators = {name: create_indicator(name) for name in sorted(names)}
+        history = max([history] + [indicator.history + 1 for indicator in indicators.values()])
+
+        candles = mt5_lib.get_candle_records(symbol, timeframe, history)
+        if len(candles) == 0:
+            return None
+
+        candle_buffer = CandleBuffer(max(self.capacity, history), {name: np.float64 for name in indicators})
+        candle_buffer.extend(candles)
+        with instrumentation.span("indicators", symbol):
+            for name, indicator in indicators.items():
+                candle_buffer.set_column(name, indicator.calculate(candle_buffer))
+
+        self.entries[key] = CacheEntry(candle_buffer, indicators)
+        return candle_buffer
+
+    def advance(self, entry, candle):
+        """
+        Folds the new candle just appended to `entry` into every indicator
+        """
+        with instrumentation.span("indicators"):
+            for name, indicator in entry.indicators.items():
+                if indicator.ready:
+                    entry.candle_buffer.set(name, indicator.update(candle))
+                else:
+                    # Still warming up, calculate over the buffered candles
+                    entry.candle_buffer.set_column(name, indicator.calculate(entry.candle_buffer))
+
+class Strategy(abc.ABC):
+    """
+    Base class of the strategies run by run_strategies. A strategy declares the indicator columns and
+    the number of candles it needs and turns every new candle into mt5_lib.process_order_batch intents
+    """
+
+    # Set by register_strategy
+    name = None
+
+    def __init__(self, balance, risk_pct, comment=None):
+        """
+        :param balance: Float. Trade balance
+        :param risk_pct: Float. Risk amount as a percentage
+        :param comment: string of the order comment identifying this strategy's orders. Defaults to the strategy name
+        """
+        self.balance = balance
+        self.risk_pct = risk_pct
+        self.comment = comment or self.name
+
+    def get_indicators(self):
+        """
+        :return: list of the indicator column names the strategy reads
+        """
+        return []
+
+    def get_history(self):
+        """
+        :return: integer number of candles the strategy needs
+        """
+        return 2
+
+    @abc.abstractmethod
+    def on_bar(self, symbol, timeframe, candle_buffer):
+        """
+        Called once per new closed candle
+        :param symbol: string of the symbol
+        :param timeframe: string of the timeframe
+        :param candle_buffer: candle_buffer.CandleBuffer of the candles and indicator columns. Must not be modified
+        :return: list of intents. Empty if no trade should be made
+        """
+
+@register_strategy("ema_cross")
+class EmaCrossStrategy(Strategy):
+    """
+    The EMA Cross strategy of ema_cross_strategy, reading its EMAs from the indicator cache
+    """
+
+    def __init__(self, balance, risk_pct, short_term_ema_length, long_term_ema_length, comment=strats.STRATEGY_COMMENT):
+        """
+        :param short_term_ema_length: integer of the lowest timeframe length for EMA
+        :param long_term_ema_length: integer of the highest timeframe length for EMA
+        """
+        if long_term_ema_length <= short_term_ema_length:
+            raise ValueError("Long-term EMA length must be larger than short-term EMA length")
+
+        super().__init__(balance, risk_pct, comment)
+        self.short_term_ema_name = utils.get_ema_name(short_term_ema_length)
+        self.long_term_ema_name = utils.get_ema_name(long_term_ema_length)
+        self.long_term_ema_length = long_term_ema_length
+
+    def get_indicators(self):
+        return [self.short_term_ema_name, self.long_term_ema_name]
+
+    def get_history(self):
+        return self.long_term_ema_length + 2
+
+    def on_bar(self, symbol, timeframe, candle_buffer):
+        if len(candle_buffer) < 2:
+            return []
+
+        short_term_ema = candle_buffer.column(self.short_term_ema_name)[-2:]
+        long_term_ema = candle_buffer.column(self.long_term_ema_name)[-2:]
+        position = short_term_ema > long_term_ema
+
+        # Only a warmed up long-term EMA can trade
+        ema_cross = bool(position[0] != position[1]) and long_term_ema[-1] != 0.0
+
+        stop_loss, stop_price, take_profit = strats.calc_trade_levels(
+            [ema_cross],
+            long_term_ema[-1:],
+            candle_buffer.column('open')[-1:],
+            candle_buffer.column('close')[-1:],
+            candle_buffer.column('high')[-1:],
+            candle_buffer.column('low')[-1:]
+        )
+
+        trade_event = {
+            'open': candle_buffer.get('open').item(),
+            'close': candle_buffer.get('close').item(),
+            'ema_cross': ema_cross,
+            'stop_loss': stop_loss[0],
+            'stop_price': stop_price[0],
+            'take_profit': take_profit[0]
+        }
+        return strats.get_trade_intents(symbol, trade_event, self.balance, self.risk_pct, self.comment)
+
+def create_strategy(strategy_settings, balance, risk_pct):
+    """
+    :param strategy_settings: dict with the registered strategy "name" and its parameters
+    :param balance: Float. Trade balance used when the settings don't set one
+    :param risk_pct: Float. Risk amount used when the settings don't set one
+    :return: the configured Strategy
+    """
+    parameters = dict(strategy_settings)
+    name = parameters.pop("name", None)
+    if name not in strategy_types:
+        raise ValueError(f"{name} is not a registered strategy.")
+
+    parameters.setdefault("balance", balance)
+    parameters.setdefault("risk_pct", risk_pct)
+    return strategy_types[name](**parameters)
+
+def get_symbol_intents(strategies, symbol, timeframe, indicator_cache):
+    """
+    Updates the shared candles and indicators of `symbol` once and collects the intents of every strategy
+    :return: list of intents. Empty if there is no new candle
+    """
+    indicator_names = sorted({name for strategy in strategies for name in strategy.get_indicators()})
+    history = max(strategy.get_history() for strategy in strategies)
+
+    with instrumentation.tag(symbol):
+        candle_buffer = indicator_cache.update(symbol, timeframe, indicator_names, history)
+        if candle_buffer is None:
+            return []
+
+        intents = []
+        for strategy in strategies:
+            intents.extend(strategy.on_bar(symbol, timeframe, candle_buffer))
+        return intents
+
+def run_strategies(strategies, symbols, timeframe, indicator_cache, pool_size=1):
+    """
+    Runs every strategy on every symbol. The intents of all symbols are sent as one batch
+    :param strategies: list of Strategy
+    :param symbols: list of symbols
+    :param timeframe: string of the timeframe
+    :param indicator_cache: IndicatorCache shared by the strategies
+    :param pool_size: integer number of symbols computed at once
+    :return: dict of (symbol, strategy comment) to its order outcome, or the exception the symbol raised
+    """
+    results = {(symbol, strategy.comment): False for symbol in symbols for strategy in strategies}
+    intents = []
+
+    with ThreadPoolExecutor(max_workers=max(1, pool_size)) as compute_pool:
+        futures = {
+            symbol: compute_pool.submit(get_symbol_intents, strategies, symbol, timeframe, indicator_cache)
+            for symbol in symbols
+        }
+        for symbol, future in futures.items():
+            try:
+                intents.extend(future.result())
+            except Exception as e:
+                for strategy in strategies:
+                    results[(symbol, strategy.comment)] = e
+
+    if intents:
+        for order_result in mt5_lib.process_order_batch(intents):
+            intent = order_result["intent"]
+            if intent["action"] != "place":
+                continue
+            if order_result["success"]:
+                results[(intent["symbol"], intent["comment"])] = order_result["orders"][0]
+            else:
+                results[(intent["symbol"], intent["comment"])] = Exception(f"Order Code: {order_result['retcode']}. {order_result['comment']}")
+
+    return results
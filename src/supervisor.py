@@ -0,0 +1,302 @@
+import argparse
+import copy
+import multiprocessing
+import os
+import queue
+import time
+
+import instrumentation
+import main as bot
+import mt5_lib
+import utils
+
+# Path to the list of accounts and their symbol shards
+ACCOUNTS_FILE_PATH = "./accounts.json"
+
+# Seconds before a crashed worker is restarted. Doubles with every crash in a row up to MAX_RESTART_DELAY
+RESTART_DELAY = 5.0
+MAX_RESTART_DELAY = 300.0
+
+# Seconds a worker has to stay up for its crash count to be reset
+STABLE_SECONDS = 600.0
+
+# Seconds between checks of the workers while no message comes in
+POLL_INTERVAL = 1.0
+
+# Least seconds between two health messages of a worker, e.g. while it streams ticks
+HEARTBEAT_INTERVAL = 5.0
+
+def assign_shards(accounts, symbols):
+    """
+    Assigns every symbol to one account. Accounts that list their own symbols keep them, the
+    other symbols are spread round-robin over the accounts that don't list any
+    :param accounts: list of account dicts from accounts.json
+    :param symbols: list of symbols of settings.json
+    :return: dict of account name to its list of symbols
+    """
+    shards = {account["name"]: list(account.get("symbols", [])) for account in accounts}
+    assigned = {symbol for shard in shards.values() for symbol in shard}
+    open_accounts = [account["name"] for account in accounts if not account.get("symbols")]
+
+    remaining = [symbol for symbol in symbols if symbol not in assigned]
+    if remaining and not open_accounts:
+        print(f"No account left to trade {remaining}. Give them to an account in {ACCOUNTS_FILE_PATH}.")
+    for n, symbol in enumerate(remaining if open_accounts else []):
+        shards[open_accounts[n % len(open_accounts)]].append(symbol)
+    return shards
+
+def build_worker_settings(json_settings, account, symbols, export_metrics):
+    """
+    :param json_settings: json of project settings, shared by every account
+    :param account: account dict from accounts.json. Its optional "settings" override the mt5 settings
+    :param symbols: list of the symbols of the account's shard
+    :param export_metrics: Boolean. True if the worker hands its latency histograms to the supervisor
+    :return: json of the settings the worker runs with
+    """
+    worker_settings = copy.deepcopy(json_settings)
+    worker_settings["mt5"].update(account.get("settings", {}))
+    worker_settings["mt5"]["symbols"] = symbols
+
+    # One journal per account, as the journal files take one writer each
+    if worker_settings["mt5"].get("journal_path"):
+        worker_settings["mt5"]["journal_path"] = os.path.join(worker_settings["mt5"]["journal_path"], account["name"])
+
+    # The supervisor exports the metrics of every worker in one place
+    worker_settings["mt5"].pop("metrics_file", None)
+    worker_settings["mt5"].pop("metrics_port", None)
+    worker_settings["mt5"]["metrics_enabled"] = export_metrics
+    return worker_settings
+
+def run_worker(name, json_settings, credentials, messages):
+    """
+    Runs the bot for one account in its own process, with its own MetaTrader 5 connection. Sends
+    ("health", name, status), ("results", name, results) and ("metrics", name, histograms) messages
+    to the supervisor. Health is sent every time the bot wakes up, so a worker whose market is closed
+    still counts as alive. Exits when the terminal can't be reconnected, so the supervisor restarts it
+    :param name: string name of the account
+    :param json_settings: json of the worker settings from build_worker_settings
+    :param credentials: json of the account's MetaTrader 5 login details
+    :param messages: multiprocessing queue read by the supervisor
+    """
+    def on_results(results):
+        # Exceptions may not survive pickling, so they are sent as their message
+        messages.put(("results", name, {
+            symbol: Exception(str(outcome)) if isinstance(outcome, Exception) else outcome
+            for symbol, outcome in results.items()
+        }))
+        if json_settings["mt5"].get("metrics_enabled", False):
+            messages.put(("metrics", name, instrumentation.drain()))
+
+    last_heartbeat = None
+    def on_heartbeat():
+        nonlocal last_heartbeat
+        now = time.monotonic()
+        if last_heartbeat is not None and now - last_heartbeat < HEARTBEAT_INTERVAL:
+            return
+        last_heartbeat = now
+
+        # Reconnects in place. Only a terminal that stays unreachable gets the worker restarted
+        if not mt5_lib.mt5.ensure_connected():
+            raise ConnectionError(f"MetaTrader 5 terminal of {name} disconnected")
+        messages.put(("health", name, "running"))
+
+    messages.put(("health", name, "connecting"))
+    try:
+        bot.run_bot(json_settings, credentials, on_results, on_heartbeat)
+    except Exception as e:
+        messages.put(("health", name, f"failed: {e}"))
+        raise SystemExit(1)
+
+class Worker:
+    """
+    State of the worker process of one account
+    """
+
+    def __init__(self, account, symbols, heartbeat_timeout):
+        self.account = account
+        self.name = account["name"]
+        self.symbols = symbols
+        # Seconds without a message after which the worker counts as hung
+        self.heartbeat_timeout = heartbeat_timeout
+        self.process = None
+        self.status = "stopped"
+        self.started_at = None
+        # Time of the last message, for the heartbeat timeout
+        self.last_seen = None
+        self.crashes = 0
+        self.restart_at = None
+
+class Supervisor:
+    """
+    Runs one worker process per account, each with its own terminal connection and symbol shard,
+    and restarts the workers that crash, disconnect or stop reporting. Health, order results and
+    latency histograms of every worker come in over one multiprocessing queue
+    """
+
+    def __init__(self, accounts, json_settings, heartbeat_timeout=None, target=run_worker):
+        """
+        :param accounts: list of account dicts from accounts.json, with a "name", the path of its
+        "credentials" file and optionally its "symbols" and "settings" overrides
+        :param json_settings: json of project settings, shared by every account
+        :param heartbeat_timeout: seconds without a message after which a worker counts as hung.
+        Defaults to two bars of the timeframe plus a minute
+        :param target: function run in every worker process, with the arguments of run_worker
+        """
+        self.json_settings = json_settings
+        self.target = target
+
+        # Spawned rather than forked, so every worker loads its own MetaTrader5 module
+        self.context = multiprocessing.get_context("spawn")
+        self.messages = self.context.Queue()
+
+        self.metrics_file = json_settings["mt5"].get("metrics_file")
+        self.metrics_port = json_settings["mt5"].get("metrics_port")
+        self.export_metrics = bool(json_settings["mt5"].get("metrics_enabled", False) or self.metrics_file or self.metrics_port)
+
+        shards = assign_shards(accounts, json_settings["mt5"]["symbols"])
+        self.workers = {}
+        for account in accounts:
+            # Accounts may trade another timeframe
+            timeframe = account.get("settings", {}).get("timeframe", json_settings["mt5"]["timeframe"])
+            timeout = heartbeat_timeout or 2 * utils.TIMEFRAME_SECONDS.get(timeframe, 31 * 24 * 60 * 60) + 60
+            self.workers[account["name"]] = Worker(account, shards[account["name"]], timeout)
+
+    def start(self):
+        """
+        Starts every worker and the metrics export
+        """
+        if self.export_metrics:
+            instrumentation.enable()
+            if self.metrics_port:
+                instrumentation.start_metrics_server(self.metrics_port)
+        for worker in self.workers.values():
+            self.start_worker(worker)
+
+    def start_worker(self, worker):
+        """
+        Starts the process of `worker`
+        """
+        credentials = bot.get_json_from_file(worker.account["credentials"])
+        worker_settings = build_worker_settings(self.json_settings, worker.account, worker.symbols, self.export_metrics)
+        worker.process = self.context.Process(
+            target=self.target,
+            args=(worker.name, worker_settings, credentials, self.messages),
+            name=f"worker-{worker.name}",
+            daemon=True
+        )
+        worker.process.start()
+        worker.status = "starting"
+        worker.started_at = worker.last_seen = time.monotonic()
+        worker.restart_at = None
+        print(f"Started worker {worker.name} (pid {worker.process.pid}) for {len(worker.symbols)} symbol(s).")
+
+    def handle_message(self, message):
+        """
+        Records one message of a worker
+        :param message: tuple of (kind, account name, payload) from run_worker
+        """
+        kind, name, payload = message
+        worker = self.workers.get(name)
+        if worker is None:
+            return
+        worker.last_seen = time.monotonic()
+
+        if kind == "health":
+            worker.status = payload
+        elif kind == "results":
+            for symbol, order_number in payload.items():
+                bot.report_result(f"{name}: {symbol}", order_number)
+            if self.metrics_file:
+                instrumentation.write_metrics(self.metrics_file)
+        elif kind == "metrics":
+            instrumentation.merge(payload)
+
+    def check_workers(self):
+        """
+        Restarts the workers that exited or stopped reporting, backing off on repeated crashes
+        """
+        now = time.monotonic()
+        for worker in self.workers.values():
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    self.start_worker(worker)
+                continue
+
+            if worker.process.is_alive():
+                if now - worker.last_seen <= worker.heartbeat_timeout:
+                    if now - worker.started_at >= STABLE_SECONDS:
+                        worker.crashes = 0
+                    continue
+                print(f"Worker {worker.name} sent nothing for {worker.heartbeat_timeout:.0f} seconds. Restarting it.")
+                worker.process.terminate()
+                worker.process.join()
+
+            delay = min(MAX_RESTART_DELAY, RESTART_DELAY * 2 ** worker.crashes)
+            worker.crashes += 1
+            worker.status = f"restarting (exit code {worker.process.exitcode})"
+            worker.restart_at = now + delay
+            print(f"Worker {worker.name} stopped with exit code {worker.process.exitcode}. Restarting in {delay:.0f} seconds.")
+
+    def get_health(self):
+        """
+        :return: dict of account name to a dict of its worker's status, pid, seconds since its last message and crash count
+        """
+        now = time.monotonic()
+        return {
+            name: {
+                "status": worker.status,
+                "pid": worker.process.pid if worker.process is not None else None,
+                "last_seen": now - worker.last_seen if worker.last_seen is not None else None,
+                "crashes": worker.crashes
+            }
+            for name, worker in self.workers.items()
+        }
+
+    def poll(self, timeout=POLL_INTERVAL):
+        """
+        Handles the messages that come in within `timeout` seconds, then checks the workers
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                self.handle_message(self.messages.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        self.check_workers()
+
+    def run(self):
+        """
+        Starts the workers and supervises them until interrupted
+        """
+        self.start()
+        try:
+            while True:
+                self.poll()
+        finally:
+            self.stop()
+
+    def stop(self):
+        """
+        Stops every worker
+        """
+        for worker in self.workers.values():
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+            worker.status = "stopped"
+
+def main():
+    """
+    Runs one worker per account of accounts.json, with the settings of settings.json
+    """
+    parser = argparse.ArgumentParser(description="Run the bot on many MetaTrader 5 accounts, one worker process per account")
+    parser.add_argument("--accounts", default=ACCOUNTS_FILE_PATH, help="JSON file listing the accounts and their symbols")
+    parser.add_argument("--settings", default=bot.ACCOUNT_SETTINGS_PATH)
+    parser.add_argument("--heartbeat-timeout", type=float, help="seconds without a message after which a worker is restarted")
+    args = parser.parse_args()
+
+    accounts = bot.get_json_from_file(args.accounts)["accounts"]
+    Supervisor(accounts, bot.get_json_from_file(args.settings), args.heartbeat_timeout).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,466 @@
+import time
+
+import numpy as np
+
+from candle_buffer import CandleBuffer
+from candle_store import CANDLE_DTYPE
+import ema_cross_strategy as strats
+import indicator_lib
+import instrumentation
+import make_trade as mt
+import mt5_lib
+import utils
+
+# Ticks asked for per copy_ticks_from request
+DEFAULT_TICK_BATCH = 10000
+
+# Most ticks folded per symbol per poll, so a symbol that fell far behind can't hold up the others
+MAX_TICKS_PER_POLL = 100000
+
+# Closed bars kept per symbol
+DEFAULT_CAPACITY = 256
+
+# Seconds between two adjustments of the same pending order while its bar forms
+DEFAULT_ADJUST_INTERVAL = 1.0
+
+# Seconds between polls of the tick stream
+DEFAULT_POLL_INTERVAL = 0.1
+
+class TickBarBuilder:
+    """
+    Builds the bars of one symbol on one timeframe from its ticks, a batch of ticks at a time.
+    The forming bar is updated in place and a bar closes when the first tick of a later bar
+    arrives, or once the clock passed its end. Closed bars are kept in a CandleBuffer, so memory
+    stays bounded however long the stream runs
+    """
+
+    def __init__(self, timeframe, capacity=DEFAULT_CAPACITY):
+        """
+        :param timeframe: string of a mt5_lib.Timeframe name of a fixed length, i.e. not one_month
+        :param capacity: integer number of closed bars kept
+        """
+        if timeframe not in utils.TIMEFRAME_SECONDS:
+            raise ValueError(f"{timeframe} is not a fixed-length timeframe.")
+
+        self.timeframe = timeframe
+        self.bar_seconds = utils.TIMEFRAME_SECONDS[timeframe]
+        # Bar being built. None until its first tick arrives
+        self.forming = None
+        self.closed = CandleBuffer(capacity)
+        # Open time of the newest closed bar. Later ticks of it, e.g. after close_until closed it early, are dropped
+        self.last_closed_time = None
+
+    def seed(self, candles):
+        """
+        Replaces the closed bars with history, e.g. from mt5_lib.get_candle_records
+        :param candles: CANDLE_DTYPE structured array of closed bars, oldest first
+        """
+        self.closed.clear()
+        self.closed.extend(candles)
+        self.forming = None
+        self.last_closed_time = int(candles['time'][-1]) if len(candles) else None
+
+    def add_ticks(self, tick_times, prices):
+        """
+        Folds a batch of ticks into the forming bar
+        :param tick_times: integer array of the tick times in seconds since epoch, oldest first
+        :param prices: float array of the tick prices
+        :return: list of the CANDLE_DTYPE records of the bars closed by this batch
+        """
+        if len(prices) == 0:
+            return []
+
+        # One segment per bar the batch touches, usually just the forming one
+        bar_times = tick_times - tick_times % self.bar_seconds
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(bar_times)) + 1))
+        ends = np.append(starts[1:], len(prices))
+        highs = np.maximum.reduceat(prices, starts)
+        lows = np.minimum.reduceat(prices, starts)
+        counts = (ends - starts).astype(np.uint64)
+
+        closed_bars = []
+        for segment, start in enumerate(starts):
+            bar_time = bar_times[start]
+            bar = self.forming
+
+            # Late ticks of a closed bar
+            if self.last_closed_time is not None and bar_time <= self.last_closed_time:
+                continue
+            if bar is not None and bar_time < bar['time']:
+                continue
+            if bar is not None and bar_time != bar['time']:
+                closed_bars.append(self.close_bar())
+                bar = None
+
+            if bar is None:
+                bar = np.zeros((), dtype=CANDLE_DTYPE)
+                bar['time'] = bar_time
+                bar['open'] = prices[start]
+                bar['high'] = highs[segment]
+                bar['low'] = lows[segment]
+                self.forming = bar
+            else:
+                bar['high'] = max(bar['high'], highs[segment])
+                bar['low'] = min(bar['low'], lows[segment])
+            bar['close'] = prices[ends[segment] - 1]
+            bar['tick_volume'] += counts[segment]
+
+        return closed_bars
+
+    def close_until(self, timestamp):
+        """
+        Closes the forming bar if it ended at or before `timestamp`, e.g. when its last seconds had no ticks
+        :param timestamp: integer seconds since epoch on the server clock
+        :return: list of the CANDLE_DTYPE record of the closed bar. Empty if the bar is still forming
+        """
+        if self.forming is not None and self.forming['time'] + self.bar_seconds <= timestamp:
+            return [self.close_bar()]
+        return []
+
+    def close_bar(self):
+        """
+        Moves the forming bar to the closed bars
+        :return: CANDLE_DTYPE record of the closed bar
+        """
+        bar = self.forming
+        self.forming = None
+        self.closed.append(bar)
+        self.last_closed_time = int(bar['time'])
+        return bar
+
+class TickStream:
+    """
+    Runs the EMA Cross strategy on the forming bar of many symbols from their ticks. Each poll reads
+    the new ticks of every symbol in batches, folds them into the forming bar and evaluates the EMA
+    cross and trade levels the bar would give if it closed now, without folding it into the EMAs.
+    The pending order of a cross is placed as soon as the cross shows, moved while the high or low
+    of the bar moves its stop price, and cancelled if the cross is gone before the bar closes. When
+    the bar closes, the order holds the levels the closed-bar strategy would have placed it with
+    """
+
+    def __init__(
+        self,
+        symbols,
+        timeframe,
+        short_term_ema_length,
+        long_term_ema_length,
+        balance,
+        risk_pct,
+        comment=strats.STRATEGY_COMMENT,
+        tick_batch=DEFAULT_TICK_BATCH,
+        capacity=DEFAULT_CAPACITY,
+        adjust_interval=DEFAULT_ADJUST_INTERVAL
+    ):
+        """
+        :param symbols: list of symbols
+        :param timeframe: string of a fixed-length timeframe
+        :param short_term_ema_length: integer of the lowest timeframe length for EMA
+        :param long_term_ema_length: integer of the highest timeframe length for EMA
+        :param balance: Float. Trade balance
+        :param risk_pct: Float. Risk amount as a percentage
+        :param comment: string of the order comment identifying the strategy's orders
+        :param tick_batch: integer number of ticks asked for per request
+        :param capacity: integer number of closed bars kept per symbol
+        :param adjust_interval: seconds between two adjustments of the same pending order while its bar forms
+        """
+        if long_term_ema_length <= short_term_ema_length:
+            raise ValueError("Long-term EMA length must be larger than short-term EMA length")
+
+        self.symbols = list(symbols)
+        self.timeframe = timeframe
+        self.short_term_ema_length = short_term_ema_length
+        self.long_term_ema_length = long_term_ema_length
+        self.balance = balance
+        self.risk_pct = risk_pct
+        self.comment = comment
+        self.tick_batch = tick_batch
+        self.adjust_interval = adjust_interval
+
+        self.builders = {symbol: TickBarBuilder(timeframe, max(capacity, long_term_ema_length + 2)) for symbol in self.symbols}
+        # EMA state of the closed bars per symbol
+        self.states = {}
+        # Tick cursor per symbol: (time_msc the next ticks start at, number of ticks with that time_msc folded already)
+        self.cursors = {}
+        # Latest signal per symbol: dict of its bar time, the place intent of its order, the order
+        # ticket once placed and whether the order may still be moved
+        self.signals = {}
+        # Latest (bid, ask) per symbol
+        self.quotes = {}
+        # Time of the newest tick of any symbol, the stream's clock
+        self.last_tick_time = None
+
+    def seed(self):
+        """
+        Seeds the closed bars and EMAs of every symbol from history and starts reading ticks at the
+        open of the forming bar, so the forming bar is built from all of its ticks
+        """
+        for symbol in self.symbols:
+            candles = mt5_lib.get_candle_records(symbol, self.timeframe, self.long_term_ema_length + 2)
+            self.builders[symbol].seed(candles)
+            self.seed_state(symbol, candles)
+
+            forming_candle = mt5_lib.get_forming_candle(symbol, self.timeframe)
+            if forming_candle is not None:
+                start = int(forming_candle['time'])
+            elif len(candles):
+                start = int(candles['time'][-1]) + self.builders[symbol].bar_seconds
+            else:
+                print(f"No candles for {symbol}. Not streaming its ticks.")
+                continue
+            self.cursors[symbol] = (start * 1000, 0)
+
+    def seed_state(self, symbol, candles):
+        """
+        Seeds the EMA state of `symbol` from closed bars
+        :param candles: CANDLE_DTYPE structured array of closed bars, oldest first
+        """
+        state = indicator_lib.IncrementalEmaCross(self.short_term_ema_length, self.long_term_ema_length)
+        if len(candles):
+            state.short_term_ema.seed(candles['close'])
+            state.long_term_ema.seed(candles['close'])
+            state.position = state.short_term_ema.value > state.long_term_ema.value
+            state.last_time = int(candles['time'][-1])
+        self.states[symbol] = state
+
+    def fetch_ticks(self, symbol):
+        """
+        Reads the ticks of `symbol` since the last poll, `tick_batch` at a time and at most MAX_TICKS_PER_POLL
+        :return: TICK_DTYPE structured array of the new ticks, oldest first
+        """
+        last_msc, seen = self.cursors[symbol]
+        count = self.tick_batch
+        batches = []
+        total = 0
+
+        while total < MAX_TICKS_PER_POLL:
+            ticks = mt5_lib.get_ticks(symbol, last_msc // 1000, count)
+            if ticks is None:
+                print(f"Could not load the ticks of {symbol}: {mt5_lib.mt5.last_error()}")
+                break
+
+            # Requests start at a whole second. Skip the ticks folded before
+            times = ticks['time_msc']
+            first = np.searchsorted(times, last_msc, side='left')
+            same = np.searchsorted(times, last_msc, side='right') - first
+            new_ticks = ticks[first + min(seen, same):]
+
+            if len(new_ticks) == 0:
+                # A full batch of ticks folded before, e.g. a burst within one second. Ask for more
+                if len(ticks) == count and count < MAX_TICKS_PER_POLL:
+                    count *= 2
+                    continue
+                break
+
+            newest_msc = int(new_ticks['time_msc'][-1])
+            newest_count = len(new_ticks) - np.searchsorted(new_ticks['time_msc'], newest_msc, side='left')
+            seen = seen + newest_count if newest_msc == last_msc else newest_count
+            last_msc = newest_msc
+            batches.append(new_ticks)
+            total += len(new_ticks)
+
+            # Caught up
+            if len(ticks) < count:
+                break
+
+        self.cursors[symbol] = (last_msc, seen)
+        if not batches:
+            return None
+        return batches[0] if len(batches) == 1 else np.concatenate(batches)
+
+    def get_trade_event(self, symbol, bar):
+        """
+        Evaluates the EMA Cross strategy on `bar` as if it closed at its current close
+        :param symbol: string of the symbol
+        :param bar: CANDLE_DTYPE record of the forming bar, or of a bar that just closed and isn't folded into the EMAs yet
+        :return: dict of the bar with its EMAs, EMA cross and trade levels. None if the EMAs aren't ready
+        """
+        state = self.states.get(symbol)
+        if bar is None or state is None or not state.ready:
+            return None
+
+        short_term_ema, long_term_ema, ema_cross = state.peek(bar['close'])
+        trade_event = {
+            'time': int(bar['time']),
+            'open': float(bar['open']),
+            'high': float(bar['high']),
+            'low': float(bar['low']),
+            'close': float(bar['close']),
+            utils.get_ema_name(self.short_term_ema_length): short_term_ema,
+            utils.get_ema_name(self.long_term_ema_length): long_term_ema,
+            # Only a warmed up long-term EMA can trade
+            'ema_cross': ema_cross and long_term_ema != 0.0,
+            'stop_loss': 0.0,
+            'stop_price': 0.0,
+            'take_profit': 0.0
+        }
+
+        # Levels of a doji are skipped, as is_tradeable does
+        if strats.is_tradeable(trade_event):
+            stop_loss, stop_price, take_profit = strats.calc_trade_levels(
+                [True], [long_term_ema], [trade_event['open']], [trade_event['close']], [trade_event['high']], [trade_event['low']]
+            )
+            trade_event.update(stop_loss=stop_loss[0].item(), stop_price=stop_price[0].item(), take_profit=take_profit[0].item())
+
+        return trade_event
+
+    def get_intents(self, symbol, trade_event, closing=False):
+        """
+        Builds the intents that bring the pending order of `symbol` in line with `trade_event`
+        :param symbol: string of the symbol
+        :param trade_event: dict from get_trade_event
+        :param closing: Boolean. True if the bar of `trade_event` just closed. Its order is then sent the way
+        the closed-bar strategy sends it, without waiting for the market or the adjust interval
+        :return: list of mt5_lib.process_order_batch intents
+        """
+        if trade_event is None:
+            return []
+
+        signal = self.signals.get(symbol)
+        # The latest signal came from this bar
+        current = signal is not None and signal["bar_time"] == trade_event['time']
+
+        if not strats.is_tradeable(trade_event):
+            # The cross went away before the bar closed
+            if current and signal["ticket"] is not None:
+                ticket, signal["ticket"] = signal["ticket"], None
+                signal["withdrawn"] = True
+                return [{"action": "cancel", "ticket": ticket, "symbol": symbol, "comment": self.comment}]
+            return []
+
+        if not closing:
+            # A stop at the market, e.g. a sell stop while the bar is making its low, would be
+            # rejected. Wait for the market to move away from it or for the bar to close
+            if not self.is_away_from_market(symbol, trade_event):
+                return []
+            if current and time.monotonic() - signal["adjusted_at"] < self.adjust_interval:
+                return []
+
+        if not current or signal["withdrawn"]:
+            intents = strats.get_trade_intents(symbol, trade_event, self.balance, self.risk_pct, self.comment)
+            self.signals[symbol] = {
+                "bar_time": trade_event['time'],
+                "intent": intents[-1],
+                "ticket": None,
+                "adjustable": True,
+                "withdrawn": False,
+                "adjusted_at": time.monotonic()
+            }
+            return intents
+
+        if signal["ticket"] is None or not signal["adjustable"]:
+            return []
+
+        placed = signal["intent"]
+        levels = (trade_event['stop_loss'], trade_event['stop_price'], trade_event['take_profit'])
+        if levels == (placed["stop_loss"], placed["stop_price"], placed["take_profit"]):
+            return []
+
+        intent = mt.build_trade_intent(self.balance, self.comment, self.risk_pct, symbol, trade_event['take_profit'], trade_event['stop_loss'], trade_event['stop_price'])
+        signal["intent"] = intent
+        signal["adjusted_at"] = time.monotonic()
+
+        # A pending order keeps its side and volume when it is moved. Otherwise it is replaced
+        if intent["order_type"] == placed["order_type"] and intent["volume"] == placed["volume"]:
+            return [dict(intent, action="modify", ticket=signal["ticket"])]
+
+        ticket, signal["ticket"] = signal["ticket"], None
+        return [{"action": "cancel", "ticket": ticket, "symbol": symbol, "comment": self.comment}, intent]
+
+    def is_away_from_market(self, symbol, trade_event):
+        """
+        :return: Boolean. True if the stop price of `trade_event` is above the ask for a buy or below the bid for a sell
+        """
+        bid, ask = self.quotes.get(symbol, (None, None))
+        if bid is None:
+            return True
+        if trade_event['open'] < trade_event['close']:
+            return trade_event['stop_price'] > ask
+        return trade_event['stop_price'] < bid
+
+    def execute(self, intents, results):
+        """
+        Sends `intents` as one batch and records the tickets of the placed orders
+        :param intents: list of mt5_lib.process_order_batch intents
+        :param results: dict of symbol to its order outcome, updated in place
+        """
+        if not intents:
+            return
+
+        for order_result in mt5_lib.process_order_batch(intents):
+            intent = order_result["intent"]
+            signal = self.signals.get(intent["symbol"])
+            if intent["action"] == "cancel":
+                continue
+
+            if order_result["success"]:
+                results[intent["symbol"]] = order_result["orders"][0]
+                if signal is not None and (signal["intent"] is intent or intent["action"] == "modify"):
+                    signal["ticket"] = order_result["orders"][0]
+            else:
+                results[intent["symbol"]] = Exception(f"Order Code: {order_result['retcode']}. {order_result['comment']}")
+                if signal is None:
+                    continue
+                if intent["action"] == "modify":
+                    # The order filled or was removed on the terminal. It is left as it is
+                    signal["adjustable"] = False
+                elif signal["intent"] is intent:
+                    # Placed again on a later tick
+                    signal["withdrawn"] = True
+
+    @instrumentation.timed("tick_poll")
+    def poll(self):
+        """
+        Reads the new ticks of every symbol, closes the bars they end and places, moves or cancels
+        the pending orders of the crosses of the closed and forming bars
+        :return: dict of symbol to its order outcome, for the symbols that closed a bar or sent an order
+        """
+        results = {}
+        closing_events = {}
+        updated = []
+
+        for symbol in self.symbols:
+            if symbol not in self.cursors:
+                continue
+            ticks = self.fetch_ticks(symbol)
+            if ticks is None:
+                continue
+            updated.append(symbol)
+            self.quotes[symbol] = (float(ticks['bid'][-1]), float(ticks['ask'][-1]))
+            self.last_tick_time = max(self.last_tick_time or 0, int(ticks['time'][-1]))
+            for bar in self.builders[symbol].add_ticks(ticks['time'], ticks['bid']):
+                closing_events[symbol] = self.close_bar(symbol, bar)
+
+        # Bars of quiet symbols close once the clock of the stream passed their end
+        if self.last_tick_time is not None:
+            for symbol in self.symbols:
+                for bar in self.builders[symbol].close_until(self.last_tick_time):
+                    closing_events[symbol] = self.close_bar(symbol, bar)
+
+        for symbol in closing_events:
+            results[symbol] = False
+
+        # Orders of the bars that just closed go first, so the forming bar sees their tickets
+        intents = []
+        for symbol, trade_event in closing_events.items():
+            intents.extend(self.get_intents(symbol, trade_event, closing=True))
+        self.execute(intents, results)
+
+        intents = []
+        for symbol in updated:
+            intents.extend(self.get_intents(symbol, self.get_trade_event(symbol, self.builders[symbol].forming)))
+        self.execute(intents, results)
+
+        return results
+
+    def close_bar(self, symbol, bar):
+        """
+        Evaluates the final state of a bar that just closed and folds it into the EMAs
+        :return: dict of the closed bar from get_trade_event
+        """
+        trade_event = self.get_trade_event(symbol, bar)
+        if self.states[symbol].ready:
+            self.states[symbol].update(int(bar['time']), bar['close'])
+        else:
+            # Not enough history yet. Seed again once the closed bars are enough
+            self.seed_state(symbol, self.builders[symbol].closed.get_records(self.long_term_ema_length + 2))
+        return trade_event
@@ -1,2 +1,112 @@
+import argparse
+import calendar
+import datetime
+import time
+
 def get_ema_name(length):
     return "ema_" + str(length)
+
+# Seconds before the second request for a closed bar that hasn't shown up yet. Doubles with every
+# request up to CONFIRM_MAX_INTERVAL, so a symbol without ticks costs about six requests per bar
+CONFIRM_INTERVAL = 0.25
+CONFIRM_MAX_INTERVAL = 2.0
+# Seconds after a bar close to stop waiting for a symbol's bar
+CONFIRM_TIMEOUT = 5.0
+
+# Length of one bar in seconds for every mt5_lib.Timeframe name. one_month bars follow the calendar
+TIMEFRAME_SECONDS = {
+    "one_minute": 60,
+    "two_minutes": 2 * 60,
+    "three_minutes": 3 * 60,
+    "four_minutes": 4 * 60,
+    "five_minutes": 5 * 60,
+    "six_minutes": 6 * 60,
+    "ten_minutes": 10 * 60,
+    "twelve_minutes": 12 * 60,
+    "fifteen_minutes": 15 * 60,
+    "twenty_minutes": 20 * 60,
+    "thirty_minutes": 30 * 60,
+    "one_hour": 60 * 60,
+    "two_hours": 2 * 60 * 60,
+    "three_hours": 3 * 60 * 60,
+    "four_hours": 4 * 60 * 60,
+    "six_hours": 6 * 60 * 60,
+    "eight_hours": 8 * 60 * 60,
+    "one_day": 24 * 60 * 60,
+}
+
+def get_bar_open_time(timeframe, timestamp):
+    """
+    Gets the open time of the bar of `timeframe` that contains `timestamp`
+    :param timeframe: string of a mt5_lib.Timeframe name
+    :param timestamp: integer seconds since epoch, in the same clock as the bar times
+    :return: integer seconds since epoch
+    """
+    timestamp = int(timestamp)
+
+    if timeframe == "one_month":
+        date = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+        return calendar.timegm((date.year, date.month, 1, 0, 0, 0))
+
+    try:
+        bar_seconds = TIMEFRAME_SECONDS[timeframe]
+    except KeyError as e:
+        raise ValueError(f"{timeframe} is not a legal timeframe.") from e
+
+    return timestamp - timestamp % bar_seconds
+
+def get_next_bar_open_time(timeframe, timestamp):
+    """
+    Gets the open time of the bar of `timeframe` after the one that contains `timestamp`,
+    i.e. the time at which the current bar closes
+    :param timeframe: string of a mt5_lib.Timeframe name
+    :param timestamp: integer seconds since epoch, in the same clock as the bar times
+    :return: integer seconds since epoch
+    """
+    bar_open_time = get_bar_open_time(timeframe, timestamp)
+
+    if timeframe == "one_month":
+        date = datetime.datetime.fromtimestamp(bar_open_time, tz=datetime.timezone.utc)
+        year, month = (date.year + 1, 1) if date.month == 12 else (date.year, date.month + 1)
+        return calendar.timegm((year, month, 1, 0, 0, 0))
+
+    return bar_open_time + TIMEFRAME_SECONDS[timeframe]
+
+def parse_date(date):
+    """
+    :param date: string of a date, YYYY-MM-DD, or a date and time, YYYY-MM-DD HH:MM
+    :return: integer seconds since epoch
+    """
+    for date_format in ("%Y-%m-%d", "%Y-%m-%d %H:%M"):
+        try:
+            return calendar.timegm(datetime.datetime.strptime(date, date_format).timetuple())
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"{date} is not a date. Use YYYY-MM-DD or YYYY-MM-DD HH:MM")
+
+def confirm_pending(pending, confirm, interval=CONFIRM_INTERVAL, max_interval=CONFIRM_MAX_INTERVAL, timeout=CONFIRM_TIMEOUT):
+    """
+    Calls `confirm` on every pending item until all of them are confirmed or `timeout` seconds passed,
+    waiting `interval` seconds after the first round and twice as long after every later one, up to `max_interval`
+    :param pending: list of items, e.g. symbols whose closed bar hasn't shown up yet
+    :param confirm: function of an item. True once the item is confirmed
+    :return: tuple of (list of the confirmed items, list of the items still pending at the timeout)
+    """
+    confirmed = []
+    deadline = time.monotonic() + timeout
+
+    while True:
+        still_pending = []
+        for item in pending:
+            if confirm(item):
+                confirmed.append(item)
+            else:
+                still_pending.append(item)
+        pending = still_pending
+
+        remaining = deadline - time.monotonic()
+        if not pending or remaining <= 0:
+            return confirmed, pending
+        # One last round at the timeout
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
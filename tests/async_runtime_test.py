@@ -0,0 +1,92 @@
+from mock import patch
+
+import asyncio
+import threading
+import time
+import types
+import pytest
+import sys
+
+sys.path.append("src")
+from async_runtime import AsyncRuntime, MT5Executor, TerminalProxy, TerminalTimeoutError
+
+def test_proxy_runs_every_call_on_one_thread():
+    mt5_executor = MT5Executor()
+    terminal = types.SimpleNamespace(ORDER_TYPE_BUY_STOP=4, symbol_info=lambda symbol: (symbol, threading.get_ident()))
+    proxy = TerminalProxy(terminal, mt5_executor)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(proxy.symbol_info("BCHUSD"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert proxy.ORDER_TYPE_BUY_STOP == 4
+    assert {thread_id for _, thread_id in results} == {mt5_executor.thread_id}
+    mt5_executor.shutdown()
+
+def test_hung_call_fails_fast_until_it_returns():
+    mt5_executor = MT5Executor(timeout=0.05)
+    with pytest.raises(TerminalTimeoutError):
+        mt5_executor.call(time.sleep, 0.3)
+    with pytest.raises(TerminalTimeoutError):
+        mt5_executor.call(sum, [1, 2])
+
+    time.sleep(0.4)
+    assert mt5_executor.call(sum, [1, 2]) == 3
+    mt5_executor.shutdown()
+
+@patch('async_runtime.mt5_lib.process_order_batch')
+def test_run_cycle_isolates_slow_and_failing_symbols(mock_process_order_batch):
+    runtime = AsyncRuntime(compute_pool_size=4, cycle_timeout=0.2)
+    batch_threads = []
+
+    def process_order_batch(intents):
+        batch_threads.append(threading.get_ident())
+        return [{"intent": intent, "success": True, "orders": [11]} for intent in intents]
+    mock_process_order_batch.side_effect = process_order_batch
+
+    def get_symbol_intents(symbol, timeframe):
+        if symbol == "SLOWUSD":
+            time.sleep(0.5)
+        if symbol == "BADUSD":
+            raise ValueError("no candles")
+        if symbol == "ETHUSD":
+            return []
+        return [{"action": "place", "symbol": symbol}]
+
+    results = asyncio.run(runtime.run_cycle(get_symbol_intents, ["BCHUSD", "ETHUSD", "BADUSD", "SLOWUSD"], "one_minute"))
+    runtime.stop()
+
+    assert results["BCHUSD"] == 11
+    assert results["ETHUSD"] is False
+    assert isinstance(results["BADUSD"], ValueError)
+    assert isinstance(results["SLOWUSD"], TerminalTimeoutError)
+    assert batch_threads == [runtime.mt5_executor.thread_id]
+
+def test_overrunning_symbol_is_skipped_until_it_finishes():
+    runtime = AsyncRuntime(compute_pool_size=4, cycle_timeout=0.1)
+    running = []
+
+    def get_symbol_intents(symbol, timeframe):
+        running.append(symbol)
+        time.sleep(0.3)
+        running.remove(symbol)
+        return []
+
+    async def run_cycles():
+        first = await runtime.run_cycle(get_symbol_intents, ["SLOWUSD"], "one_minute")
+        # Still running from the first cycle, so it isn't computed a second time at once
+        second = await runtime.run_cycle(get_symbol_intents, ["SLOWUSD"], "one_minute")
+        assert running == ["SLOWUSD"]
+        await asyncio.sleep(0.4)
+        third = await runtime.run_cycle(lambda symbol, timeframe: [], ["SLOWUSD"], "one_minute")
+        return first, second, third
+
+    first, second, third = asyncio.run(run_cycles())
+    runtime.stop()
+
+    assert isinstance(first["SLOWUSD"], TerminalTimeoutError)
+    assert "still computing" in str(second["SLOWUSD"])
+    assert third["SLOWUSD"] is False
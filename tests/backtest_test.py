@@ -0,0 +1,55 @@
+import numpy as np
+import pandas
+import pytest
+import sys
+
+sys.path.append("src")
+from backtest import simulate_trades, find_first_indexes
+
+def make_table(rows):
+    return pandas.DataFrame(rows, columns=['time', 'open', 'high', 'low', 'close', 'stop_loss', 'stop_price', 'take_profit'])
+
+def test_buy_stop_fills_and_hits_take_profit():
+    table = make_table([
+        [0, 10.0, 10.2, 9.8, 10.1, 0.0, 0.0, 0.0],
+        [60, 10.1, 11.0, 10.0, 10.9, 9.0, 11.0, 13.0],
+        [120, 10.9, 10.95, 10.5, 10.6, 0.0, 0.0, 0.0],
+        [180, 10.8, 11.5, 10.7, 11.4, 0.0, 0.0, 0.0],
+        [240, 11.4, 13.2, 11.3, 13.1, 0.0, 0.0, 0.0],
+        [300, 13.1, 13.3, 13.0, 13.2, 0.0, 0.0, 0.0],
+    ])
+    result = simulate_trades(table, "BCHUSD", 10000, 0.03)
+
+    assert len(result.trades) == 1
+    trade = result.trades.iloc[0]
+    assert trade['order_type'] == "BUY_STOP"
+    assert trade['entry_time'] == 180
+    assert trade['entry_price'] == 11.0
+    assert trade['exit_reason'] == "take_profit"
+    assert trade['exit_price'] == 13.0
+    assert trade['pnl'] == pytest.approx(2.0 * trade['volume'])
+    assert result.equity_curve['equity'].tolist() == pytest.approx([10000] * 4 + [10000 + trade['pnl']] * 2)
+    assert result.stats['wins'] == 1
+
+def test_next_signal_cancels_unfilled_order_and_stop_loss_wins_ties():
+    table = make_table([
+        [0, 10.0, 10.2, 9.8, 10.1, 0.0, 0.0, 0.0],
+        # SELL_STOP at 9.0 that never fills before the next signal
+        [60, 10.1, 10.2, 9.5, 9.6, 10.5, 9.0, 7.5],
+        # BUY_STOP at 10.5 cancels it
+        [120, 9.6, 10.5, 9.55, 10.4, 9.5, 10.5, 11.5],
+        # Fills and reaches both stop loss and take profit
+        [180, 10.4, 11.6, 8.9, 9.0, 0.0, 0.0, 0.0],
+    ])
+    result = simulate_trades(table, "BCHUSD", 10000, 0.03)
+
+    assert result.trades['order_type'].tolist() == ["BUY_STOP"]
+    assert result.trades['exit_reason'].tolist() == ["stop_loss"]
+    assert result.trades['entry_price'].tolist() == [10.5]
+    assert result.stats['signals'] == 2
+
+def test_find_first_indexes_searches_past_look_ahead_window():
+    values = np.zeros(1000)
+    values[700] = 5.0
+    values[3] = 5.0
+    assert find_first_indexes(values, [0, 10, 10], [1000, 1000, 600], [4.0, 4.0, 4.0], True).tolist() == [3, 700, -1]
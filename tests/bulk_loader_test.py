@@ -0,0 +1,59 @@
+import numpy as np
+import pandas
+import pytest
+import sys
+
+sys.path.append("src")
+import bulk_loader
+from candle_store import CandleStore
+import mt5_lib
+import sim_mt5
+
+@pytest.fixture
+def broker():
+    broker = sim_mt5.configure(history_bars=500)
+    broker.add_symbol("BCHUSD")
+    previous_terminal = mt5_lib.set_terminal(sim_mt5)
+    yield broker
+    mt5_lib.set_terminal(previous_terminal)
+
+def test_download_in_chunks_and_resume(broker, tmp_path):
+    store = CandleStore(str(tmp_path))
+    closed = broker.get_candles("BCHUSD", sim_mt5.TIMEFRAME_M1)[:-1]
+
+    appended = bulk_loader.download_history(store, "BCHUSD", "one_minute", closed['time'][0], closed['time'][299], chunk_bars=64)
+    assert appended == 300
+    assert (store.read("BCHUSD", "one_minute") == closed[:300]).all()
+
+    # Resumes after the stored candles and stops before the forming one
+    broker.advance(120)
+    appended = bulk_loader.download_history(store, "BCHUSD", "one_minute", closed['time'][0], chunk_bars=64)
+    assert appended == len(closed) - 300 + 2
+    stored = store.read("BCHUSD", "one_minute")
+    assert (np.diff(stored['time']) == 60).all()
+    assert stored['time'][-1] + 60 == broker.get_candles("BCHUSD", sim_mt5.TIMEFRAME_M1)['time'][-1]
+
+def test_download_all_reports_failures(broker, tmp_path):
+    results = bulk_loader.download_all(CandleStore(str(tmp_path)), ["BCHUSD", "UNKNOWN"], ["one_minute"], 0)
+    assert results[("BCHUSD", "one_minute")] > 0
+    assert isinstance(results[("UNKNOWN", "one_minute")], ValueError)
+
+def test_import_metatrader_csv_export(tmp_path):
+    path = tmp_path / "BCHUSD_M1.csv"
+    path.write_text(
+        "<DATE>\t<TIME>\t<OPEN>\t<HIGH>\t<LOW>\t<CLOSE>\t<TICKVOL>\t<VOL>\t<SPREAD>\n"
+        "2024.01.02\t00:00:00\t1.0\t2.0\t0.5\t1.5\t10\t0\t3\n"
+        "2024.01.02\t00:01:00\t1.5\t2.5\t1.0\t2.0\t11\t0\t3\n"
+        "2024.01.02\t00:02:00\t2.0\t3.0\t1.5\t2.5\t12\t0\t3\n"
+    )
+    store = CandleStore(str(tmp_path / "candles"))
+
+    assert bulk_loader.import_file(store, "BCHUSD", "one_minute", str(path), chunk_bars=2) == 3
+    # Rerunning skips the imported candles
+    assert bulk_loader.import_file(store, "BCHUSD", "one_minute", str(path), chunk_bars=2) == 0
+
+    candles = store.read("BCHUSD", "one_minute")
+    start = int(pandas.Timestamp("2024-01-02", tz="UTC").timestamp())
+    assert candles['time'].tolist() == [start, start + 60, start + 120]
+    assert candles['close'].tolist() == [1.5, 2.0, 2.5]
+    assert candles['tick_volume'].tolist() == [10, 11, 12]
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+import sys
+
+sys.path.append("src")
+from candle_buffer import CandleBuffer
+from candle_store import CANDLE_DTYPE
+
+def make_records(times):
+    records = np.zeros(len(times), dtype=CANDLE_DTYPE)
+    records['time'] = times
+    records['close'] = np.asarray(times, dtype=np.float64) / 10
+    return records
+
+def test_append_wraps_and_keeps_latest_candles_contiguous():
+    candle_buffer = CandleBuffer(4, {'ema_2': np.float64})
+    for candle in make_records([1, 2, 3, 4, 5, 6]):
+        candle_buffer.append(candle)
+        candle_buffer.set('ema_2', candle['close'] * 2)
+
+    assert len(candle_buffer) == 4
+    assert candle_buffer.column('time').tolist() == [3, 4, 5, 6]
+    assert candle_buffer.column('ema_2').tolist() == [0.6, 0.8, 1.0, 1.2]
+    assert candle_buffer.column('time').base is candle_buffer.columns['time']
+    assert candle_buffer.get('time', 0) == 3
+    assert candle_buffer.get_row()['ema_2'] == 1.2
+
+def test_extend_and_set_column_across_the_wrap():
+    candle_buffer = CandleBuffer(5, {'ema_cross': bool})
+    candle_buffer.extend(make_records([1, 2, 3]))
+    candle_buffer.extend(make_records([4, 5, 6, 7]))
+    assert candle_buffer.column('time').tolist() == [3, 4, 5, 6, 7]
+
+    candle_buffer.set_column('ema_cross', [True, False, True])
+    assert candle_buffer.column('ema_cross').tolist() == [False, False, True, False, True]
+
+    candle_buffer.extend(make_records(list(range(10, 20))))
+    assert candle_buffer.to_dataframe()['time'].tolist() == [15, 16, 17, 18, 19]
+
+def test_out_of_range_access_is_rejected():
+    candle_buffer = CandleBuffer(3)
+    with pytest.raises(IndexError):
+        candle_buffer.get('close')
+    with pytest.raises(ValueError):
+        CandleBuffer(0)
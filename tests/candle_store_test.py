@@ -0,0 +1,35 @@
+import numpy as np
+import sys
+
+sys.path.append("src")
+from candle_store import CandleStore, CANDLE_DTYPE
+
+def make_records(times):
+    records = np.zeros(len(times), dtype=CANDLE_DTYPE)
+    records['time'] = times
+    records['close'] = np.asarray(times, dtype=np.float64) / 60
+    return records
+
+def test_append_only_keeps_newer_candles(tmp_path):
+    store = CandleStore(str(tmp_path))
+    assert store.get_last_time("BCHUSD", "one_minute") is None
+    assert len(store.read("BCHUSD", "one_minute")) == 0
+
+    assert store.append("BCHUSD", "one_minute", make_records([60, 120, 180])) == 3
+    assert store.append("BCHUSD", "one_minute", make_records([120, 180, 240])) == 1
+
+    candles = store.read("BCHUSD", "one_minute")
+    assert isinstance(candles, np.memmap)
+    assert candles['time'].tolist() == [60, 120, 180, 240]
+    assert store.read("BCHUSD", "one_minute", 2)['time'].tolist() == [180, 240]
+    assert store.get_last_time("BCHUSD", "one_minute") == 240
+
+def test_partial_record_is_dropped_on_next_append(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.append("BCHUSD", "one_minute", make_records([60]))
+    with open(store.get_path("BCHUSD", "one_minute"), "ab") as file:
+        file.write(b"\x00" * 10)
+
+    assert store.count("BCHUSD", "one_minute") == 1
+    store.append("BCHUSD", "one_minute", make_records([120]))
+    assert store.read("BCHUSD", "one_minute")['time'].tolist() == [60, 120]
@@ -0,0 +1,49 @@
+import pytest
+import sys
+
+sys.path.append("src")
+from connection_manager import CircuitOpenError, ConnectionManager
+import mt5_lib
+import sim_mt5
+
+SETTINGS = {"mt5": {"timeout": 1000}}
+CREDENTIALS = {"mt5": {"terminal_pathway": "terminal64.exe", "login": 1, "password": "", "server": "Sim"}}
+
+@pytest.fixture
+def manager():
+    broker = sim_mt5.configure(history_bars=50)
+    broker.add_symbol("BCHUSD")
+    sim_mt5.initialize()
+    manager = ConnectionManager(sim_mt5, SETTINGS, CREDENTIALS, reconnect_delay=0, breaker_threshold=3)
+    previous_terminal = mt5_lib.set_terminal(manager)
+    mt5_lib.order_book.invalidate()
+    yield manager
+    mt5_lib.set_terminal(previous_terminal)
+    mt5_lib.order_book.invalidate()
+
+def test_read_reconnects_and_retries(manager):
+    sim_mt5.broker.disconnect()
+    candles = mt5_lib.get_candle_records("BCHUSD", "one_minute", 10)
+    assert len(candles) == 10
+    assert manager.reconnects == 1
+    assert mt5_lib.order_book.is_stale()
+
+def test_send_is_not_retried_and_breaker_opens(manager):
+    request = {"action": sim_mt5.TRADE_ACTION_REMOVE, "order": 1}
+    sim_mt5.broker.disconnect()
+    assert mt5_lib.mt5.order_send(request) is None
+    # Reconnected, but the unanswered send isn't repeated
+    assert manager.reconnects == 1
+    assert manager.unconfirmed_send_at is not None
+
+    # The next send reconciles the order book first
+    mt5_lib.mt5.order_send(request)
+    assert manager.unconfirmed_send_at is None
+
+    # The reconcile before a send heals the connection, so only sends that go unanswered right
+    # after it count towards the breaker
+    manager.breaker_threshold = 1
+    sim_mt5.broker.disconnect()
+    assert mt5_lib.mt5.order_send(request) is None
+    with pytest.raises(CircuitOpenError):
+        mt5_lib.mt5.order_send(request)
@@ -0,0 +1,141 @@
+from mock import patch
+
+import numpy as np
+import pandas
+import pytest
+import sys
+
+sys.path.append("src")
+import instrumentation
+from candle_store import to_candle_records
+from indicator_lib import calc_ema_array
+from ema_cross_strategy import det_trade, calculate_indicators, get_trade_event, get_candle_table, indicator_states, candle_buffers
+
+def reference_det_trade(ema_x_strategy_table, long_term_ema_length):
+    # The original per-row implementation of ema_cross_strategy.det_trade
+    stop_loss_column_name = "ema_" + str(long_term_ema_length)
+    ema_x_strategy_table['stop_loss'] = 0.0
+    ema_x_strategy_table['stop_price'] = 0.0
+    ema_x_strategy_table['take_profit'] = 0.0
+    for i in range(long_term_ema_length, len(ema_x_strategy_table) + 1):
+        if ema_x_strategy_table.loc[i, 'ema_cross']:
+            stop_loss = ema_x_strategy_table.loc[i, stop_loss_column_name]
+            if ema_x_strategy_table.loc[i, 'open'] < ema_x_strategy_table.loc[i, 'close']:
+                stop_price = ema_x_strategy_table.loc[i, 'high']
+                take_profit = stop_price + (stop_price - stop_loss)
+            elif ema_x_strategy_table.loc[i, 'open'] > ema_x_strategy_table.loc[i, 'close']:
+                stop_price = ema_x_strategy_table.loc[i, 'low']
+                take_profit = stop_price - (stop_loss - stop_price)
+            else:
+                stop_price = 0
+                take_profit = 0
+            ema_x_strategy_table.loc[i, 'stop_loss'] = (round(float(stop_loss), 2))
+            ema_x_strategy_table.loc[i, 'stop_price'] = (round(float(stop_price), 2))
+            ema_x_strategy_table.loc[i, 'take_profit'] = (round(float(take_profit), 2))
+
+def make_candles(num_candles, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 400 + np.cumsum(rng.normal(0, 1, num_candles))
+    open_price = np.concatenate(([close[0]], close[:-1]))
+    return pandas.DataFrame({
+        'time': np.arange(num_candles) * 60,
+        'open': open_price,
+        'high': np.maximum(open_price, close) + 0.25,
+        'low': np.minimum(open_price, close) - 0.25,
+        'close': close
+    })
+
+@pytest.mark.parametrize("short_term_ema_length,long_term_ema_length", [(1, 2), (3, 10), (5, 50)])
+def test_det_trade_matches_reference_loop(short_term_ema_length, long_term_ema_length):
+    table = make_candles(400)
+    calculate_indicators(table, short_term_ema_length, long_term_ema_length)
+    expected = table.copy()
+    reference_det_trade(expected, long_term_ema_length)
+    det_trade(table, short_term_ema_length, long_term_ema_length)
+    for column in ['stop_loss', 'stop_price', 'take_profit']:
+        np.testing.assert_allclose(table[column], expected[column])
+
+def test_det_trade_evaluates_rows_by_position_not_label():
+    table = make_candles(100)
+    calculate_indicators(table, 3, 10)
+    det_trade(table, 3, 10)
+
+    # Same rows under an unrelated index must give the same trade levels
+    relabelled = table.drop(columns=['stop_loss', 'stop_price', 'take_profit'])
+    relabelled.index = relabelled.index * 7 + 1000
+    det_trade(relabelled, 3, 10)
+    for column in ['stop_loss', 'stop_price', 'take_profit']:
+        np.testing.assert_array_equal(relabelled[column].to_numpy(), table[column].to_numpy())
+
+    # The last row is evaluated, including a single-row table
+    last_row = table.tail(1).drop(columns=['stop_loss', 'stop_price', 'take_profit'])
+    det_trade(last_row, 3, 10)
+    assert last_row['stop_price'].iloc[0] == table['stop_price'].iloc[-1]
+
+def test_det_trade_skips_warm_up_and_flat_candles():
+    table = pandas.DataFrame({
+        'open': [10.0, 10.0, 10.0, 12.0],
+        'close': [11.0, 12.0, 10.0, 11.0],
+        'high': [11.5, 12.5, 10.5, 12.5],
+        'low': [9.5, 9.5, 9.5, 10.5],
+        'ema_1': [0.0, 11.0, 10.5, 11.0],
+        'ema_2': [0.0, 10.5, 10.25, 11.111],
+        'ema_cross': [True, True, True, True]
+    })
+    det_trade(table, 1, 2)
+    assert table['stop_price'].tolist() == [0.0, 12.5, 0.0, 10.5]
+    assert table['take_profit'].tolist() == [0.0, 14.5, 0.0, 9.89]
+    assert table['stop_loss'].tolist() == [0.0, 10.5, 10.25, 11.11]
+
+def test_det_trade_rejects_inverted_lengths():
+    with pytest.raises(ValueError):
+        det_trade(make_candles(10), 5, 2)
+
+@patch('ema_cross_strategy.mt5_lib.get_candle_records')
+def test_get_trade_event_advances_the_candle_buffer(mock_get_candle_records):
+    records = to_candle_records(make_candles(60))
+    position = [20]
+    mock_get_candle_records.side_effect = lambda symbol, timeframe, count: records[max(0, position[0] - count):position[0]]
+    indicator_states.clear()
+    candle_buffers.clear()
+
+    get_trade_event("BCHUSD", "one_minute", 3, 10)
+    assert get_trade_event("BCHUSD", "one_minute", 3, 10) is None
+
+    # Fold in the remaining candles one at a time
+    events = []
+    while position[0] < 60:
+        position[0] += 1
+        events.append(get_trade_event("BCHUSD", "one_minute", 3, 10))
+
+    # Same recursion from the 12 candles the state was seeded with
+    expected_ema = calc_ema_array(records['close'][8:20], 10)[-1]
+    for close in records['close'][20:]:
+        expected_ema = close * 2 / 11 + expected_ema * 9 / 11
+
+    assert events[-1]['time'] == 59 * 60
+    assert events[-1]['ema_10'] == pytest.approx(expected_ema)
+    assert len(get_candle_table("BCHUSD", "one_minute", 3, 10)) == 52
+    assert all(set(event) >= {'ema_cross', 'stop_loss', 'stop_price', 'take_profit'} for event in events)
+
+@patch('ema_cross_strategy.mt5_lib.get_candle_records')
+def test_get_trade_event_times_ema_and_cross_stages(mock_get_candle_records):
+    records = to_candle_records(make_candles(30))
+    position = [20]
+    mock_get_candle_records.side_effect = lambda symbol, timeframe, count: records[max(0, position[0] - count):position[0]]
+    indicator_states.clear()
+    candle_buffers.clear()
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        # A reseed, then one incremental update
+        get_trade_event("BCHUSD", "one_minute", 3, 10)
+        position[0] += 1
+        get_trade_event("BCHUSD", "one_minute", 3, 10)
+        histograms = dict(instrumentation.histograms)
+    finally:
+        instrumentation.enable(False)
+        instrumentation.reset()
+
+    for stage in ("calc_ema", "ema_cross_calc", "det_trade"):
+        assert histograms[(stage, "BCHUSD")][2] == 2
@@ -0,0 +1,49 @@
+import numpy as np
+import sys
+
+sys.path.append("src")
+from helper_functions import build_spec_table, calc_lot_size, calc_lot_sizes, get_legacy_spec_table
+
+BCHUSD_SPEC = {
+    "digits": 2, "point": 0.01, "volume_min": 0.01, "volume_max": 50.0, "volume_step": 0.01,
+    "trade_contract_size": 1.0, "currency_base": "BCH", "currency_profit": "USD"
+}
+USDJPY_SPEC = {
+    "digits": 3, "point": 0.001, "volume_min": 0.01, "volume_max": 100.0, "volume_step": 0.01,
+    "trade_contract_size": 100000.0, "currency_base": "USD", "currency_profit": "JPY"
+}
+
+def test_legacy_pip_model_is_kept_without_a_spec():
+    # 300 risked over 2000 pips of 0.0001 is 0.15, clamped up to 1.0
+    assert calc_lot_size(10000, 0.03, 399.8, 400.0, "BCHUSD") == 1.0
+    # 300 risked over 50 pips of 0.01 on USDJPY at 150 is 0.9 lots, clamped up to 1.0
+    assert calc_lot_size(10000, 0.03, 149.5, 150.0, "USDJPY") == 1.0
+    # 300 risked over 0.01 pips is 30 lots, clamped down to 9.99
+    assert calc_lot_size(10000, 0.03, 399.999999, 400.0, "BCHUSD") == 9.99
+
+def test_spec_sizes_the_risk_in_the_account_currency():
+    # 300 risked over 5.00 on a 1 unit contract is 60 lots, above the 50 lot maximum
+    assert calc_lot_size(10000, 0.03, 395.0, 400.0, "BCHUSD", BCHUSD_SPEC) == 50.0
+    assert calc_lot_size(10000, 0.03, 380.0, 400.0, "BCHUSD", BCHUSD_SPEC) == 15.0
+    # 300 risked over 0.5 JPY on 100000 units, worth 0.5 * 100000 / 150 USD per lot
+    assert calc_lot_size(10000, 0.03, 149.5, 150.0, "USDJPY", USDJPY_SPEC) == 0.9
+
+def test_calc_lot_sizes_matches_the_scalar_function_per_symbol():
+    rng = np.random.default_rng(1)
+    stop_loss = rng.uniform(100, 110, 500)
+    stop_price = stop_loss + rng.uniform(-3, 3, 500)
+    symbol_index = rng.integers(0, 2, 500)
+    spec_table = build_spec_table([BCHUSD_SPEC, USDJPY_SPEC])
+
+    volumes = calc_lot_sizes(10000, 0.03, stop_loss, stop_price, spec_table, symbol_index)
+
+    specs = [BCHUSD_SPEC, USDJPY_SPEC]
+    expected = [calc_lot_size(10000, 0.03, stop_loss[n], stop_price[n], "", specs[symbol_index[n]]) for n in range(500)]
+    np.testing.assert_array_equal(volumes, expected)
+    # Every volume is a whole number of steps within the limits
+    assert np.allclose(np.round(volumes / 0.01), volumes / 0.01)
+    assert volumes.min() >= 0.01 and volumes[symbol_index == 0].max() <= 50.0
+
+def test_calc_lot_sizes_returns_zero_without_a_stop_distance():
+    volumes = calc_lot_sizes(10000, 0.03, [400.0, 395.0], [400.0, 400.0], get_legacy_spec_table(["BCHUSD"]))
+    assert volumes.tolist() == [0.0, 1.0]
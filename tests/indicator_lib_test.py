@@ -0,0 +1,77 @@
+import numpy as np
+import pandas
+import pytest
+import sys
+
+sys.path.append("src")
+from indicator_lib import calc_ema, calc_ema_array, IncrementalEma, IncrementalEmaCross
+
+def reference_calc_ema(ema_x_strategy_table, ema_size):
+    # The original per-row implementation of indicator_lib.calc_ema
+    ema_name = "ema_" + str(ema_size)
+    multiplier = 2/(ema_size + 1)
+    initial_mean = ema_x_strategy_table['close'].head(ema_size).mean()
+    for i in range(len(ema_x_strategy_table)):
+        if i == ema_size:
+            ema_x_strategy_table.loc[i, ema_name] = initial_mean
+        elif i > ema_size:
+            ema_value = ema_x_strategy_table.loc[i, 'close'] * multiplier + ema_x_strategy_table.loc[i - 1, ema_name]*(1 - multiplier)
+            ema_x_strategy_table.loc[i, ema_name] = ema_value
+        else:
+            ema_x_strategy_table.loc[i, ema_name] = 0.00
+
+def make_candles(num_candles, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 400 + np.cumsum(rng.normal(0, 0.5, num_candles))
+    return pandas.DataFrame({'close': close})
+
+@pytest.mark.parametrize("ema_size", [1, 2, 10, 50, 200])
+def test_calc_ema_matches_reference_loop(ema_size):
+    table = make_candles(500)
+    expected = table.copy()
+    reference_calc_ema(expected, ema_size)
+    calc_ema(table, ema_size)
+    np.testing.assert_allclose(table[f"ema_{ema_size}"], expected[f"ema_{ema_size}"], rtol=1e-12)
+
+def test_calc_ema_keeps_warm_up_rows_at_zero():
+    table = make_candles(10)
+    calc_ema(table, 4)
+    assert (table['ema_4'].head(4) == 0.0).all()
+    assert table.loc[4, 'ema_4'] == pytest.approx(table['close'].head(4).mean())
+
+def test_calc_ema_array_shorter_than_ema_size_is_all_warm_up():
+    assert (calc_ema_array([1.0, 2.0, 3.0], 3) == 0.0).all()
+    assert (calc_ema_array([], 3) == 0.0).all()
+
+def test_incremental_ema_update_matches_full_recalculation():
+    close = make_candles(300)['close'].to_numpy()
+    incremental_ema = IncrementalEma(50)
+    incremental_ema.seed(close[:200])
+    for value in close[200:]:
+        incremental_ema.update(value)
+    assert incremental_ema.ready
+    assert incremental_ema.value == pytest.approx(calc_ema_array(close, 50)[-1], rel=1e-12)
+
+def test_incremental_ema_cross_tracks_position_and_time():
+    table = pandas.DataFrame({'time': [1, 2, 3, 4], 'close': [10.0, 11.0, 12.0, 13.0]})
+    calc_ema(table, 1)
+    calc_ema(table, 2)
+    state = IncrementalEmaCross(1, 2)
+    state.seed(table)
+    assert state.ready
+    assert state.last_time == 4
+    assert state.position
+
+    # A sharp drop pulls the short-term EMA below the long-term EMA
+    assert state.update(5, 5.0)
+    assert not state.position
+    assert state.last_time == 5
+    assert not state.update(6, 4.0)
+
+def test_incremental_ema_cross_not_ready_without_enough_history():
+    table = pandas.DataFrame({'time': [1, 2], 'close': [10.0, 11.0]})
+    calc_ema(table, 1)
+    calc_ema(table, 2)
+    state = IncrementalEmaCross(1, 2)
+    state.seed(table)
+    assert not state.ready
@@ -0,0 +1,51 @@
+from mock import patch
+
+import sys
+
+sys.path.append("src")
+import instrumentation
+
+def setup_function():
+    instrumentation.reset()
+
+def teardown_function():
+    instrumentation.enable(False)
+    instrumentation.reset()
+
+def test_disabled_instrumentation_records_nothing():
+    instrumentation.enable(False)
+    assert instrumentation.span("order_send", "BCHUSD") is instrumentation.NULL_SPAN
+    with instrumentation.span("order_send", "BCHUSD"):
+        pass
+    assert instrumentation.histograms == {}
+
+def test_export_prometheus_counts_cumulative_buckets():
+    instrumentation.record("order_send", "BCHUSD", 0.0002)
+    instrumentation.record("order_send", "BCHUSD", 0.3)
+    exported = instrumentation.export_prometheus()
+    assert '# TYPE bbstrader_stage_latency_seconds histogram' in exported
+    assert 'bbstrader_stage_latency_seconds_bucket{stage="order_send",symbol="BCHUSD",le="0.00025"} 1' in exported
+    assert 'bbstrader_stage_latency_seconds_bucket{stage="order_send",symbol="BCHUSD",le="0.5"} 2' in exported
+    assert 'bbstrader_stage_latency_seconds_bucket{stage="order_send",symbol="BCHUSD",le="+Inf"} 2' in exported
+    assert 'bbstrader_stage_latency_seconds_count{stage="order_send",symbol="BCHUSD"} 2' in exported
+
+@patch('instrumentation.time.perf_counter')
+def test_timed_uses_symbol_argument_or_thread_tag(mock_perf_counter):
+    mock_perf_counter.side_effect = [1.0, 1.5, 2.0, 2.001]
+    instrumentation.enable()
+
+    @instrumentation.timed("candle_fetch", symbol_arg=0)
+    def fetch(symbol):
+        return symbol
+
+    @instrumentation.timed("calc_ema")
+    def calc():
+        return 1
+
+    assert fetch("BCHUSD") == "BCHUSD"
+    with instrumentation.tag("EURUSD"):
+        assert calc() == 1
+
+    assert instrumentation.histograms[("candle_fetch", "BCHUSD")][1:] == [0.5, 1]
+    assert instrumentation.histograms[("calc_ema", "EURUSD")][2] == 1
+    assert instrumentation.get_symbol() == ""
@@ -0,0 +1,55 @@
+import pytest
+import sys
+
+sys.path.append("src")
+import journal
+from journal import JournalReader
+import mt5_lib
+import sim_mt5
+
+@pytest.fixture
+def journal_path(tmp_path):
+    journal.start(str(tmp_path))
+    yield str(tmp_path)
+    journal.stop()
+
+def test_query_by_symbol_ticket_and_time(journal_path, monkeypatch):
+    day = 24 * 60 * 60
+    times = iter([10 * day, 10 * day + 5, 11 * day, 11 * day + 5])
+    monkeypatch.setattr(journal.time, "time_ns", lambda: next(times) * 10**9)
+    journal.record(journal.SIGNAL, "BCHUSD", "EMA_Cross_strate", side=journal.BUY, price=101.5)
+    journal.record(journal.SEND, "BCHUSD", "EMA_Cross_strate", ticket=7, side=journal.BUY, volume=0.1, retcode=10009)
+    journal.record(journal.SEND, "ETHUSD", "EMA_Cross_strate", ticket=8, side=journal.SELL, retcode=10009)
+    journal.record(journal.CANCEL, "BCHUSD", "EMA_Cross_strate", ticket=7, retcode=journal.NO_ANSWER)
+    journal.stop()
+
+    reader = JournalReader(journal_path)
+    assert len(reader.get_paths()) == 2
+    assert reader.query()['ticket'].tolist() == [0, 7, 8, 7]
+    assert reader.query(symbol="BCHUSD")['kind'].tolist() == [journal.SIGNAL, journal.SEND, journal.CANCEL]
+    assert reader.query(ticket=7)['kind'].tolist() == [journal.SEND, journal.CANCEL]
+    assert reader.query(start=10 * day + 5, end=11 * day + 5)['symbol'].tolist() == [b"BCHUSD", b"ETHUSD"]
+    assert reader.query(kinds=[journal.SIGNAL])['price'].tolist() == [101.5]
+
+    frame = journal.to_frame(reader.query(ticket=8))
+    assert frame['kind'].tolist() == ["send"]
+    assert frame['symbol'].tolist() == ["ETHUSD"]
+
+def test_orders_are_journaled(journal_path):
+    broker = sim_mt5.configure(history_bars=50)
+    broker.add_symbol("BCHUSD")
+    sim_mt5.initialize()
+    previous_terminal = mt5_lib.set_terminal(sim_mt5)
+    try:
+        price = broker.get_candles("BCHUSD", sim_mt5.TIMEFRAME_M1)['close'][-1]
+        ticket = mt5_lib.place_order("BUY_STOP", "BCHUSD", 0.1, round(price - 20, 2), round(price + 40, 2), "EMA_Cross_strate", round(price + 10, 2))
+        assert mt5_lib.cancel_order(ticket)
+    finally:
+        mt5_lib.set_terminal(previous_terminal)
+    journal.stop()
+
+    events = JournalReader(journal_path).query(symbol="BCHUSD")
+    assert events['kind'].tolist() == [journal.CHECK, journal.SEND, journal.CANCEL]
+    # A check comes before the order has a ticket
+    assert events['ticket'].tolist() == [0, ticket, ticket]
+    assert (events['side'] == journal.BUY).all()
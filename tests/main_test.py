@@ -1,9 +1,11 @@
+from mock import patch
+
 import json
 import pytest
 import sys
 
 sys.path.append("src")
-from main import get_json_from_file, ACCOUNT_SETTINGS_PATH
+from main import get_json_from_file, run_symbols_in_parallel, ACCOUNT_SETTINGS_PATH
 
 correct_file_path = ACCOUNT_SETTINGS_PATH
 
@@ -16,4 +18,26 @@ def test_get_trader_settings_fails_when_no_file():
     file_path = 'setting.json'
     with pytest.raises(FileExistsError) as excinfo:
         get_json_from_file(file_path)
-    assert str(excinfo.value) == f'Could not locate resource: {file_path}'
\ No newline at end of file
+    assert str(excinfo.value) == f'Could not locate resource: {file_path}'
+
+@patch('main.trader.process_order_batch')
+@patch('main.strats.get_trade_intents')
+@patch('main.strats.get_trade_event')
+def test_run_symbols_in_parallel_collects_each_symbol_result(mock_get_trade_event, mock_get_trade_intents, mock_process_order_batch):
+    def get_trade_event(symbol, *args):
+        if symbol == "BADUSD":
+            raise ValueError("no candles")
+        return symbol
+    mock_get_trade_event.side_effect = get_trade_event
+    mock_get_trade_intents.side_effect = lambda symbol, *args: [{"action": "place", "symbol": symbol}] if symbol != "ETHUSD" else []
+    mock_process_order_batch.side_effect = lambda intents: [
+        {"intent": intent, "success": True, "orders": [42], "retcode": 10009, "comment": ""} for intent in intents
+    ]
+
+    results = run_symbols_in_parallel(["BCHUSD", "ETHUSD", "BADUSD"], "one_minute", 2)
+
+    assert results["BCHUSD"] == 42
+    assert results["ETHUSD"] is False
+    assert isinstance(results["BADUSD"], ValueError)
+    # Every order goes out in a single batch
+    mock_process_order_batch.assert_called_once()
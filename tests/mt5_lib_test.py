@@ -1,6 +1,7 @@
 from mock import MagicMock, patch
 
 import json
+import numpy as np
 import pytest
 import sys
 
@@ -54,4 +55,114 @@ def test_connect_login_errors(mock_init, mock_login):
 def test_connect_setting_value_missing():
     bad_settings = json.loads('{}')
     with pytest.raises(KeyError):
-        connect(bad_settings, credentials)
\ No newline at end of file
+        connect(bad_settings, credentials)
+
+@patch('mt5_lib.mt5.copy_rates_from_pos')
+def test_sync_candlesticks_only_appends_new_candles(mock_copy_rates, tmp_path):
+    from candle_store import CandleStore, CANDLE_DTYPE
+    from mt5_lib import sync_candlesticks
+
+    history = np.zeros(10, dtype=CANDLE_DTYPE)
+    history['time'] = np.arange(1, 11) * 60
+    mock_copy_rates.side_effect = lambda symbol, timeframe, position, count: history[-count:]
+
+    store = CandleStore(str(tmp_path))
+    store.append("BCHUSD", "one_minute", history[:3])
+
+    assert sync_candlesticks(store, "BCHUSD", "one_minute", 5) == 7
+    assert store.read("BCHUSD", "one_minute")['time'].tolist() == history['time'].tolist()
+    # Widened 2 -> 4 -> 8 candles until the request reached the stored ones
+    assert [call.args[3] for call in mock_copy_rates.call_args_list] == [2, 4, 8]
+
+@patch('mt5_lib.mt5.order_check')
+@patch('mt5_lib.mt5.order_send')
+@patch('mt5_lib.mt5.orders_get')
+@patch('mt5_lib.get_symbol_spec')
+@patch('mt5_lib.mt5.positions_get')
+def test_process_order_batch_keeps_going_past_failures(mock_positions_get, mock_get_symbol_spec, mock_orders_get, mock_order_send, mock_order_check):
+    from mt5_lib import OrderBook, process_order_batch
+    from collections import namedtuple
+    import mt5_lib
+
+    Order = namedtuple("Order", ["ticket", "symbol", "comment"])
+    SendResult = namedtuple("SendResult", ["retcode", "deal", "order", "comment"])
+
+    mock_get_symbol_spec.side_effect = lambda symbol: None if symbol == "EURJPY" else {
+        "digits": 2, "point": 0.01, "volume_min": 0.01, "volume_max": 100.0,
+        "volume_step": 0.01, "trade_tick_size": 0.01, "trade_stops_level": 0
+    }
+    mock_orders_get.return_value = (Order(1, "BCHUSD", "EMA"), Order(2, "ETHUSD", "EMA"), Order(3, "BCHUSD", "other"))
+    mock_positions_get.return_value = ()
+    mock_order_send.side_effect = lambda request: SendResult(10009, 0, 77, "done") if request["action"] != "fail" else None
+    mock_order_check.return_value = SendResult(10019, 0, 0, "No money")
+
+    intents = [
+        {"action": "cancel", "symbol": "BCHUSD", "comment": "EMA"},
+        {"action": "place", "order_type": "SELL_STOP", "symbol": "BCHUSD", "volume": 1.0, "stop_loss": 300.0, "take_profit": 280.0, "comment": "EMA", "stop_price": 290.0},
+        {"action": "place", "order_type": "SELL_STOP", "symbol": "EURJPY", "volume": 1.0, "stop_loss": 160.0, "take_profit": 150.0, "comment": "EMA", "stop_price": 155.0},
+        {"action": "place", "order_type": "SELL_STOP", "symbol": "ETHUSD", "volume": 150.0, "stop_loss": 300.0, "take_profit": 280.0, "comment": "EMA", "stop_price": 290.0},
+    ]
+    with patch('mt5_lib.order_book', OrderBook()):
+        results = process_order_batch(intents)
+        # The book followed the cancel and the new order
+        assert mt5_lib.order_book.get_tickets("BCHUSD", "EMA") == [77]
+        assert mt5_lib.order_book.get_tickets("BCHUSD", "other") == [3]
+
+    assert [result["success"] for result in results] == [True, True, False, False]
+    assert results[0]["orders"] == [1]
+    assert results[1]["orders"] == [77]
+    assert results[2]["comment"] == "No money"
+    assert "outside" in results[3]["comment"]
+    # Only the symbol without a cached spec needed an order_check round trip
+    mock_order_check.assert_called_once()
+    mock_orders_get.assert_called_once_with()
+
+@patch('mt5_lib.mt5.symbol_select')
+@patch('mt5_lib.mt5.symbols_get')
+def test_symbol_registry_loads_universe_once(mock_symbols_get, mock_symbol_select):
+    from mt5_lib import SymbolRegistry, initialize_symbol
+    from collections import namedtuple
+    import mt5_lib
+
+    SymbolInfo = namedtuple("SymbolInfo", [
+        "name", "digits", "point", "volume_min", "volume_max", "volume_step", "trade_contract_size",
+        "trade_tick_size", "trade_stops_level", "currency_base", "currency_profit"
+    ])
+    mock_symbols_get.return_value = (
+        SymbolInfo("BCHUSD", 2, 0.01, 0.01, 100.0, 0.01, 1.0, 0.01, 0, "BCH", "USD"),
+        SymbolInfo("EURJPY", 3, 0.001, 0.01, 50.0, 0.01, 100000.0, 0.001, 10, "EUR", "JPY"),
+    )
+
+    with patch.object(mt5_lib, 'symbol_registry', SymbolRegistry()):
+        assert initialize_symbol("BCHUSD")
+        assert initialize_symbol("EURJPY")
+        assert not initialize_symbol("XYZ")
+        assert mt5_lib.get_symbol_spec("EURJPY")["trade_contract_size"] == 100000.0
+
+        mt5_lib.symbol_registry.refresh()
+
+    assert mock_symbols_get.call_count == 2
+
+@patch('mt5_lib.mt5.positions_get')
+@patch('mt5_lib.mt5.orders_get')
+def test_order_book_reconciles_and_reports_exposure(mock_orders_get, mock_positions_get):
+    from mt5_lib import OrderBook
+    from collections import namedtuple
+
+    Order = namedtuple("Order", ["ticket", "symbol", "comment", "type", "volume_current", "price_open", "sl", "tp"])
+    Position = namedtuple("Position", ["ticket", "symbol", "comment", "type", "volume", "price_open", "sl", "tp"])
+    mock_orders_get.return_value = (Order(1, "BCHUSD", "EMA", 5, 2.0, 290.0, 300.0, 280.0),)
+    mock_positions_get.return_value = (Position(2, "BCHUSD", "EMA", 0, 1.5, 310.0, 300.0, 330.0),)
+
+    book = OrderBook(ttl=60)
+    book.add_order({"symbol": "BCHUSD", "comment": "other", "type": 4, "volume": 1.0, "price": 320.0, "sl": 310.0, "tp": 340.0}, 9)
+    assert book.get_tickets("BCHUSD", "EMA") == [1]
+    # Lookups within the ttl don't go to the terminal
+    assert book.get_exposure("BCHUSD") == (1.5, -2.0)
+    assert book.get_exposure("BCHUSD", "EMA") == (1.5, -2.0)
+    mock_orders_get.assert_called_once_with()
+
+    # Reconciling drops what the terminal no longer has, e.g. an order that filled
+    mock_orders_get.return_value = ()
+    assert book.reconcile() == {"added": [], "removed": [1]}
+    assert book.get_tickets("BCHUSD", "EMA") == []
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+import sys
+
+sys.path.append("src")
+from backtest import run_backtest
+from candle_store import CANDLE_DTYPE
+from optimizer import get_parameter_grid, run_sweep
+
+def make_candles(num_candles, seed=5):
+    rng = np.random.default_rng(seed)
+    close = 400 + np.cumsum(rng.normal(0, 0.3, num_candles))
+    open_price = np.concatenate(([close[0]], close[:-1]))
+    candles = np.zeros(num_candles, dtype=CANDLE_DTYPE)
+    candles['time'] = np.arange(num_candles) * 60
+    candles['open'] = open_price
+    candles['close'] = close
+    candles['high'] = np.maximum(open_price, close) + 0.2
+    candles['low'] = np.minimum(open_price, close) - 0.2
+    return candles
+
+def test_parameter_grid_skips_inverted_pairs():
+    assert get_parameter_grid([1, 5], [2, 5], [0.03]) == [(1, 2, 0.03), (1, 5, 0.03)]
+
+def test_sweep_matches_single_backtests():
+    candles = make_candles(2000)
+    results = run_sweep({("BCHUSD", "one_minute"): candles}, [2, 5], [10], [0.01, 0.03], max_workers=2)
+
+    assert len(results) == 4
+    for _, row in results.iterrows():
+        expected = run_backtest(candles, "BCHUSD", row['short_term_ema_length'], row['long_term_ema_length'], 10000, row['risk_pct'])
+        assert row['trades'] == expected.stats['trades']
+        assert row['total_pnl'] == pytest.approx(expected.stats['total_pnl'])
@@ -0,0 +1,77 @@
+from mock import patch
+
+import numpy as np
+import pandas
+import sys
+
+sys.path.append("src")
+from candle_store import CANDLE_DTYPE
+from resampler import BarResampler, M1BarFeed
+
+def make_minutes(start_time, num_minutes, seed=5):
+    rng = np.random.default_rng(seed)
+    records = np.zeros(num_minutes, dtype=CANDLE_DTYPE)
+    records['time'] = start_time + np.arange(num_minutes) * 60
+    records['close'] = 100 + np.cumsum(rng.normal(0, 0.1, num_minutes))
+    records['open'] = records['close'] - rng.normal(0, 0.05, num_minutes)
+    records['high'] = np.maximum(records['open'], records['close']) + 0.02
+    records['low'] = np.minimum(records['open'], records['close']) - 0.02
+    records['tick_volume'] = rng.integers(1, 50, num_minutes)
+    return records
+
+def test_resampled_bars_match_pandas_resample():
+    # Starts 3 minutes into a five minute bar, which is dropped as incomplete
+    minutes = make_minutes(1_700_000_000 - 1_700_000_000 % 3600 + 180, 240)
+    resampler = BarResampler("BCHUSD", ["five_minutes", "one_hour"])
+    closed = [bar for candle in minutes for bar in resampler.add(candle)]
+
+    table = pandas.DataFrame(minutes)
+    table.index = pandas.to_datetime(table['time'], unit='s')
+    expected = table.resample('5min').agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'tick_volume': 'sum'}).iloc[1:-1]
+
+    bars = resampler.get_bars("five_minutes", 100)
+    assert len(bars) == len(expected) == 47
+    for column in ['open', 'high', 'low', 'close', 'tick_volume']:
+        np.testing.assert_allclose(bars[column], expected[column].to_numpy())
+
+    # The first hour started mid-bar, the next three closed on their last minute
+    assert [int(bar['time']) for timeframe, bar in closed if timeframe == "one_hour"] == list(resampler.get_bars("one_hour", 3)['time'])
+    assert len(resampler.get_bars("one_hour", 10)) == 3
+
+def test_bar_missing_its_last_minutes_closes_on_the_next_bar_or_timeout():
+    minutes = make_minutes(3600, 7)
+    resampler = BarResampler("BCHUSD", ["five_minutes"])
+    for candle in minutes[:3]:
+        resampler.add(candle)
+    # Minutes 3 and 4 had no ticks
+    closed = resampler.add(minutes[5])
+    assert [int(bar['time']) for _, bar in closed] == [3600]
+    assert float(closed[0][1]['close']) == minutes['close'][2]
+    assert resampler.close_until(3600 + 600)[0][1]['time'] == 3900
+
+@patch('resampler.mt5_lib.get_candle_records')
+def test_feed_fetches_once_per_symbol_and_notifies_subscribers(mock_get_candle_records):
+    minutes = {"BCHUSD": make_minutes(3600, 30, seed=1), "ETHUSD": make_minutes(3600, 30, seed=2)}
+    visible = [14]
+    mock_get_candle_records.side_effect = lambda symbol, timeframe, count: minutes[symbol][max(0, visible[0] - count):visible[0]]
+
+    feed = M1BarFeed(["BCHUSD", "ETHUSD"], ["five_minutes", "fifteen_minutes"], confirm_timeout=0)
+    feed.seed(2)
+    events = []
+    feed.subscribe("fifteen_minutes", lambda symbol, timeframe, bar: events.append((symbol, int(bar['time']))))
+    mock_get_candle_records.reset_mock()
+
+    # The last minute of the first five and fifteen minute bars
+    visible[0] = 15
+    closed = feed.poll(3600 + 14 * 60)
+
+    assert closed == [("five_minutes", ["BCHUSD", "ETHUSD"]), ("fifteen_minutes", ["BCHUSD", "ETHUSD"])]
+    assert mock_get_candle_records.call_count == 2
+    assert events == [("BCHUSD", 3600), ("ETHUSD", 3600)]
+
+    # Catching up on several minutes at once
+    visible[0] = 30
+    assert dict(feed.poll(3600 + 29 * 60))["fifteen_minutes"] == ["BCHUSD", "ETHUSD"]
+    assert events[2:] == [("BCHUSD", 3600 + 900), ("ETHUSD", 3600 + 900)]
+    assert list(feed.get_candle_records("BCHUSD", "five_minutes", 2)['time']) == [3600 + 1200, 3600 + 1500]
+    assert feed.get_candle_records("BCHUSD", "one_hour", 1) is None
@@ -0,0 +1,50 @@
+from mock import patch
+
+import calendar
+import numpy as np
+import pytest
+import sys
+
+sys.path.append("src")
+from scheduler import CandleScheduler
+from utils import get_bar_open_time, get_next_bar_open_time
+
+def test_next_bar_open_time_for_fixed_timeframes():
+    timestamp = calendar.timegm((2024, 3, 5, 13, 47, 12))
+    assert get_next_bar_open_time("one_minute", timestamp) == calendar.timegm((2024, 3, 5, 13, 48, 0))
+    assert get_next_bar_open_time("fifteen_minutes", timestamp) == calendar.timegm((2024, 3, 5, 14, 0, 0))
+    assert get_next_bar_open_time("four_hours", timestamp) == calendar.timegm((2024, 3, 5, 16, 0, 0))
+    assert get_next_bar_open_time("one_day", timestamp) == calendar.timegm((2024, 3, 6, 0, 0, 0))
+
+def test_next_bar_open_time_for_months():
+    assert get_bar_open_time("one_month", calendar.timegm((2024, 2, 29, 23, 0, 0))) == calendar.timegm((2024, 2, 1, 0, 0, 0))
+    assert get_next_bar_open_time("one_month", calendar.timegm((2024, 12, 15, 0, 0, 0))) == calendar.timegm((2025, 1, 1, 0, 0, 0))
+
+def test_scheduler_rejects_unknown_timeframe():
+    with pytest.raises(ValueError):
+        CandleScheduler({"seven_minutes": ["BCHUSD"]})
+
+@patch('scheduler.mt5_lib.get_candle_records')
+def test_confirm_closed_bars_only_returns_symbols_whose_bar_closed(mock_get_candle_records):
+    bar_times = {"BCHUSD": 120, "EURUSD": 60}
+    mock_get_candle_records.side_effect = lambda symbol, timeframe, count: np.array([(bar_times[symbol],)], dtype=[('time', '<i8')])
+
+    scheduler = CandleScheduler({"one_minute": ["BCHUSD", "EURUSD"]}, confirm_interval=0.01, confirm_timeout=0.05)
+
+    assert scheduler.confirm_closed_bars("one_minute", 120) == ["BCHUSD"]
+
+@patch('utils.time')
+@patch('scheduler.mt5_lib.get_candle_records')
+def test_symbol_without_ticks_costs_a_few_requests(mock_get_candle_records, mock_time):
+    clock = [0.0]
+    mock_time.monotonic.side_effect = lambda: clock[0]
+    mock_time.sleep.side_effect = lambda seconds: clock.__setitem__(0, clock[0] + seconds)
+    mock_get_candle_records.return_value = np.array([(60,)], dtype=[('time', '<i8')])
+
+    scheduler = CandleScheduler({"one_minute": ["EURUSD"]})
+    scheduler.last_bar_times[("EURUSD", "one_minute")] = 60
+
+    assert scheduler.confirm_closed_bars("one_minute", 120) == []
+    # Requests back off from CONFIRM_INTERVAL to CONFIRM_MAX_INTERVAL, with a last one at the timeout
+    assert mock_get_candle_records.call_count == 6
+    assert clock[0] == 5.0
@@ -0,0 +1,64 @@
+from mock import patch
+
+import numpy as np
+import pandas
+import sys
+
+sys.path.append("src")
+from candle_store import to_candle_records
+import ema_cross_strategy
+import indicator_lib
+from screener import Screener, calc_ema_matrix, stack_candles
+
+def make_candles(num_candles, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 400 + np.cumsum(rng.normal(0, 1, num_candles))
+    open_price = np.concatenate(([close[0]], close[:-1]))
+    return pandas.DataFrame({
+        'time': np.arange(num_candles) * 60,
+        'open': open_price,
+        'high': np.maximum(open_price, close) + 0.25,
+        'low': np.minimum(open_price, close) - 0.25,
+        'close': close
+    })
+
+def test_ema_matrix_matches_ema_array_per_row():
+    close = np.stack([make_candles(40, seed)['close'].to_numpy() for seed in range(5)])
+    for ema_size in (1, 5, 39, 40):
+        ema_values = calc_ema_matrix(close, ema_size)
+        for row in range(len(close)):
+            assert np.allclose(ema_values[row], indicator_lib.calc_ema_array(close[row], ema_size), rtol=0, atol=1e-9)
+
+def test_stack_candles_leaves_out_short_histories():
+    candles = {"BCHUSD": to_candle_records(make_candles(10)), "ETHUSD": to_candle_records(make_candles(3))}
+    symbols, stacked = stack_candles(candles, 5)
+    assert symbols == ["BCHUSD"]
+    assert stacked.shape == (1, 5)
+    assert (stacked[0] == candles["BCHUSD"][-5:]).all()
+
+@patch('screener.mt5_lib.get_candle_records')
+def test_screen_matches_per_symbol_trade_events(mock_get_candle_records):
+    records = {f"SYM{seed}": to_candle_records(make_candles(200, seed)) for seed in range(10)}
+    position = [0]
+    mock_get_candle_records.side_effect = lambda symbol, timeframe, count: records[symbol][max(0, position[0] - count):position[0]]
+    screener = Screener(3, 10)
+    ema_cross_strategy.indicator_states.clear()
+    ema_cross_strategy.candle_buffers.clear()
+
+    num_signals = 0
+    # With a gap of several candles, after which both reseed
+    for position[0] in list(range(20, 100)) + list(range(105, 120)):
+        trade_events = screener.screen(list(records), "one_minute")
+        for symbol in records:
+            # The long-running path, advancing its EMAs from the first seed
+            with patch('ema_cross_strategy.mt5_lib.get_candle_records', side_effect=mock_get_candle_records.side_effect):
+                expected = ema_cross_strategy.get_trade_event(symbol, "one_minute", 3, 10)
+            assert (symbol in trade_events) == ema_cross_strategy.is_tradeable(expected)
+            if symbol in trade_events:
+                num_signals += 1
+                for name in ('time', 'ema_3', 'ema_10', 'stop_loss', 'stop_price', 'take_profit'):
+                    assert np.isclose(trade_events[symbol][name], expected[name])
+    assert num_signals > 0
+
+    # Without a new candle nothing is reported again
+    assert screener.screen(list(records), "one_minute") == {}
@@ -0,0 +1,61 @@
+import sys
+
+sys.path.append("src")
+import sim_mt5
+
+def make_broker():
+    broker = sim_mt5.SimulatedBroker(history_bars=100)
+    broker.add_symbol("BCHUSD")
+    return broker
+
+def test_copy_rates_skips_forming_bar_and_advances_with_clock():
+    broker = make_broker()
+    forming_bar = broker.get_candles("BCHUSD", sim_mt5.TIMEFRAME_M1)[-1]
+    closed = broker.get_candles("BCHUSD", sim_mt5.TIMEFRAME_M1)[:-1]
+
+    broker.advance(60)
+    newer = broker.get_candles("BCHUSD", sim_mt5.TIMEFRAME_M1)
+
+    assert closed['time'][-1] + 60 == forming_bar['time']
+    # Earlier candles don't change as more history is generated
+    assert (newer[:len(closed)] == closed).all()
+    assert newer['time'][-2] == forming_bar['time']
+
+def test_pending_order_book_and_retcodes():
+    broker = make_broker()
+    tick = broker.get_tick("BCHUSD")
+    request = {
+        "action": sim_mt5.TRADE_ACTION_PENDING, "symbol": "BCHUSD", "volume": 1.0,
+        "type": sim_mt5.ORDER_TYPE_BUY_STOP, "price": round(tick.ask + 1, 2),
+        "sl": round(tick.ask - 1, 2), "tp": round(tick.ask + 3, 2), "comment": "EMA"
+    }
+
+    assert broker.order_check(request).retcode == 0
+    result = broker.order_send(request)
+    assert result.retcode == sim_mt5.TRADE_RETCODE_DONE
+    assert list(broker.orders) == [result.order]
+
+    # Below the ask a BUY_STOP is rejected
+    assert broker.order_send({**request, "price": round(tick.bid - 1, 2)}).retcode == sim_mt5.TRADE_RETCODE_INVALID_PRICE
+    assert broker.order_send({**request, "volume": 0.005}).retcode == sim_mt5.TRADE_RETCODE_INVALID_VOLUME
+
+    remove = {"action": sim_mt5.TRADE_ACTION_REMOVE, "order": result.order}
+    assert broker.order_send(remove).retcode == sim_mt5.TRADE_RETCODE_DONE
+    assert broker.order_send(remove).retcode == sim_mt5.TRADE_RETCODE_INVALID_ORDER
+    assert len(broker.send_log) == 5
+    assert [symbol for _, symbol, _ in broker.send_log] == ["BCHUSD"] * 4 + [None]
+
+def test_stop_order_fills_when_a_bar_reaches_it():
+    broker = make_broker()
+    tick = broker.get_tick("BCHUSD")
+    result = broker.order_send({
+        "action": sim_mt5.TRADE_ACTION_PENDING, "symbol": "BCHUSD", "volume": 1.0,
+        "type": sim_mt5.ORDER_TYPE_SELL_STOP, "price": round(tick.bid - 0.05, 2), "sl": 0.0, "tp": 0.0
+    })
+
+    for _ in range(500):
+        if not broker.orders:
+            break
+        broker.advance(60)
+
+    assert result.order in broker.positions
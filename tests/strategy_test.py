@@ -0,0 +1,101 @@
+from mock import patch
+
+import numpy as np
+import pandas
+import pytest
+import sys
+
+sys.path.append("src")
+from candle_store import to_candle_records
+import ema_cross_strategy
+import indicator_lib
+from strategy import IndicatorCache, Strategy, create_strategy, get_symbol_intents, register_strategy, run_strategies, strategy_types
+
+def make_candles(num_candles, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 400 + np.cumsum(rng.normal(0, 1, num_candles))
+    open_price = np.concatenate(([close[0]], close[:-1]))
+    return pandas.DataFrame({
+        'time': np.arange(num_candles) * 60,
+        'open': open_price,
+        'high': np.maximum(open_price, close) + 0.25,
+        'low': np.minimum(open_price, close) - 0.25,
+        'close': close
+    })
+
+@patch('strategy.mt5_lib.get_candle_records')
+def test_strategies_share_one_fetch_and_one_computation_per_indicator(mock_get_candle_records):
+    records = to_candle_records(make_candles(80))
+    position = [30]
+    mock_get_candle_records.side_effect = lambda symbol, timeframe, count: records[max(0, position[0] - count):position[0]]
+    strategies = [
+        create_strategy({"name": "ema_cross", "short_term_ema_length": 3, "long_term_ema_length": 10, "comment": "fast"}, 10000, 0.03),
+        create_strategy({"name": "ema_cross", "short_term_ema_length": 5, "long_term_ema_length": 10, "comment": "slow"}, 10000, 0.03)
+    ]
+    indicator_cache = IndicatorCache()
+
+    with patch('strategy.indicator_lib.calc_ema_array', wraps=indicator_lib.calc_ema_array) as mock_calc_ema_array:
+        get_symbol_intents(strategies, "BCHUSD", "one_minute", indicator_cache)
+        # ema_3, ema_5 and ema_10 once each
+        assert mock_calc_ema_array.call_count == 3
+        assert mock_get_candle_records.call_count == 1
+
+        position[0] += 1
+        get_symbol_intents(strategies, "BCHUSD", "one_minute", indicator_cache)
+        # Advanced in place
+        assert mock_calc_ema_array.call_count == 3
+        assert mock_get_candle_records.call_count == 2
+
+    assert get_symbol_intents(strategies, "BCHUSD", "one_minute", indicator_cache) == []
+
+@patch('strategy.mt5_lib.get_candle_records')
+@patch('ema_cross_strategy.mt5_lib.get_candle_records')
+@patch('make_trade.trader.get_symbol_spec')
+def test_ema_cross_strategy_plugin_matches_the_direct_strategy(mock_get_symbol_spec, mock_strategy_records, mock_cache_records):
+    records = to_candle_records(make_candles(120, seed=8))
+    position = [20]
+    get_records = lambda symbol, timeframe, count: records[max(0, position[0] - count):position[0]]
+    mock_strategy_records.side_effect = get_records
+    mock_cache_records.side_effect = get_records
+    mock_get_symbol_spec.return_value = None
+    ema_cross_strategy.indicator_states.clear()
+    strategies = [create_strategy({"name": "ema_cross", "short_term_ema_length": 1, "long_term_ema_length": 2}, 10000, 0.03)]
+    indicator_cache = IndicatorCache()
+
+    traded = 0
+    while position[0] < 120:
+        position[0] += 1
+        trade_event = ema_cross_strategy.get_trade_event("BCHUSD", "one_minute", 1, 2)
+        expected = ema_cross_strategy.get_trade_intents("BCHUSD", trade_event, 10000, 0.03)
+        intents = get_symbol_intents(strategies, "BCHUSD", "one_minute", indicator_cache)
+        assert intents == expected
+        traded += len(intents) > 0
+    assert traded > 0
+
+@patch('strategy.mt5_lib.process_order_batch')
+@patch('strategy.get_symbol_intents')
+def test_run_strategies_sends_one_batch_and_reports_per_strategy(mock_get_symbol_intents, mock_process_order_batch):
+    strategies = [create_strategy({"name": "ema_cross", "short_term_ema_length": 1, "long_term_ema_length": 2}, 10000, 0.03)]
+    mock_get_symbol_intents.side_effect = lambda strategies, symbol, *args: [{"action": "place", "symbol": symbol, "comment": "EMA_Cross_strate"}]
+    mock_process_order_batch.side_effect = lambda intents: [{"intent": intent, "success": True, "orders": [7]} for intent in intents]
+
+    results = run_strategies(strategies, ["BCHUSD", "ETHUSD"], "one_minute", IndicatorCache(), 2)
+
+    assert results == {("BCHUSD", "EMA_Cross_strate"): 7, ("ETHUSD", "EMA_Cross_strate"): 7}
+    mock_process_order_batch.assert_called_once()
+
+def test_unknown_strategy_and_indicator_are_rejected():
+    with pytest.raises(ValueError):
+        create_strategy({"name": "rsi_bounce"}, 10000, 0.03)
+    with pytest.raises(ValueError):
+        IndicatorCache().update("BCHUSD", "one_minute", ["vwap_10"], 10)
+
+def test_strategy_without_on_bar_is_rejected_when_registered():
+    with pytest.raises(TypeError):
+        @register_strategy("no_on_bar")
+        class NoOnBarStrategy(Strategy):
+            pass
+    assert "no_on_bar" not in strategy_types
+
+    with pytest.raises(TypeError):
+        Strategy(10000, 0.03)
@@ -0,0 +1,110 @@
+from mock import patch
+
+import json
+import queue
+import sys
+import time
+
+sys.path.append("src")
+import instrumentation
+from supervisor import Supervisor, assign_shards, build_worker_settings, run_worker
+
+def crashing_worker(name, json_settings, credentials, messages):
+    messages.put(("health", name, "running"))
+    raise SystemExit(1)
+
+def reporting_worker(name, json_settings, credentials, messages):
+    messages.put(("results", name, {symbol: 7 for symbol in json_settings["mt5"]["symbols"]}))
+    messages.put(("metrics", name, {("order_send", json_settings["mt5"]["symbols"][0]): [[1] + [0] * len(instrumentation.BUCKETS), 0.5, 1]}))
+    messages.put(("health", name, "running"))
+    time.sleep(60)
+
+def make_settings(tmp_path):
+    credentials_path = tmp_path / "credentials.json"
+    credentials_path.write_text(json.dumps({"mt5": {"login": 1}}))
+    accounts = [
+        {"name": "first", "credentials": str(credentials_path)},
+        {"name": "second", "credentials": str(credentials_path), "symbols": ["EURUSD"], "settings": {"timeframe": "five_minutes"}}
+    ]
+    json_settings = {"mt5": {"symbols": ["BCHUSD", "ETHUSD", "EURUSD"], "timeframe": "one_minute", "metrics_file": "metrics.prom"}}
+    return accounts, json_settings
+
+def wait_for(supervisor_under_test, condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        supervisor_under_test.poll(0.1)
+    assert condition()
+
+def test_shards_and_worker_settings(tmp_path):
+    accounts, json_settings = make_settings(tmp_path)
+    shards = assign_shards(accounts, json_settings["mt5"]["symbols"])
+    assert shards == {"first": ["BCHUSD", "ETHUSD"], "second": ["EURUSD"]}
+
+    worker_settings = build_worker_settings(json_settings, accounts[1], shards["second"], True)
+    assert worker_settings["mt5"]["symbols"] == ["EURUSD"]
+    assert worker_settings["mt5"]["timeframe"] == "five_minutes"
+    assert worker_settings["mt5"]["metrics_enabled"] is True
+    assert "metrics_file" not in worker_settings["mt5"]
+    # The shared settings are left as they were
+    assert json_settings["mt5"]["timeframe"] == "one_minute"
+
+@patch('supervisor.RESTART_DELAY', 0.0)
+def test_crashed_worker_is_restarted(tmp_path):
+    accounts, json_settings = make_settings(tmp_path)
+    workers = Supervisor(accounts[:1], json_settings, target=crashing_worker)
+    workers.start_worker(workers.workers["first"])
+    try:
+        wait_for(workers, lambda: workers.workers["first"].crashes >= 2)
+        assert workers.get_health()["first"]["crashes"] >= 2
+    finally:
+        workers.stop()
+
+@patch('supervisor.RESTART_DELAY', 0.0)
+@patch('supervisor.bot.report_result')
+@patch('supervisor.instrumentation.write_metrics')
+def test_silent_worker_is_restarted(mock_write_metrics, mock_report_result, tmp_path):
+    accounts, json_settings = make_settings(tmp_path)
+    workers = Supervisor(accounts[:1], json_settings, heartbeat_timeout=0.5, target=reporting_worker)
+    workers.start_worker(workers.workers["first"])
+    try:
+        first_pid = workers.workers["first"].process.pid
+        wait_for(workers, lambda: workers.workers["first"].process.pid != first_pid)
+        assert workers.workers["first"].crashes == 1
+    finally:
+        workers.stop()
+
+@patch('supervisor.bot.report_result')
+@patch('supervisor.instrumentation.write_metrics')
+def test_results_and_metrics_are_aggregated(mock_write_metrics, mock_report_result, tmp_path):
+    accounts, json_settings = make_settings(tmp_path)
+    instrumentation.reset()
+    workers = Supervisor(accounts, json_settings, target=reporting_worker)
+    for worker in workers.workers.values():
+        workers.start_worker(worker)
+    try:
+        wait_for(workers, lambda: all(health["status"] == "running" for health in workers.get_health().values()))
+        reported = sorted(call.args for call in mock_report_result.call_args_list)
+        assert reported == [("first: BCHUSD", 7), ("first: ETHUSD", 7), ("second: EURUSD", 7)]
+        assert instrumentation.histograms[("order_send", "BCHUSD")][2] == 1
+        assert instrumentation.histograms[("order_send", "EURUSD")][2] == 1
+        mock_write_metrics.assert_called_with("metrics.prom")
+    finally:
+        workers.stop()
+        instrumentation.reset()
+
+@patch('supervisor.mt5_lib.mt5')
+@patch('supervisor.bot.run_bot')
+def test_worker_reports_health_while_no_bar_closes(mock_run_bot, mock_mt5):
+    # A closed market: the bot wakes up on every bar close, but no bar closes and no results come
+    def run_bot(json_settings, credentials, on_results, on_heartbeat):
+        for _ in range(3):
+            on_heartbeat()
+    mock_run_bot.side_effect = run_bot
+    mock_mt5.ensure_connected.return_value = True
+    messages = queue.Queue()
+
+    run_worker("first", {"mt5": {}}, {}, messages)
+
+    health = [messages.get_nowait() for _ in range(messages.qsize())]
+    # Heartbeats within HEARTBEAT_INTERVAL of each other are sent once
+    assert health == [("health", "first", "connecting"), ("health", "first", "running")]
@@ -0,0 +1,118 @@
+from mock import patch
+
+import numpy as np
+import pytest
+import sys
+
+sys.path.append("src")
+import ema_cross_strategy
+import mt5_lib
+import sim_mt5
+from tick_stream import TickBarBuilder, TickStream
+
+@pytest.fixture
+def broker():
+    # Minute-aligned, so the simulated ticks fall on the bars of the candles
+    broker = sim_mt5.configure(start_time=1_699_999_980, history_bars=200)
+    broker.add_symbol("BCHUSD")
+    sim_mt5.initialize()
+    previous_terminal = mt5_lib.set_terminal(sim_mt5)
+    mt5_lib.order_book.invalidate()
+    ema_cross_strategy.indicator_states.clear()
+    yield broker
+    mt5_lib.set_terminal(previous_terminal)
+    mt5_lib.order_book.invalidate()
+    ema_cross_strategy.indicator_states.clear()
+
+def test_bars_match_however_the_ticks_are_batched():
+    rng = np.random.default_rng(5)
+    tick_times = np.sort(rng.integers(0, 600, 500))
+    prices = 400 + np.cumsum(rng.normal(0, 1, 500))
+
+    whole = TickBarBuilder("one_minute")
+    batched = TickBarBuilder("one_minute")
+    closed = whole.add_ticks(tick_times, prices)
+    for start in range(0, 500, 7):
+        batched.add_ticks(tick_times[start:start + 7], prices[start:start + 7])
+
+    assert len(closed) == 9
+    assert (batched.closed.get_records(10) == whole.closed.get_records(10)).all()
+    assert batched.forming == whole.forming
+
+    first_bar = tick_times < 60
+    assert closed[0]['open'] == prices[0]
+    assert closed[0]['close'] == prices[first_bar][-1]
+    assert closed[0]['high'] == prices[first_bar].max()
+    assert closed[0]['low'] == prices[first_bar].min()
+    assert closed[0]['tick_volume'] == first_bar.sum()
+
+    # The last bar closes once the clock passes its end
+    assert whole.close_until(599) == []
+    assert whole.close_until(600)[0]['time'] == 540
+    assert whole.forming is None
+
+    with pytest.raises(ValueError):
+        TickBarBuilder("one_month")
+
+def test_late_ticks_of_a_closed_bar_are_dropped():
+    builder = TickBarBuilder("one_minute")
+    builder.add_ticks(np.array([60, 70]), np.array([1.0, 2.0]))
+    # Closed early by the clock of another symbol, before its last tick came in
+    assert builder.close_until(121)[0]['time'] == 60
+
+    assert builder.add_ticks(np.array([119, 125]), np.array([3.0, 4.0])) == []
+    builder.close_until(200)
+
+    closed = builder.closed.get_records(10)
+    assert closed['time'].tolist() == [60, 120]
+    assert closed['high'].tolist() == [2.0, 4.0]
+
+def test_closing_bars_match_closed_bar_strategy(broker):
+    stream = TickStream(["BCHUSD"], "one_minute", 3, 10, 10000, 0.03, adjust_interval=0)
+    stream.seed()
+    ema_cross_strategy.get_trade_event("BCHUSD", "one_minute", 3, 10)
+
+    closing_events = []
+    close_bar = stream.close_bar
+    def record_close_bar(symbol, bar):
+        closing_events.append(close_bar(symbol, bar))
+        return closing_events[-1]
+
+    with patch.object(stream, 'close_bar', side_effect=record_close_bar), \
+            patch('tick_stream.mt5_lib.process_order_batch', wraps=mt5_lib.process_order_batch) as mock_batch:
+        num_bars = 0
+        for _ in range(600):
+            broker.advance(15)
+            stream.poll()
+            if not closing_events:
+                continue
+
+            num_bars += 1
+            trade_event = closing_events.pop()
+            expected = ema_cross_strategy.get_trade_event("BCHUSD", "one_minute", 3, 10)
+            for name in ('time', 'ema_3', 'ema_10', 'ema_cross', 'stop_loss', 'stop_price', 'take_profit'):
+                assert np.isclose(float(trade_event[name]), float(expected[name]))
+
+    actions = {intent["action"] for call in mock_batch.call_args_list for intent in call.args[0]}
+    assert num_bars == 150
+    # Orders were placed as crosses showed and replaced as their bars moved their levels
+    assert {"place", "cancel"} <= actions
+
+def test_modify_intent_moves_the_pending_order(broker):
+    price = float(broker.get_candles("BCHUSD", sim_mt5.TIMEFRAME_M1)['close'][-1])
+    intent = {
+        "action": "place", "order_type": "BUY_STOP", "symbol": "BCHUSD", "volume": 0.1, "comment": "EMA_Cross_strate",
+        "stop_loss": round(price - 20, 2), "stop_price": round(price + 10, 2), "take_profit": round(price + 40, 2)
+    }
+    ticket = mt5_lib.process_order_batch([intent])[0]["orders"][0]
+    placed = [order for order in sim_mt5.orders_get() if order.ticket == ticket][0]
+
+    modify = dict(intent, action="modify", ticket=ticket, stop_loss=round(price - 15, 2), take_profit=round(price + 50, 2))
+    order_result = mt5_lib.process_order_batch([modify])[0]
+
+    assert order_result["success"]
+    assert order_result["orders"] == [ticket]
+    order = [order for order in sim_mt5.orders_get() if order.ticket == ticket][0]
+    # Priced the way it was placed, e.g. with the same take profit padding
+    assert (order.sl, order.tp, order.price_open) == (round(price - 15, 2), round(placed.tp + 10, 2), placed.price_open)
+    assert mt5_lib.order_book.orders[ticket]["sl"] == round(price - 15, 2)